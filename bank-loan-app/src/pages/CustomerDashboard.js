@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import axios from 'axios';
 import Layout from '../components/Layout/layout';
 
@@ -13,18 +13,56 @@ function CustomerDashboard({ token }) {
   const [errorMessage, setErrorMessage] = useState('');
   const [payments, setPayments] = useState([]);
   const [showPayments, setShowPayments] = useState(false); // New state for toggling payment view
+  // Cursors of the next page of each list, null once it is fully loaded
+  const [requestsCursor, setRequestsCursor] = useState(null);
+  const [loansCursor, setLoansCursor] = useState(null);
+
+  // Both lists come a page at a time from the same endpoint, each with its own cursor
+  const fetchLoanPage = useCallback(
+    (params) =>
+      axios.get('http://localhost:8000/api/loan-requests/', {
+        params,
+        headers: {
+          Authorization: `Bearer ${token}`,
+          'Content-Type': 'application/json',
+        },
+      }),
+    [token]
+  );
+
+  const loadMoreRequests = async () => {
+    try {
+      const response = await fetchLoanPage({ requests_cursor: requestsCursor });
+      // A request submitted here is already shown and may come back in a later page
+      setLoanRequests((requests) => {
+        const shown = new Set(requests.map((request) => request.application_id));
+        return requests.concat(response.data.loanRequests.filter((request) => !shown.has(request.application_id)));
+      });
+      setRequestsCursor(response.data.nextRequestsCursor);
+    } catch (error) {
+      console.error('Failed to fetch loan requests:', error);
+    }
+  };
+
+  const loadMoreLoans = async () => {
+    try {
+      const response = await fetchLoanPage({ loans_cursor: loansCursor });
+      setApprovedLoans((loans) => loans.concat(response.data.loans));
+      setLoansCursor(response.data.nextLoansCursor);
+    } catch (error) {
+      console.error('Failed to fetch loans:', error);
+    }
+  };
 
   useEffect(() => {
+    // Only the first page of each list; the rest is loaded on demand
     const fetchLoanData = async () => {
       try {
-        const response = await axios.get('http://localhost:8000/api/loan-requests/', {
-          headers: {
-            Authorization: `Bearer ${token}`,
-            'Content-Type': 'application/json',
-          },
-        });
+        const response = await fetchLoanPage({});
         setLoanRequests(response.data.loanRequests);
+        setRequestsCursor(response.data.nextRequestsCursor);
         setApprovedLoans(response.data.loans);
+        setLoansCursor(response.data.nextLoansCursor);
       } catch (error) {
         console.error('Failed to fetch loan data:', error);
       }
@@ -48,7 +86,7 @@ function CustomerDashboard({ token }) {
       fetchLoanData();
       fetchPayments(); // Fetch payments data
     }
-  }, [token]);
+  }, [token, fetchLoanPage]);
 
   const handleLoanRequestSubmit = async (event) => {
     event.preventDefault();
@@ -149,6 +187,9 @@ function CustomerDashboard({ token }) {
         ) : (
           <p>You have no loan requests.</p>
         )}
+        {requestsCursor !== null && (
+          <button onClick={loadMoreRequests}>Load More Requests</button>
+        )}
 
         {/* Display Approved Loans and Payment Form */}
         <h3>Your Approved Loans</h3>
@@ -167,6 +208,9 @@ function CustomerDashboard({ token }) {
                 </li>
               ))}
             </ul>
+            {loansCursor !== null && (
+              <button onClick={loadMoreLoans}>Load More Loans</button>
+            )}
 
             {selectedLoanId && (
               <div>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import axios from 'axios';
 import Layout from '../components/Layout/layout';
 
@@ -14,24 +14,29 @@ function EmployeeDashboard({ token }) {
     max_payment: ''
   });
   const [successMessage, setSuccessMessage] = useState('');
+  // Cursor of the next page of pending requests, null once they are all loaded
+  const [nextCursor, setNextCursor] = useState(null);
 
-  useEffect(() => {
-    const fetchLoanRequests = async () => {
-      try {
-        const response = await axios.get('http://localhost:8000/api/loan-approves/', {
-          headers: { Authorization: `Bearer ${token}` }
-        });
-        setLoanRequests(response.data);
-      } catch (err) {
-        setError('Failed to fetch loan requests.');
-        console.error('Fetch error:', err.response ? err.response.data : err);
-      }
-    };
+  // The pending requests come a page at a time; more are loaded on demand
+  const fetchLoanRequests = useCallback(async (cursor) => {
+    try {
+      const response = await axios.get('http://localhost:8000/api/loan-approves/', {
+        params: cursor === undefined ? {} : { cursor },
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setLoanRequests((requests) => (cursor === undefined ? response.data.requests : requests.concat(response.data.requests)));
+      setNextCursor(response.data.nextCursor);
+    } catch (err) {
+      setError('Failed to fetch loan requests.');
+      console.error('Fetch error:', err.response ? err.response.data : err);
+    }
+  }, [token]);
 
+  useEffect(() => {
     if (token) {
       fetchLoanRequests();
     }
-  }, [token]);
+  }, [token, fetchLoanRequests]);
 
   const handleInputChange = (e) => {
     const { name, value } = e.target;
@@ -122,6 +127,9 @@ function EmployeeDashboard({ token }) {
       ) : (
         <p>No loan requests found.</p>
       )}
+      {nextCursor !== null && (
+        <button onClick={() => fetchLoanRequests(nextCursor)}>Load More Requests</button>
+      )}
 
       {formData.agreement_id && (
         <div>
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loans.middleware.RequestProfilingMiddleware',
+    'loans.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,11 +85,136 @@ WSGI_APPLICATION = 'bank_loan_management.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Chosen with DB_PROFILE:
+#   sqlite          SQLite tuned for concurrent requests (default)
+#   sqlite-default  SQLite with its stock journaling, for comparison
+#   postgresql      PostgreSQL through a psycopg connection pool (needs psycopg[pool])
+# See benchmark_concurrent_writes for comparing them.
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'bank_loan_management'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # The pool keeps connections open, so persistent connections must stay off
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '20')),
+                    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            },
+        }
+    }
+elif DB_PROFILE in ('sqlite', 'sqlite-default'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+    if DB_PROFILE == 'sqlite':
+        DATABASES['default'].update({
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'OPTIONS': {
+                # WAL lets readers carry on while a write commits; with WAL,
+                # synchronous=NORMAL only risks the latest commits on power loss.
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+                # Seconds a connection waits for the write lock before failing
+                'timeout': float(os.environ.get('DB_BUSY_TIMEOUT', '20')),
+                # Take the write lock at BEGIN. A deferred transaction that reads
+                # first fails at once when it cannot upgrade to a write lock,
+                # instead of waiting for the busy timeout.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        })
+else:
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE '{DB_PROFILE}'")
+
+# Read replicas, see loans/routing.py. DB_REPLICAS is a comma-separated list of
+# replica hosts for PostgreSQL or replica files for SQLite. The dashboard GETs
+# read from them; a user who wrote reads from the primary for
+# REPLICA_STICKY_SECONDS afterwards. The pins live in the cache, so replicas
+# require a shared one, see CACHE_URL below.
+
+DATABASE_REPLICAS = []
+for number, location in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST' if DB_PROFILE == 'postgresql' else 'NAME': location.strip(),
+        # Tests run against the primary's test database
+        'TEST': {'MIRROR': 'default'},
     }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['loans.routing.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
+
+
+# Cache. Token revocations (loans/authentication.py), replica pins
+# (loans/middleware.py), the 'cache' throttle store and the portfolio
+# summaries only work across worker processes when every process shares the
+# cache, so CACHE_URL points at Redis (redis:// or rediss://) or memcached
+# (memcached://host:port). Without it each process has its own memory cache,
+# which is only right for a single process; `check --deploy` reports it.
+
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL.removeprefix('memcached://'),
+        }
+    }
+elif CACHE_URL:
+    raise ImproperlyConfigured(f"Unsupported CACHE_URL '{CACHE_URL}'")
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+# Request throttling, see loans/throttling.py. THROTTLE_BACKEND is 'local'
+# (per process, so every worker process allows the full rate), 'cache' (the
+# default cache, shared between processes once CACHE_URL is set) or the
+# dotted path of a bucket store. THROTTLE_RATES may override entries of
+# loans.throttling.DEFAULT_RATES.
+#
+# Anonymous requests are limited per client IP. NUM_PROXIES is the number of
+# reverse proxies in front of the app: 0 uses the connection's address and
+# ignores X-Forwarded-For, which clients can set to anything; with N proxies
+# the address the outermost one appended is used.
+
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', 'true').lower() == 'true'
+THROTTLE_BACKEND = os.environ.get('THROTTLE_BACKEND', 'local')
+
+REST_FRAMEWORK = {
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
+}
+
+
+# Request profiling, see loans/middleware.py. Metrics are served at /api/metrics
+# to requests bearing METRICS_TOKEN, and to nobody while it is unset. SLOW_REQUEST_THRESHOLD_MS
+# logs slower requests with their SQL to the loans.slow_requests logger.
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ['SLOW_REQUEST_THRESHOLD_MS']) if os.environ.get('SLOW_REQUEST_THRESHOLD_MS') else None
+
+
+# Background jobs, see loans/jobs.py: the number of threads each runworkers
+# process runs the jobs of a queue on.
+
+JOB_QUEUES = {
+    'default': 4,
+    'recalculations': 2,
 }
 
 
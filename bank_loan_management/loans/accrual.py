@@ -0,0 +1,123 @@
+"""
+Daily interest accrual.
+
+Interest is flat, as everywhere else in the app: a loan of P at rate r earns
+P * r in total. That interest accrues in equal daily parts from the approval
+date to the repayment deadline, so as of day d a loan has accrued
+
+    floor(P * r * min(d - approval_date, term) / term)
+
+cents, with term the days from approval to deadline. Accrual stops when the
+loan is fully paid. The amount depends only on the day, so missed days are
+caught up by the next run.
+
+Open agreements are read in primary key order one chunk at a time, the chunk
+is computed with NumPy in one pass, and its InterestAccrual snapshots are
+inserted with bulk_create and copied to accrued_interest/accrued_through of
+its agreements by one UPDATE, in one transaction. The UPDATE sends no
+signals, so the chunk drops the cached portfolio summaries of its lenders
+itself. Agreements already accrued through the day are skipped, so a run
+that stops half way can simply be started again.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+
+from . import portfolio
+from .amortization import _cents
+from .models import InterestAccrual, LoanAgreement
+
+ACCRUAL_CHUNK_SIZE = 5000
+
+ACCRUAL_FIELDS = (
+    'agreement_id',
+    'agreement_id__loan_amount',
+    'interest_rate',
+    'approval_date',
+    'repayment_deadline',
+    'accrued_interest',
+    'lender_id',
+)
+
+
+def _amount(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+@dataclass
+class AccrualResult:
+    agreements: int = 0
+    interest: Decimal = Decimal('0.00')
+
+
+def compute_accrued(principal, rates, approval_dates, deadlines, as_of):
+    """
+    Interest accrued as of `as_of` in cents, for arrays of loans.
+
+    `principal` is an int64 array of cents, `rates` a float array and the
+    dates datetime64[D] arrays.
+    """
+    interest_total = np.rint(principal * rates).astype(np.int64)
+    term = np.maximum((deadlines - approval_dates).astype(np.int64), 1)
+    elapsed = np.clip((np.datetime64(as_of, 'D') - approval_dates).astype(np.int64), 0, term)
+    return interest_total * elapsed // term
+
+
+def accrue_chunk(rows, as_of):
+    """
+    Accrue a chunk of ACCRUAL_FIELDS tuples as of `as_of` and save it.
+    Returns the interest added in cents.
+    """
+    agreement_ids, loan_amounts, rates, approval_dates, deadlines, previous, lender_ids = zip(*rows)
+    accrued = compute_accrued(
+        principal=_cents(loan_amounts),
+        rates=np.array([float(rate) for rate in rates], dtype=np.float64),
+        approval_dates=np.array(approval_dates, dtype='datetime64[D]'),
+        deadlines=np.array(deadlines, dtype='datetime64[D]'),
+        as_of=as_of,
+    )
+    added = accrued - _cents(previous)
+    accrued = [_amount(cents) for cents in accrued]
+
+    with transaction.atomic():
+        InterestAccrual.objects.bulk_create(
+            [
+                InterestAccrual(loan_id=agreement_id, accrual_date=as_of, accrued_interest=total, interest=_amount(cents))
+                for agreement_id, total, cents in zip(agreement_ids, accrued, added)
+            ],
+            ignore_conflicts=True,
+        )
+        # The agreements take their totals from the snapshots in one UPDATE;
+        # bulk_update() would build a CASE expression per row in Python.
+        snapshot = InterestAccrual.objects.filter(loan=OuterRef('pk'), accrual_date=as_of)
+        LoanAgreement.objects.filter(agreement_id__gte=agreement_ids[0], agreement_id__lte=agreement_ids[-1]).filter(
+            Exists(snapshot), Q(accrued_through__isnull=True) | Q(accrued_through__lt=as_of)
+        ).update(accrued_interest=Subquery(snapshot.values('accrued_interest')), accrued_through=as_of)
+        portfolio.invalidate(*set(lender_ids))
+    return int(added.sum())
+
+
+def accrue(as_of, chunk_size=ACCRUAL_CHUNK_SIZE):
+    """Accrue every open agreement approved by `as_of` that has not been accrued through it yet."""
+    queryset = (
+        LoanAgreement.objects
+        .filter(Q(accrued_through__isnull=True) | Q(accrued_through__lt=as_of), fully_paid=False, approval_date__lte=as_of)
+        .order_by('agreement_id')
+        .values_list(*ACCRUAL_FIELDS)
+    )
+    result = AccrualResult()
+    added = 0
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(agreement_id__gt=last)
+        rows = list(page[:chunk_size])
+        if not rows:
+            break
+        added += accrue_chunk(rows, as_of)
+        result.agreements += len(rows)
+        last = rows[-1][0]
+    result.interest = _amount(added)
+    return result
@@ -5,10 +5,16 @@ from django.contrib import admin
 
 # Register your models here.
 
-from .models import User, FundingAccount, LoanAgreement, LoanPayment, LoanApplication
+from .models import User, FundingAccount, LoanAgreement, LoanPayment, LoanApplication, IdempotencyKey, ArchivedLoanAgreement, ArchivedLoanPayment, Job, InterestAccrual, CreditScore
 
 admin.site.register(User)
 admin.site.register(FundingAccount)
 admin.site.register(LoanAgreement)
 admin.site.register(LoanPayment)
-admin.site.register(LoanApplication)
\ No newline at end of file
+admin.site.register(LoanApplication)
+admin.site.register(IdempotencyKey)
+admin.site.register(ArchivedLoanAgreement)
+admin.site.register(ArchivedLoanPayment)
+admin.site.register(Job)
+admin.site.register(InterestAccrual)
+admin.site.register(CreditScore)
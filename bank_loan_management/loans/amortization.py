@@ -0,0 +1,186 @@
+"""
+Repayment schedules for loan agreements.
+
+Interest is flat, as everywhere else in the app: a loan of P at rate r costs
+P * (1 + r) in total. The total is split into monthly installments from the
+approval date until the repayment deadline, kept within the agreement's
+min_payment/max_payment, and every installment is divided into principal and
+interest in proportion to the total.
+
+All arithmetic is done on NumPy integer arrays of cents with one row per
+agreement, so a whole portfolio is scheduled without a Python loop per loan
+and the amounts add up exactly. The arrays are as wide as the longest
+schedule in them, so the loans of a chunk are scheduled in groups of similar
+installment counts, and one loan with a tiny max_payment only widens its own
+group.
+"""
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from . import rendering
+from .models import LoanAgreement
+
+SCHEDULE_CHUNK_SIZE = 5000
+
+SCHEDULE_FIELDS = (
+    'agreement_id',
+    'agreement_id__loan_amount',
+    'interest_rate',
+    'min_payment',
+    'max_payment',
+    'approval_date',
+    'repayment_deadline',
+)
+
+
+def _cents(values):
+    return np.array([int(Decimal(value) * 100) for value in values], dtype=np.int64)
+
+
+def _months_between(start, end):
+    start_month = start.astype('datetime64[M]')
+    end_month = end.astype('datetime64[M]')
+    return (end_month - start_month).astype(np.int64)
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+def _installments(principal, rates, min_payment, max_payment, approval_dates, deadlines):
+    # The total due, regular installment and number of installments of each loan
+    total_due = np.rint(principal * (1 + rates)).astype(np.int64)
+    periods = np.maximum(_months_between(approval_dates, deadlines), 1)
+    installment = np.clip(_ceil_div(total_due, periods), np.maximum(min_payment, 1), np.maximum(max_payment, 1))
+    count = np.maximum(_ceil_div(total_due, installment), 1)
+    return total_due, installment, count
+
+
+def compute_schedules(principal, rates, min_payment, max_payment, approval_dates, deadlines):
+    """
+    Compute the schedules of many loans at once.
+
+    `principal`, `min_payment` and `max_payment` are int64 arrays of cents,
+    `rates` a float array and the dates datetime64[D] arrays, one element per
+    loan. Returns a dict of 2D arrays with one row per loan and one column per
+    installment (`payment`, `principal`, `interest`, `remaining_principal` in
+    cents, `due_date` as datetime64[D]) plus `count`, the number of
+    installments of each loan. Columns past a loan's count are zero.
+    """
+    total_due, installment, count = _installments(principal, rates, min_payment, max_payment, approval_dates, deadlines)
+    interest_total = total_due - principal
+    width = int(count.max()) if len(count) else 0
+
+    number = np.arange(width)[np.newaxis, :]
+    count_col = count[:, np.newaxis]
+    last = (total_due - installment * (count - 1))[:, np.newaxis]
+    payment = np.where(number < count_col - 1, installment[:, np.newaxis], np.where(number == count_col - 1, last, 0))
+
+    # Interest paid so far is the same share of the payments made so far as
+    # the total interest is of the total due; differencing gives each
+    # installment's portion without rounding drift.
+    paid = np.cumsum(payment, axis=1)
+    safe_total = np.maximum(total_due, 1)[:, np.newaxis]
+    interest_paid = paid * interest_total[:, np.newaxis] // safe_total
+    interest = np.diff(interest_paid, axis=1, prepend=0)
+    principal_part = payment - interest
+    remaining = principal[:, np.newaxis] - np.cumsum(principal_part, axis=1)
+
+    # Installments fall due monthly on the approval day, clamped to the month end
+    first_month = approval_dates.astype('datetime64[M]')[:, np.newaxis] + number + 1
+    month_length = ((first_month + 1).astype('datetime64[D]') - first_month.astype('datetime64[D]')).astype(np.int64)
+    day = (approval_dates - approval_dates.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64)
+    due_date = first_month.astype('datetime64[D]') + np.minimum(day[:, np.newaxis], month_length - 1)
+
+    return {
+        'count': count,
+        'payment': payment,
+        'principal': principal_part,
+        'interest': interest,
+        'remaining_principal': np.where(number < count_col, remaining, 0),
+        'due_date': due_date,
+    }
+
+
+def _format_cents(cents):
+    return f'{Decimal(int(cents)) / 100:.2f}'
+
+
+def _schedule_rows(rows):
+    arrays = {
+        'principal': _cents(row['agreement_id__loan_amount'] for row in rows),
+        'rates': np.array([float(row['interest_rate']) for row in rows], dtype=np.float64),
+        'min_payment': _cents(row['min_payment'] for row in rows),
+        'max_payment': _cents(row['max_payment'] for row in rows),
+        'approval_dates': np.array([row['approval_date'] for row in rows], dtype='datetime64[D]'),
+        'deadlines': np.array([row['repayment_deadline'] for row in rows], dtype='datetime64[D]'),
+    }
+    # Loans whose counts share a power of two are computed together, so no
+    # group pads its rows to more than twice their own length
+    _, _, count = _installments(**arrays)
+    groups = np.frexp(count.astype(np.float64))[1]
+    schedules = [None] * len(rows)
+    for group in np.unique(groups):
+        indices = np.flatnonzero(groups == group)
+        result = compute_schedules(**{name: values[indices] for name, values in arrays.items()})
+        for position, index in enumerate(indices):
+            schedules[index] = {
+                'agreement_id': rows[index]['agreement_id'],
+                'installments': [
+                    {
+                        'number': number + 1,
+                        'due_date': date.fromisoformat(str(result['due_date'][position, number])),
+                        'payment': _format_cents(result['payment'][position, number]),
+                        'principal': _format_cents(result['principal'][position, number]),
+                        'interest': _format_cents(result['interest'][position, number]),
+                        'remaining_principal': _format_cents(result['remaining_principal'][position, number]),
+                    }
+                    for number in range(int(result['count'][position]))
+                ],
+            }
+    return schedules
+
+
+def build_schedules(agreements, chunk_size=SCHEDULE_CHUNK_SIZE):
+    """
+    Yield the schedule of every agreement in the queryset, in agreement order.
+
+    Agreements are read with .values() and scheduled `chunk_size` at a time,
+    so memory stays bounded for portfolios of any size.
+    """
+    rows = []
+    for row in agreements.order_by('agreement_id').values(*SCHEDULE_FIELDS).iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield from _schedule_rows(rows)
+            rows = []
+    if rows:
+        yield from _schedule_rows(rows)
+
+
+def stream_schedules(agreements, **fields):
+    """
+    Yield `fields` and the schedules of `agreements` under 'loans' as one JSON
+    object, encoded like JSONRenderer would, one chunk of agreements at a time.
+    """
+    # 'loans' is the last key, so the placeholder splits the object around the list
+    head, tail = rendering.dumps({**fields, 'loans': rendering.RawJSON('[]')}).rsplit('[]', 1)
+    yield (head + '[').encode()
+    separator = b''
+    block = []
+    for schedule in build_schedules(agreements):
+        block.append(rendering.render(schedule))
+        if len(block) == SCHEDULE_CHUNK_SIZE:
+            yield separator + rendering.ITEM_SEPARATOR.encode().join(block)
+            separator = rendering.ITEM_SEPARATOR.encode()
+            block = []
+    if block:
+        yield separator + rendering.ITEM_SEPARATOR.encode().join(block)
+    yield (']' + tail).encode()
+
+
+def build_schedule(agreement_id):
+    """Return the schedule of a single agreement, or None if it does not exist."""
+    return next(build_schedules(LoanAgreement.objects.filter(agreement_id=agreement_id)), None)
@@ -0,0 +1,163 @@
+"""
+Archive tier for fully paid loans.
+
+Agreements that are fully paid and have seen no payment for ARCHIVE_AFTER_DAYS
+are moved, with their application and payments, into ArchivedLoanAgreement and
+ArchivedLoanPayment. The live tables then only hold loans that can still
+change, so the queries of the views stop scanning closed history.
+
+Loans are moved one chunk per transaction, selected by keyset like the
+delinquency scan, so a run never holds the write lock for long. Inside the
+transaction the chunk is selected again under row locks, and only loans that
+still qualify are moved.
+
+The live rows are deleted with raw deletes, see raw_delete(): going through
+the ORM's delete() would fetch every row to send post_delete signals, which
+only invalidate the portfolio cache. The cache is invalidated here instead.
+Tables without signals or dependent rows, like the accruals, use delete(),
+which then issues the same single DELETE.
+
+history() reads through both tiers for a single loan.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from . import portfolio
+from .models import ArchivedLoanAgreement, ArchivedLoanPayment, InterestAccrual, LoanAgreement, LoanApplication, LoanPayment
+
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_CHUNK_SIZE = 500
+
+AGREEMENT_FIELDS = (
+    'agreement_id',
+    'lender_id',
+    'approval_date',
+    'repayment_deadline',
+    'interest_rate',
+    'payment_due_date',
+    'min_payment',
+    'max_payment',
+    'total_paid',
+    'delinquent',
+    'delinquent_since',
+)
+APPLICATION_FIELDS = {
+    'borrower_id': F('agreement_id__borrower_id'),
+    'application_date': F('agreement_id__application_date'),
+    'loan_amount': F('agreement_id__loan_amount'),
+    'terms_conditions': F('agreement_id__terms_conditions'),
+}
+PAYMENT_FIELDS = ('payment_id', 'loan_id', 'payment_amount', 'payment_date')
+
+
+@dataclass
+class ArchiveResult:
+    agreements: int = 0
+    payments: int = 0
+
+
+@dataclass
+class LoanHistory:
+    archived: bool
+    lender_id: int
+    borrower_id: int
+    agreement: object
+    payments: object
+
+
+def archivable(before):
+    """Fully paid agreements approved before `before` with no payment on or after it."""
+    recent_payments = LoanPayment.objects.filter(loan=OuterRef('pk'), payment_date__gte=before)
+    return LoanAgreement.objects.filter(fully_paid=True, approval_date__lt=before).filter(~Exists(recent_payments))
+
+
+def raw_delete(queryset):
+    """
+    Delete the rows of `queryset` with one DELETE, without fetching them,
+    collecting cascades or sending signals. Returns the number of rows deleted.
+
+    The caller deletes dependent rows first and does what the signals would.
+    QuerySet._raw_delete() is private; this is the only caller, checked
+    against Django 5.2 by ArchiveTests.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
+def _archive_chunk(ids, before):
+    with transaction.atomic():
+        rows = list(
+            archivable(before)
+            .filter(agreement_id__in=ids)
+            .select_for_update(of=('self',))
+            .values(*AGREEMENT_FIELDS, **APPLICATION_FIELDS)
+        )
+        if not rows:
+            return ArchiveResult()
+        ids = [row['agreement_id'] for row in rows]
+        ArchivedLoanAgreement.objects.bulk_create(ArchivedLoanAgreement(**row) for row in rows)
+
+        payments = LoanPayment.objects.filter(loan_id__in=ids)
+        archived_payments = ArchivedLoanPayment.objects.bulk_create(
+            (ArchivedLoanPayment(**row) for row in payments.values(*PAYMENT_FIELDS).iterator()),
+            batch_size=ARCHIVE_CHUNK_SIZE,
+        )
+
+        raw_delete(payments)
+        # Accrual snapshots only matter while a loan is open
+        InterestAccrual.objects.filter(loan_id__in=ids).delete()
+        raw_delete(LoanAgreement.objects.filter(agreement_id__in=ids))
+        raw_delete(LoanApplication.objects.filter(application_id__in=ids))
+
+        portfolio.invalidate(*{row['lender_id'] for row in rows})
+        return ArchiveResult(len(rows), len(archived_payments))
+
+
+def archive_paid_loans(today, after_days=ARCHIVE_AFTER_DAYS, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Move every archivable loan as of `today` into the archive, one chunk per transaction."""
+    before = today - timedelta(days=after_days)
+    result = ArchiveResult()
+    last_id = 0
+    while True:
+        ids = list(
+            archivable(before)
+            .filter(agreement_id__gt=last_id)
+            .order_by('agreement_id')
+            .values_list('agreement_id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return result
+        last_id = ids[-1]
+        chunk = _archive_chunk(ids, before)
+        result.agreements += chunk.agreements
+        result.payments += chunk.payments
+
+
+def agreements_for(user):
+    """Archived agreements visible to `user`: their own for lenders and borrowers, all for employees."""
+    if user.role == 1:
+        return ArchivedLoanAgreement.objects.filter(lender_id=user.id)
+    if user.role == 2:
+        return ArchivedLoanAgreement.objects.filter(borrower_id=user.id)
+    return ArchivedLoanAgreement.objects.all()
+
+
+def history(agreement_id):
+    """
+    Find a loan in the live tables or else in the archive.
+
+    Returns a LoanHistory whose `agreement` is a LoanAgreement or an
+    ArchivedLoanAgreement and whose `payments` is a queryset in payment
+    order, or None if the loan exists in neither tier.
+    """
+    agreement = LoanAgreement.objects.filter(agreement_id=agreement_id).select_related('agreement_id').first()
+    if agreement is not None:
+        payments = LoanPayment.objects.filter(loan_id=agreement_id).order_by('payment_date', 'payment_id')
+        return LoanHistory(False, agreement.lender_id, agreement.agreement_id.borrower_id, agreement, payments)
+    agreement = ArchivedLoanAgreement.objects.filter(agreement_id=agreement_id).first()
+    if agreement is not None:
+        payments = ArchivedLoanPayment.objects.filter(loan_id=agreement_id).order_by('payment_date', 'payment_id')
+        return LoanHistory(True, agreement.lender_id, agreement.borrower_id, agreement, payments)
+    return None
@@ -0,0 +1,68 @@
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+REVOKED_KEY = 'loans:revoked-user:{}'
+
+
+def revoke_user(*user_ids):
+    """
+    Reject the tokens these users logged in with until now.
+
+    Every worker process has to see the entries, so this needs a shared cache,
+    see the `loans.E001` check. An access token refreshed later keeps the
+    `auth_time` of its login, so entries outlive the refresh tokens already
+    handed out. Users can log in again afterwards unless they were
+    deactivated or deleted.
+    """
+    timeout = int(max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+    revoked_at = time.time()
+    cache.set_many({REVOKED_KEY.format(user_id): revoked_at for user_id in user_ids}, timeout)
+
+
+def is_revoked(user_id, auth_time=None):
+    """Whether a token of this user from a login at `auth_time`, or any login if None, is revoked."""
+    revoked_at = cache.get(REVOKED_KEY.format(user_id))
+    return revoked_at is not None and (auth_time is None or auth_time <= revoked_at)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the user from the token claims instead of
+    loading it from the database on every request.
+
+    MyTokenObtainPairSerializer embeds `username`, `role` and `is_admin`, which
+    is everything the views read from request.user. The result is an unsaved
+    User instance with its primary key set, so it still works as a foreign key
+    value in queries and inserts. Tokens without those claims fall back to the
+    database lookup. Tokens of users deleted, deactivated or given another
+    role since they logged in are rejected through revoke_user().
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidToken('Token contained no recognizable user identification') from e
+
+        # Tokens from before auth_time was added only have their own iat
+        if is_revoked(user_id, validated_token.get('auth_time', validated_token.get('iat'))):
+            raise AuthenticationFailed('User not found', code='user_not_found')
+
+        try:
+            username = validated_token['username']
+            role = validated_token['role']
+            is_admin = validated_token['is_admin']
+        except KeyError:
+            return super().get_user(validated_token)
+
+        user = User(id=user_id, username=username, role=role, is_superuser=is_admin, is_active=True)
+        user._state.adding = False
+        user._state.db = DEFAULT_DB_ALIAS
+        return user
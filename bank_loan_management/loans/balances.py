@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import portfolio
+from .models import LoanAgreement, LoanPayment
+
+
+def record_payment(loan, payment_amount):
+    """
+    Add `payment_amount` to the running balance of `loan` and flag it as fully
+    paid once the total due is reached.
+
+    Must be called inside the transaction that created the payment, with `loan`
+    locked by select_for_update().
+    """
+    new_total = loan.total_paid + payment_amount
+    fully_paid = new_total >= loan.total_due
+    LoanAgreement.objects.filter(pk=loan.pk).update(
+        total_paid=F('total_paid') + payment_amount,
+        fully_paid=fully_paid,
+    )
+    loan.total_paid = new_total
+    loan.fully_paid = fully_paid
+    return loan
+
+
+def rebuild_balances(agreements=None):
+    """
+    Recompute `total_paid` and `fully_paid` from the payment history.
+
+    Runs as three set-based UPDATE statements regardless of how many
+    agreements are rebuilt. Returns the number of agreements updated.
+    """
+    if agreements is None:
+        agreements = LoanAgreement.objects.all()
+
+    paid = (
+        LoanPayment.objects
+        .filter(loan=OuterRef('pk'))
+        .order_by()
+        .values('loan')
+        .annotate(total=Sum('payment_amount'))
+        .values('total')
+    )
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=15, decimal_places=2))
+
+    with transaction.atomic():
+        updated = agreements.update(total_paid=Coalesce(Subquery(paid), zero))
+        total_due = F('agreement_id__loan_amount') * (1 + F('interest_rate'))
+        agreements.filter(total_paid__gte=total_due).update(fully_paid=True)
+        agreements.filter(total_paid__lt=total_due).update(fully_paid=False)
+        portfolio.invalidate_all()
+    return updated
@@ -0,0 +1,282 @@
+import csv
+import io
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.timezone import make_aware, now
+
+from . import credit, delinquency, jobs, matching, portfolio
+from .models import FundingAccount, LoanAgreement, LoanApplication, LoanPayment
+
+MAX_BULK_ROWS = 50000
+BULK_BATCH_SIZE = 1000
+
+CENT = Decimal('0.01')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def read_payment_rows(request):
+    """
+    Return the payment rows of a bulk request as a list of dicts.
+
+    Accepts either a CSV upload in the `file` field (with `loan` and
+    `payment_amount` columns) or a JSON body that is a list of objects, or an
+    object with such a list under `payments`.
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        text = io.TextIOWrapper(upload.file, encoding='utf-8-sig')
+        return list(csv.DictReader(text))
+
+    data = request.data
+    if isinstance(data, dict):
+        data = data.get('payments')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of payments')
+    return data
+
+
+def _lock_by_pk(queryset, ids):
+    ids = sorted(set(ids))
+    batch_size = connection.ops.bulk_batch_size(['pk'], ids) or len(ids) or 1
+    rows = {}
+    for batch in _chunks(ids, batch_size):
+        rows.update((row.pk, row) for row in queryset.filter(pk__in=batch).order_by('pk'))
+    return rows
+
+
+def lock_agreements(ids):
+    """
+    Load and lock the given agreements, keyed by id.
+
+    Rows are fetched in primary key order so that concurrent bulk requests
+    always take their locks in the same order.
+    """
+    queryset = LoanAgreement.objects.select_for_update(of=('self',)).select_related('agreement_id')
+    return _lock_by_pk(queryset, ids)
+
+
+def _parse_payment(row):
+    if not isinstance(row, dict):
+        raise ValueError
+    loan_id = int(row['loan'])
+    payment_amount = Decimal(str(row['payment_amount']))
+    if not payment_amount.is_finite() or payment_amount != payment_amount.quantize(CENT):
+        raise ValueError
+    return loan_id, payment_amount
+
+
+def ingest_payments(rows, user):
+    """
+    Validate and insert many payments in one transaction.
+
+    All referenced agreements are loaded up front and the min/max and total due
+    rules are checked in memory against a running total, so later rows in the
+    same batch see the effect of earlier ones. Delinquent loans that were paid
+    are re-evaluated by delinquency.rescan jobs, one per chunk of loans, as
+    after a single payment. Returns one report entry per row.
+    """
+    parsed = []
+    report = []
+    for index, row in enumerate(rows):
+        try:
+            parsed.append((index, *_parse_payment(row)))
+            report.append(None)
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            report.append({'row': index, 'status': 'rejected', 'error': 'Invalid data format or missing data'})
+
+    with transaction.atomic():
+        agreements = lock_agreements(loan_id for _, loan_id, _ in parsed)
+        payments = []
+        accepted = []
+        touched = {}
+
+        for index, loan_id, payment_amount in parsed:
+            entry = {'row': index, 'loan': loan_id, 'status': 'rejected'}
+            report[index] = entry
+            loan = agreements.get(loan_id)
+
+            if payment_amount <= 0:
+                entry['error'] = 'Payment amount must be positive'
+            elif loan is None:
+                entry['error'] = 'Loan not found'
+            elif loan.agreement_id.borrower_id != user.id:
+                entry['error'] = 'Unauthorized loan access'
+            elif not (loan.min_payment <= payment_amount <= loan.max_payment):
+                entry['error'] = 'Payment must be within the allowed range'
+            elif loan.total_paid + payment_amount > loan.total_due:
+                entry['error'] = 'Payment exceeds the due amount'
+            else:
+                loan.total_paid += payment_amount
+                loan.fully_paid = loan.total_paid >= loan.total_due
+                touched[loan.pk] = loan
+                payments.append(LoanPayment(loan=loan, payment_amount=payment_amount))
+                accepted.append(entry)
+                entry['status'] = 'accepted'
+
+        LoanPayment.objects.bulk_create(payments, batch_size=BULK_BATCH_SIZE)
+        for entry, payment in zip(accepted, payments):
+            # Only backends that support RETURNING give back the new ids
+            if payment.pk is not None:
+                entry['payment_id'] = payment.pk
+        LoanAgreement.objects.bulk_update(touched.values(), ['total_paid', 'fully_paid'], batch_size=BULK_BATCH_SIZE)
+        portfolio.invalidate(*{loan.lender_id for loan in touched.values()})
+        delinquent = sorted(loan.pk for loan in touched.values() if loan.delinquent)
+        for chunk in _chunks(delinquent, BULK_BATCH_SIZE):
+            jobs.enqueue(delinquency.rescan, agreement_ids=chunk)
+        credit.rescore(*{loan.agreement_id.borrower_id for loan in touched.values()})
+
+    return report
+
+
+class ApprovalError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def _parse_approval(item):
+    if not isinstance(item, dict):
+        raise ApprovalError('Invalid data format or missing data')
+    try:
+        application_id = int(item['agreement_id'])
+        interest_rate = Decimal(str(item['interest_rate']))
+        if not 0 < interest_rate < 1:
+            raise ApprovalError('Interest rate must be between 0 and 1')
+
+        repayment_deadline = make_aware(datetime.strptime(item['repayment_deadline'], '%Y-%m-%d'))
+        if repayment_deadline < now():
+            raise ApprovalError('Deadline cannot be in the past')
+
+        lender_id = int(item['lender']) if item.get('lender') is not None else None
+        min_payment = Decimal(str(item['min_payment']))
+        max_payment = Decimal(str(item['max_payment']))
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise ApprovalError('Invalid data format or missing data')
+
+    return {
+        'application_id': application_id,
+        'lender_id': lender_id,
+        'interest_rate': interest_rate,
+        'repayment_deadline': repayment_deadline.date(),
+        'min_payment': min_payment,
+        'max_payment': max_payment,
+    }
+
+
+def approve_loans(items, all_or_nothing=True):
+    """
+    Approve many loan applications in one transaction.
+
+    Applications and the lenders' funding accounts are each locked with a
+    single query, checked in memory against running fund balances, and then
+    written with one UPDATE for the applications, one UPDATE per funding
+    account and a bulk_create for the agreements.
+
+    Items without a `lender` are assigned one by matching.LenderIndex.plan(),
+    in item order, against the balances left after the items with one.
+
+    With `all_or_nothing` a single rejected item rejects the whole batch,
+    nothing is written and the valid items are reported as skipped. Returns the per-item report and whether anything was
+    written.
+    """
+    report = []
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, _parse_approval(item)))
+            report.append(None)
+        except ApprovalError as error:
+            report.append({'item': index, 'status': 'rejected', 'error': error.message})
+
+    with transaction.atomic():
+        # Applications and accounts of soft-deleted users are left for purge_users. The users
+        # are locked too, so a concurrent directory.soft_delete() waits for this batch or wins
+        applications = _lock_by_pk(
+            LoanApplication.objects.select_for_update(of=('self', 'borrower')).select_related('borrower')
+            .filter(borrower__deleted_at__isnull=True),
+            (terms['application_id'] for _, terms in parsed)
+        )
+
+        # Items without a lender are matched against the index in one pass
+        pending = [
+            terms for _, terms in parsed
+            if terms['application_id'] in applications and not applications[terms['application_id']].approved
+        ]
+        unmatched = [terms for terms in pending if terms['lender_id'] is None]
+        reserved = defaultdict(Decimal)
+        for terms in pending:
+            if terms['lender_id'] is not None:
+                reserved[terms['lender_id']] += applications[terms['application_id']].loan_amount
+        planned = matching.index.plan(
+            (applications[terms['application_id']].loan_amount for terms in unmatched), reserved=reserved
+        )
+        for terms, lender_id in zip(unmatched, planned):
+            terms['lender_id'] = lender_id
+
+        accounts = _lock_by_pk(
+            FundingAccount.objects.select_for_update(of=('self', 'lender')).select_related('lender')
+            .filter(lender__role=1, lender__deleted_at__isnull=True),
+            (terms['lender_id'] for _, terms in parsed if terms['lender_id'] is not None)
+        )
+
+        agreements = []
+        debits = defaultdict(Decimal)
+        seen = set()
+        for index, terms in parsed:
+            entry = {'item': index, 'agreement_id': terms['application_id'], 'status': 'rejected'}
+            report[index] = entry
+            application = applications.get(terms['application_id'])
+            account = accounts.get(terms['lender_id'])
+
+            if application is not None and terms['lender_id'] is None and not application.approved:
+                entry['error'] = 'No lender with enough funds'
+            elif application is None or account is None:
+                entry['error'] = 'Data not found'
+            elif application.approved or application.pk in seen:
+                entry['error'] = 'Request was already approved'
+            elif terms['min_payment'] <= 0 or terms['max_payment'] > application.loan_amount:
+                entry['error'] = 'Invalid minimum or maximum payment'
+            elif terms['max_payment'] <= terms['min_payment']:
+                entry['error'] = 'Invalid maximum payment'
+            elif account.total_funds - debits[account.pk] < application.loan_amount:
+                entry['error'] = 'Insufficient budget'
+            else:
+                seen.add(application.pk)
+                debits[account.pk] += application.loan_amount
+                agreements.append(LoanAgreement(
+                    agreement_id=application,
+                    lender_id=account.pk,
+                    repayment_deadline=terms['repayment_deadline'],
+                    interest_rate=terms['interest_rate'],
+                    min_payment=terms['min_payment'],
+                    max_payment=terms['max_payment'],
+                ))
+                entry['status'] = 'approved'
+
+        rejected = any(entry['status'] == 'rejected' for entry in report)
+        if all_or_nothing and rejected:
+            for entry in report:
+                if entry['status'] == 'approved':
+                    entry['status'] = 'skipped'
+            return report, False
+        if not agreements:
+            return report, False
+
+        for batch in _chunks(sorted(seen), connection.ops.bulk_batch_size(['pk'], list(seen)) or len(seen)):
+            LoanApplication.objects.filter(pk__in=batch).update(approved=True)
+        for lender_id, amount in sorted(debits.items()):
+            FundingAccount.objects.filter(pk=lender_id).update(total_funds=F('total_funds') - amount)
+        LoanAgreement.objects.bulk_create(agreements, batch_size=BULK_BATCH_SIZE)
+        portfolio.invalidate(*debits)
+        matching.index.invalidate(*debits)
+        credit.rescore(*{agreement.agreement_id.borrower_id for agreement in agreements})
+
+    return report, True
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Caches that every process keeps to itself
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _process_local_cache():
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    return backend if backend in PROCESS_LOCAL_CACHES else None
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Revocations, replica pins and throttle buckets must be seen by every worker process."""
+    backend = _process_local_cache()
+    if backend:
+        return [
+            Error(
+                f"The default cache ({backend}) is not shared between processes.",
+                hint='Set CACHE_URL to a Redis or memcached server so that revoked tokens, replica '
+                     'pins and throttle buckets apply to every worker process.',
+                id='loans.E001',
+            )
+        ]
+    return []
+
+
+@register(Tags.caches, Tags.database)
+def check_replica_pins(app_configs, **kwargs):
+    """Read replicas need a shared cache for the pins that give users read-your-writes."""
+    backend = _process_local_cache()
+    if backend and getattr(settings, 'DATABASE_REPLICAS', []):
+        return [
+            Error(
+                f"DATABASE_REPLICAS are configured but the default cache ({backend}) is not shared "
+                "between processes, so a user's write does not pin their reads in other processes.",
+                hint='Set CACHE_URL to a Redis or memcached server.',
+                id='loans.E002',
+            )
+        ]
+    return []
@@ -0,0 +1,192 @@
+"""
+Borrower credit scores.
+
+A borrower's score is computed from their history in both the live tables
+and the archive:
+
+- applications: every loan application, approved or not
+- loans, paid_loans, open_loans: their agreements, and how many are repaid
+- delinquent_loans: open agreements flagged by the delinquency scan
+- payments, late_payments: payments made after the repayment deadline or
+  the payment due date count as late
+- exposure: what is still owed on the open loans, principal and interest
+
+and scored as
+
+    550 + 150 * (2 * on_time - 1) + 25 * min(paid_loans, 6)
+        - 20 * min(open_loans, 5) - 100 * min(delinquent_loans, 3)
+
+clamped to 300..850, with on_time the share of payments made on time. The
+payment term only counts once there are payments.
+
+Features are computed for a chunk of borrowers with one grouped query per
+table and the scores with NumPy, then upserted into CreditScore. The pending
+request list reads them with a join, see with_scores().
+
+Writes that change a borrower's loans or payments queue a refresh job for
+that borrower once their transaction commits, see rescore(), so the hot
+write paths do not query the job table under their row locks. The job waits
+RESCORE_DELAY seconds and further writes in that time reuse it, so a
+borrower paying in quick succession costs one job. The score_borrowers
+command recomputes every borrower, to catch up on anything else, such as a
+refresh that failed to queue after its commit.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.utils.timezone import now
+
+from . import jobs
+from .models import ArchivedLoanAgreement, ArchivedLoanPayment, CreditScore, LoanAgreement, LoanApplication, LoanPayment, User
+
+SCORE_CHUNK_SIZE = 2000
+# Seconds a queued refresh waits for more writes of the same borrowers
+RESCORE_DELAY = 30
+MIN_SCORE = 300
+MAX_SCORE = 850
+
+FEATURES = ('applications', 'loans', 'paid_loans', 'open_loans', 'delinquent_loans', 'payments', 'late_payments')
+
+# Read with the pending loan requests; CreditScore shares the borrower's primary key
+SCORE_ANNOTATIONS = {
+    'credit_score': F('borrower__credit_score__score'),
+    'borrower_loans': F('borrower__credit_score__loans'),
+    'borrower_late_payments': F('borrower__credit_score__late_payments'),
+    'borrower_exposure': F('borrower__credit_score__exposure'),
+}
+
+OUTSTANDING = ExpressionWrapper(
+    F('agreement_id__loan_amount') * (Value(1) + F('interest_rate')) - F('total_paid'),
+    output_field=DecimalField(max_digits=15, decimal_places=2),
+)
+
+
+@dataclass
+class ScoreResult:
+    borrowers: int = 0
+
+
+def compute_scores(paid_loans, open_loans, delinquent_loans, payments, late_payments):
+    """Scores for int arrays of borrower features, see the module docstring."""
+    on_time = np.where(payments > 0, 1 - late_payments / np.maximum(payments, 1), 0.5)
+    score = (
+        550
+        + 150 * (2 * on_time - 1)
+        + 25 * np.minimum(paid_loans, 6)
+        - 20 * np.minimum(open_loans, 5)
+        - 100 * np.minimum(delinquent_loans, 3)
+    )
+    return np.clip(np.rint(score), MIN_SCORE, MAX_SCORE).astype(np.int64)
+
+
+def _grouped(queryset, borrower, **aggregates):
+    # {borrower_id: {name: value}} from one GROUP BY query
+    rows = queryset.order_by().values(scored_borrower=borrower).annotate(**aggregates)
+    return {row.pop('scored_borrower'): row for row in rows}
+
+
+def features(borrower_ids):
+    """The features of these borrowers, as {borrower_id: {feature: value}}."""
+    late = Q(payment_date__gt=F('loan__repayment_deadline')) | Q(payment_date__gt=F('loan__payment_due_date'))
+    queries = [
+        _grouped(
+            LoanApplication.objects.filter(borrower_id__in=borrower_ids), F('borrower_id'),
+            applications=Count('pk'),
+        ),
+        _grouped(
+            LoanAgreement.objects.filter(agreement_id__borrower_id__in=borrower_ids), F('agreement_id__borrower_id'),
+            loans=Count('pk'),
+            paid_loans=Count('pk', filter=Q(fully_paid=True)),
+            delinquent_loans=Count('pk', filter=Q(fully_paid=False, delinquent=True)),
+            exposure=Sum(OUTSTANDING, filter=Q(fully_paid=False)),
+        ),
+        _grouped(
+            LoanPayment.objects.filter(loan__agreement_id__borrower_id__in=borrower_ids), F('loan__agreement_id__borrower_id'),
+            payments=Count('pk'),
+            late_payments=Count('pk', filter=late),
+        ),
+        # Archived loans are fully paid and their applications went with them
+        _grouped(
+            ArchivedLoanAgreement.objects.filter(borrower_id__in=borrower_ids), F('borrower_id'),
+            applications=Count('pk'),
+            loans=Count('pk'),
+            paid_loans=Count('pk'),
+        ),
+        _grouped(
+            ArchivedLoanPayment.objects.filter(loan__borrower_id__in=borrower_ids), F('loan__borrower_id'),
+            payments=Count('pk'),
+            late_payments=Count('pk', filter=late),
+        ),
+    ]
+
+    result = {}
+    for borrower_id in borrower_ids:
+        row = dict.fromkeys(FEATURES, 0)
+        row['exposure'] = Decimal('0.00')
+        for grouped in queries:
+            for name, value in grouped.get(borrower_id, {}).items():
+                row[name] += value or 0
+        row['open_loans'] = row['loans'] - row['paid_loans']
+        result[borrower_id] = row
+    return result
+
+
+def score_borrowers(borrower_ids):
+    """Recompute and store the scores of these borrowers. Returns the number stored."""
+    borrower_ids = list(User.objects.filter(id__in=borrower_ids, role=2).values_list('id', flat=True))
+    if not borrower_ids:
+        return 0
+    rows = features(borrower_ids)
+    columns = {name: np.array([rows[borrower_id][name] for borrower_id in borrower_ids], dtype=np.int64) for name in FEATURES}
+    scores = compute_scores(
+        columns['paid_loans'], columns['open_loans'], columns['delinquent_loans'],
+        columns['payments'], columns['late_payments'],
+    )
+
+    computed_at = now()
+    with transaction.atomic():
+        CreditScore.objects.bulk_create(
+            [
+                CreditScore(borrower_id=borrower_id, score=int(score), computed_at=computed_at, **rows[borrower_id])
+                for borrower_id, score in zip(borrower_ids, scores)
+            ],
+            update_conflicts=True,
+            unique_fields=['borrower'],
+            update_fields=['score', *FEATURES, 'exposure', 'computed_at'],
+        )
+    return len(borrower_ids)
+
+
+def score_all(chunk_size=SCORE_CHUNK_SIZE):
+    """Recompute every borrower's score, one chunk of borrowers per transaction."""
+    queryset = User.objects.filter(role=2, deleted_at__isnull=True).order_by('id').values_list('id', flat=True)
+    result = ScoreResult()
+    last = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last)[:chunk_size])
+        if not ids:
+            return result
+        result.borrowers += score_borrowers(ids)
+        last = ids[-1]
+
+
+@jobs.task(queue='recalculations')
+def refresh(borrower_ids):
+    """Recompute a few borrowers' scores, queued by rescore()."""
+    score_borrowers(borrower_ids)
+
+
+def rescore(*borrower_ids):
+    """Queue a refresh of these borrowers' scores after the current transaction commits, unless one is waiting already."""
+    if borrower_ids:
+        ids = sorted(set(borrower_ids))
+        # Robust: the writes are committed, so a failed enqueue is logged and left to score_borrowers
+        transaction.on_commit(lambda: jobs.enqueue_once(refresh, delay=RESCORE_DELAY, borrower_ids=ids), robust=True)
+
+
+def with_scores(queryset):
+    """Annotate loan applications with their borrower's score and features, or None if not scored yet."""
+    return queryset.annotate(**SCORE_ANNOTATIONS)
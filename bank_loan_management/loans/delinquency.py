@@ -0,0 +1,180 @@
+"""
+Nightly delinquency scan.
+
+An open agreement is delinquent when its payment_due_date or
+repayment_deadline has passed, or when the borrower has paid less than
+min_payment for every full month since approval. Agreements are read in
+primary key order one chunk at a time: the payment totals of a chunk are
+fetched with a single grouped query and the changed flags are written back
+with bulk_update, so memory does not grow with the table.
+
+Chunks are selected by keyset (agreement_id > last seen) rather than with one
+long-running .iterator() cursor. On SQLite an open read cursor holds the
+shared lock for as long as it is being consumed, which would block the
+writes. For the same reason worker processes only read and compute; the
+flags are written by the parent, so there is a single writer.
+"""
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Q, Sum
+from django.utils.timezone import now
+
+from . import credit, jobs
+from .models import LoanAgreement, LoanApplication, LoanPayment
+
+SCAN_FIELDS = (
+    'agreement_id',
+    'approval_date',
+    'payment_due_date',
+    'repayment_deadline',
+    'min_payment',
+    'interest_rate',
+    'agreement_id__loan_amount',
+    'fully_paid',
+    'delinquent',
+)
+
+
+@dataclass
+class ScanResult:
+    scanned: int = 0
+    overdue: int = 0
+    behind: int = 0
+    flagged: int = 0
+    cleared: int = 0
+
+    def add(self, other):
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+def _full_months(start, end):
+    months = (end.year - start.year) * 12 + end.month - start.month
+    if end.day < start.day:
+        months -= 1
+    return max(months, 0)
+
+
+def scan_chunk(rows, today):
+    """
+    Work out which agreements in `rows` (tuples of SCAN_FIELDS) must be
+    flagged or cleared as of `today`. Returns the counts and the changed
+    agreements, ready for write_flags().
+    """
+    result = ScanResult(scanned=len(rows))
+    paid = dict(
+        LoanPayment.objects
+        .filter(loan_id__in=[row[0] for row in rows], payment_date__lte=today)
+        .order_by()
+        .values('loan_id')
+        .annotate(total=Sum('payment_amount'))
+        .values_list('loan_id', 'total')
+    )
+
+    changed = []
+    for (agreement_id, approval_date, payment_due_date, repayment_deadline, min_payment,
+         interest_rate, loan_amount, fully_paid, delinquent) in rows:
+        is_delinquent = False
+        if not fully_paid:
+            total_paid = paid.get(agreement_id) or Decimal('0')
+            total_due = loan_amount * (1 + interest_rate)
+            expected = min(min_payment * _full_months(approval_date, today), total_due)
+
+            if repayment_deadline < today or (payment_due_date is not None and payment_due_date < today):
+                result.overdue += 1
+                is_delinquent = True
+            elif total_paid < expected:
+                result.behind += 1
+                is_delinquent = True
+
+        if is_delinquent != delinquent:
+            if is_delinquent:
+                result.flagged += 1
+            else:
+                result.cleared += 1
+            changed.append((agreement_id, is_delinquent, today if is_delinquent else None))
+    return result, changed
+
+
+def write_flags(changed):
+    if not changed:
+        return
+    with transaction.atomic():
+        LoanAgreement.objects.bulk_update([
+            LoanAgreement(agreement_id_id=agreement_id, delinquent=delinquent, delinquent_since=since)
+            for agreement_id, delinquent, since in changed
+        ], ['delinquent', 'delinquent_since'])
+        credit.rescore(*LoanApplication.objects.filter(
+            application_id__in=[agreement_id for agreement_id, _, _ in changed]
+        ).values_list('borrower_id', flat=True))
+
+
+def _init_worker():
+    # A forked worker inherits the parent's open connections. Forget them
+    # without closing, which would also close them for the parent, so the
+    # worker opens its own on first use.
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+
+
+def _chunks(queryset, chunk_size):
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(agreement_id__gt=last)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def scan(today, chunk_size=2000, workers=0):
+    """
+    Scan every open or currently flagged agreement.
+
+    With `workers` > 0 the chunks are handed to a pool of forked processes,
+    keeping at most two chunks per worker in flight so memory stays bounded.
+    Each worker opens its own database connection.
+    """
+    queryset = (
+        LoanAgreement.objects
+        .filter(Q(fully_paid=False) | Q(delinquent=True))
+        .order_by('agreement_id')
+        .values_list(*SCAN_FIELDS)
+    )
+    total = ScanResult()
+
+    def collect(result, changed):
+        write_flags(changed)
+        total.add(result)
+
+    if workers <= 0:
+        for rows in _chunks(queryset, chunk_size):
+            collect(*scan_chunk(rows, today))
+        return total
+
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+        pending = set()
+        for rows in _chunks(queryset, chunk_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(*future.result())
+            pending.add(pool.submit(scan_chunk, rows, today))
+        for future in pending:
+            collect(*future.result())
+    return total
+
+
+@jobs.task(queue='recalculations')
+def rescan(agreement_ids):
+    """Re-evaluate a few agreements as of today, queued after payments on delinquent loans."""
+    rows = list(
+        LoanAgreement.objects.filter(agreement_id__in=agreement_ids).order_by('agreement_id').values_list(*SCAN_FIELDS)
+    )
+    write_flags(scan_chunk(rows, now().date())[1])
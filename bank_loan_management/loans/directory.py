@@ -0,0 +1,125 @@
+"""
+User directory and user deletion.
+
+search() filters the directory by username prefix and role, case-sensitively
+and from an index of usernames. On PostgreSQL that is a LIKE 'prefix%', which
+uses the varchar_pattern_ops index Django creates next to the unique one; a
+range on the username would follow the database's collation, which need not
+be bytewise. SQLite's LIKE ignores case, but its BINARY collation is bytewise,
+so there the prefix is matched as the range username >= prefix AND
+username < successor(prefix) on the unique index.
+
+Deleting a user is split in two. soft_delete() marks the users deleted and
+revokes their tokens at once, in one UPDATE, so they disappear from the
+directory, the lender matching and the pending requests right away. Their loans, payments and
+applications are then removed by the purge_users job, one chunk per job, so
+a lender with thousands of loans never holds the write lock for long. The
+job queues itself again until nothing is left and finally deletes the users.
+"""
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from . import jobs, matching, portfolio
+from .archive import raw_delete
+from .authentication import revoke_user
+from .models import ArchivedLoanAgreement, ArchivedLoanPayment, InterestAccrual, LoanAgreement, LoanApplication, LoanPayment, User
+
+MAX_BULK_USERS = 1000
+PURGE_CHUNK_SIZE = 500
+
+
+def _successor(prefix):
+    # The smallest string greater than every string starting with `prefix`
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def search(prefix='', role=None):
+    """Users that are not deleted, optionally by username prefix and role."""
+    users = User.objects.filter(deleted_at__isnull=True)
+    if prefix:
+        if connections[users.db].vendor == 'sqlite':
+            users = users.filter(username__gte=prefix, username__lt=_successor(prefix))
+        else:
+            users = users.filter(username__startswith=prefix)
+    if role is not None:
+        users = users.filter(role=role)
+    return users
+
+
+def soft_delete(user_ids):
+    """
+    Mark these users deleted and queue the purge of their data.
+
+    Superusers and users already deleted are left alone. Returns the ids of
+    the users deleted.
+    """
+    with transaction.atomic():
+        users = User.objects.filter(id__in=user_ids, is_superuser=False, deleted_at__isnull=True)
+        ids = list(users.select_for_update().values_list('id', flat=True))
+        if not ids:
+            return []
+        # update() sends no post_save, so the side effects of user_saved are repeated here
+        User.objects.filter(id__in=ids).update(is_active=False, deleted_at=now())
+        revoke_user(*ids)
+        matching.index.invalidate(*ids)
+        jobs.enqueue(purge_users, user_ids=ids)
+    return ids
+
+
+def _purge_loans(agreements):
+    ids = list(agreements.order_by('agreement_id').values_list('agreement_id', flat=True)[:PURGE_CHUNK_SIZE])
+    if not ids:
+        return False
+    lender_ids = set(LoanAgreement.objects.filter(agreement_id__in=ids).values_list('lender_id', flat=True))
+    # Raw deletes skip the post_delete signal per row; the cache is invalidated below
+    raw_delete(LoanPayment.objects.filter(loan_id__in=ids))
+    InterestAccrual.objects.filter(loan_id__in=ids).delete()
+    raw_delete(LoanAgreement.objects.filter(agreement_id__in=ids))
+    portfolio.invalidate(*lender_ids)
+    return True
+
+
+def _purge_archived(agreements):
+    ids = list(agreements.order_by('agreement_id').values_list('agreement_id', flat=True)[:PURGE_CHUNK_SIZE])
+    if not ids:
+        return False
+    ArchivedLoanPayment.objects.filter(loan_id__in=ids).delete()
+    # Its payments are gone, so there is nothing left to cascade to
+    raw_delete(ArchivedLoanAgreement.objects.filter(agreement_id__in=ids))
+    # The archived totals are part of every lender's portfolio
+    portfolio.invalidate_all()
+    return True
+
+
+def _purge_applications(applications):
+    ids = list(applications.order_by('application_id').values_list('application_id', flat=True)[:PURGE_CHUNK_SIZE])
+    if not ids:
+        return False
+    # Their agreements were purged first
+    raw_delete(LoanApplication.objects.filter(application_id__in=ids))
+    return True
+
+
+def purge_chunk(user_ids):
+    """
+    Delete one chunk of the data of these soft-deleted users, or the users
+    themselves once nothing else is left. Returns True while more remains.
+    """
+    # The rows go in the order the cascade would delete them: what refers to a row first
+    if _purge_loans(LoanAgreement.objects.filter(Q(lender_id__in=user_ids) | Q(agreement_id__borrower_id__in=user_ids))):
+        return True
+    if _purge_archived(ArchivedLoanAgreement.objects.filter(Q(lender_id__in=user_ids) | Q(borrower_id__in=user_ids))):
+        return True
+    if _purge_applications(LoanApplication.objects.filter(borrower_id__in=user_ids)):
+        return True
+    # What is left per user is small: a funding account and idempotency keys
+    User.objects.filter(id__in=user_ids, deleted_at__isnull=False).delete()
+    return False
+
+
+@jobs.task()
+def purge_users(user_ids):
+    """Purge one chunk of soft-deleted users and queue the next one."""
+    if purge_chunk(user_ids):
+        jobs.enqueue(purge_users, user_ids=user_ids)
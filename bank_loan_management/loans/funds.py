@@ -0,0 +1,53 @@
+from django.db.models import F
+
+from . import matching, portfolio
+from .models import FundingAccount
+
+
+def credit(lender_id, amount):
+    """
+    Add `amount` to the lender's funding account, creating it if needed.
+
+    The increment is done by the database, so concurrent deposits never
+    overwrite each other.
+    """
+    FundingAccount.objects.get_or_create(lender_id=lender_id)
+    FundingAccount.objects.filter(lender_id=lender_id).update(total_funds=F('total_funds') + amount)
+    portfolio.invalidate(lender_id)
+    matching.index.invalidate(lender_id)
+
+
+def debit(lender_id, amount):
+    """
+    Take `amount` from the lender's funding account if it holds enough.
+
+    The funds check and the debit are a single conditional UPDATE, so two
+    concurrent approvals cannot both spend the same money. The UPDATE also
+    checks that the account belongs to a lender who is not soft-deleted, as
+    purge_users deletes their loans without refunding them. Returns whether
+    the account was debited.
+    """
+    debited = FundingAccount.objects.filter(
+        lender_id=lender_id, lender__role=1, lender__deleted_at__isnull=True, total_funds__gte=amount
+    ).update(total_funds=F('total_funds') - amount) == 1
+    if debited:
+        portfolio.invalidate(lender_id)
+        matching.index.invalidate(lender_id)
+    return debited
+
+
+def debit_best_match(amount):
+    """
+    Debit `amount` from the lender proposed by the matching index.
+
+    A lender whose debit fails had a stale index entry; it is re-read and the
+    next proposal is tried. Returns the debited lender's id, or None if no
+    lender can fund the amount.
+    """
+    tried = set()
+    while (lender_id := matching.index.propose(amount, exclude=tried)) is not None:
+        if debit(lender_id, amount):
+            return lender_id
+        tried.add(lender_id)
+        matching.index.mark_stale(lender_id)
+    return None
@@ -0,0 +1,146 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+A client that retries a POST with the same Idempotency-Key header gets the
+response of the first attempt back instead of running the write again. Keys
+are scoped per user and kept for IDEMPOTENCY_TTL.
+
+The key is claimed by inserting an IdempotencyKey row in the same transaction
+as the view's writes and its stored response. Two concurrent requests with
+the same key cannot both insert: the second waits on the unique constraint
+(or, on SQLite, on the write lock) until the first commits, then fails the
+insert and replays the stored response. If the view fails, the claim rolls
+back with its writes and the request can be retried.
+
+Completed responses are also kept in a per-process LRU cache, so most replays
+do not touch the database.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+from rest_framework.response import Response
+
+from . import rendering
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_TTL = timedelta(hours=24)
+CACHE_SIZE = 10000
+
+
+class ResponseCache:
+    """A thread-safe LRU cache of stored responses whose entries expire."""
+
+    def __init__(self, size=CACHE_SIZE, ttl=IDEMPOTENCY_TTL):
+        self.size = size
+        self.ttl = ttl.total_seconds()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, age=0):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl - age, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache()
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _replay(fingerprint, stored):
+    stored_fingerprint, status_code, body = stored
+    if stored_fingerprint != fingerprint:
+        return Response({'error': f'{HEADER} was already used for a different request'}, status=422)
+    response = rendering.EncodedResponse(rendering.RawJSON(body), status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired():
+    """Delete stored responses older than IDEMPOTENCY_TTL. Returns how many were deleted."""
+    return IdempotencyKey.objects.filter(created_at__lt=now() - IDEMPOTENCY_TTL).delete()[0]
+
+
+def idempotent(view_method):
+    """
+    Make a POST handler honour the Idempotency-Key header.
+
+    Requests without the header run as before. Responses with a 5xx status
+    are not stored and roll back the claim along with the view's writes.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}, status=400)
+
+        user_id = request.user.id
+        fingerprint = _fingerprint(request)
+        stored = cache.get((user_id, key))
+        if stored is not None:
+            return _replay(fingerprint, stored)
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user_id=user_id, key=key, fingerprint=fingerprint, status_code=0, response_body=''
+                    )
+            except IntegrityError:
+                record = IdempotencyKey.objects.get(user_id=user_id, key=key)
+                age = now() - record.created_at
+                if age < IDEMPOTENCY_TTL:
+                    stored = (record.fingerprint, record.status_code, record.response_body)
+                    cache.set((user_id, key), stored, age.total_seconds())
+                    return _replay(fingerprint, stored)
+                # Expired but not purged yet: the key can be used again
+                record.delete()
+                record = IdempotencyKey.objects.create(
+                    user_id=user_id, key=key, fingerprint=fingerprint, status_code=0, response_body=''
+                )
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+                return response
+
+            record.status_code = response.status_code
+            record.response_body = rendering.render(response.data).decode()
+            record.save(update_fields=['status_code', 'response_body'])
+
+            stored = (fingerprint, record.status_code, record.response_body)
+            transaction.on_commit(lambda: cache.set((user_id, key), stored))
+        return response
+
+    return wrapper
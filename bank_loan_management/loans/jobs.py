@@ -0,0 +1,228 @@
+"""
+Persistent background jobs.
+
+Functions decorated with @task can be queued with enqueue(), which inserts a
+Job row. Called inside a view's transaction, the job is committed or rolled
+back together with the writes it follows up on. Workers started with the
+runworkers command pick due jobs up from the table; there is no broker.
+
+Claiming is a SELECT ... FOR UPDATE SKIP LOCKED of the due jobs followed by
+an UPDATE that only takes jobs still pending, so concurrent workers never run
+the same job. SQLite has no row locks, but it serialises writers and the
+conditional UPDATE still hands every job to a single worker.
+
+A job runs in a transaction and is deleted in it when the task returns. When
+the task raises, the job is retried after an exponential backoff until
+max_attempts is reached, after which it is kept with status 'failed' and the
+traceback. Workers refresh the locked_at of the jobs they are running every
+HEARTBEAT_INTERVAL, so a job however long it runs keeps its lock while its
+worker is alive. A job whose lock has not been refreshed for JOB_TIMEOUT
+belongs to a worker that died and is released again. Tasks must therefore
+tolerate running twice.
+
+Each queue has a concurrency limit, the number of threads a worker process
+runs its jobs on. The limits come from the JOB_QUEUES setting.
+
+enqueue_once() debounces follow-up work: called with a delay, it reuses a job
+with the same arguments that is still waiting, so a burst of writes queues
+one job instead of one each.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from .models import Job
+
+logger = logging.getLogger('loans.jobs')
+
+DEFAULT_QUEUE = 'default'
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+JOB_TIMEOUT = timedelta(minutes=10)
+# Seconds between refreshes of the locks of running jobs, well within JOB_TIMEOUT
+HEARTBEAT_INTERVAL = 60
+# Seconds between sweeps for jobs abandoned by dead workers
+STALE_SWEEP_INTERVAL = 60
+
+
+def task(queue=DEFAULT_QUEUE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Mark a module-level function as a job; its keyword arguments must be JSON-serialisable."""
+    def register(func):
+        func.task_name = f'{func.__module__}.{func.__qualname__}'
+        func.queue = queue
+        func.max_attempts = max_attempts
+        return func
+
+    return register
+
+
+def enqueue(func, *, delay=0, queue=None, **kwargs):
+    """Queue `func(**kwargs)` to run in a worker `delay` seconds from now."""
+    return Job.objects.create(
+        queue=queue or func.queue,
+        task=func.task_name,
+        payload=kwargs,
+        max_attempts=func.max_attempts,
+        run_at=now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue_once(func, *, delay=0, queue=None, **kwargs):
+    """
+    Like enqueue(), but return the job of `func(**kwargs)` already waiting to
+    become due instead of queuing another. Jobs that are due may be running
+    already and are not reused.
+    """
+    waiting = Job.objects.filter(
+        queue=queue or func.queue, status=Job.PENDING, run_at__gt=now(), task=func.task_name, payload=kwargs,
+    ).first()
+    return waiting or enqueue(func, delay=delay, queue=queue, **kwargs)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed `attempts` times."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def get_queues():
+    return getattr(settings, 'JOB_QUEUES', {DEFAULT_QUEUE: 4})
+
+
+def claim(queue, limit, worker=''):
+    """Take up to `limit` due jobs of `queue` for `worker` and return them."""
+    token = f'{worker}:{uuid.uuid4().hex}'[-100:]
+    current = now()
+    due = Job.objects.filter(queue=queue, status=Job.PENDING, run_at__lte=current)
+    with transaction.atomic():
+        ids = list(due.select_for_update(skip_locked=True).order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        due.filter(id__in=ids).update(
+            status=Job.RUNNING, locked_by=token, locked_at=current, attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(status=Job.RUNNING, locked_by=token).order_by('run_at', 'id'))
+
+
+def heartbeat(running):
+    """Refresh the locks of these running jobs so release_stale() leaves them alone. Returns how many."""
+    return Job.objects.filter(
+        status=Job.RUNNING, id__in=[job.pk for job in running], locked_by__in={job.locked_by for job in running}
+    ).update(locked_at=now())
+
+
+def release_stale():
+    """Put jobs whose lock was last refreshed more than JOB_TIMEOUT ago back in their queue. Returns how many."""
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=now() - JOB_TIMEOUT).update(
+        status=Job.PENDING, locked_by='', locked_at=None, last_error='Released after JOB_TIMEOUT'
+    )
+
+
+def run(job):
+    """Run a claimed job. Returns True if it succeeded."""
+    try:
+        func = import_string(job.task)
+        if getattr(func, 'task_name', None) != job.task:
+            raise ValueError(f'{job.task} is not a task')
+        with transaction.atomic():
+            func(**job.payload)
+            Job.objects.filter(pk=job.pk, locked_by=job.locked_by).delete()
+        return True
+    except Exception:
+        error = traceback.format_exc()
+
+    mine = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by)
+    if job.attempts >= job.max_attempts:
+        mine.update(status=Job.FAILED, locked_by='', locked_at=None, last_error=error)
+    else:
+        mine.update(
+            status=Job.PENDING, locked_by='', locked_at=None, last_error=error,
+            run_at=now() + timedelta(seconds=backoff(job.attempts)),
+        )
+    return False
+
+
+class Worker:
+    """
+    Run the jobs of some queues on one thread pool per queue, sized by the
+    queue's concurrency limit. stop() makes run() return once the jobs in
+    progress have finished.
+    """
+
+    def __init__(self, queues=None, poll_interval=1.0, name=None):
+        self.queues = dict(queues or get_queues())
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self, job):
+        # Pool threads live on between jobs; drop their expired or broken connections
+        try:
+            return run(job)
+        finally:
+            close_old_connections()
+
+    def run_once(self):
+        """Claim what every queue can take and run it in this thread. Returns the number of jobs run."""
+        count = 0
+        for queue, limit in self.queues.items():
+            for job in claim(queue, limit, self.name):
+                run(job)
+                count += 1
+        return count
+
+    def run(self, burst=False):
+        """Work until stop() is called or, with `burst`, until the queues are empty."""
+        pools = {
+            queue: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f'jobs-{queue}')
+            for queue, limit in self.queues.items()
+        }
+        # queue -> {future: job} of the jobs in progress
+        running = {queue: {} for queue in self.queues}
+        swept_at = beat_at = None
+        try:
+            while not self._stopping.is_set():
+                claimed = 0
+                try:
+                    if swept_at is None or (now() - swept_at).total_seconds() >= STALE_SWEEP_INTERVAL:
+                        release_stale()
+                        swept_at = now()
+
+                    for queue in running:
+                        running[queue] = {future: job for future, job in running[queue].items() if not future.done()}
+                    if beat_at is None or (now() - beat_at).total_seconds() >= HEARTBEAT_INTERVAL:
+                        heartbeat([job for jobs in running.values() for job in jobs.values()])
+                        beat_at = now()
+
+                    for queue, pool in pools.items():
+                        free = self.queues[queue] - len(running[queue])
+                        if free > 0:
+                            for job in claim(queue, free, self.name):
+                                running[queue][pool.submit(self._run, job)] = job
+                                claimed += 1
+                except DatabaseError:
+                    # A busy or restarting database should not bring the worker down
+                    logger.exception('Claiming jobs failed')
+
+                if burst and not claimed and not any(running.values()):
+                    break
+                if not claimed:
+                    self._stopping.wait(self.poll_interval)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+            close_old_connections()
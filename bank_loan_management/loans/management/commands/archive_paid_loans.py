@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from loans.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE, archive_paid_loans
+
+
+class Command(BaseCommand):
+    help = (
+        'Move fully paid loan agreements without recent payments, with their applications and '
+        'payments, from the live tables into the archive tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help='Only archive loans without payments in this many days.')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help='Agreements moved per transaction.')
+        parser.add_argument('--date', help='Archive as of this date (YYYY-MM-DD) instead of today.')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else now().date()
+        except ValueError:
+            raise CommandError('--date must be in YYYY-MM-DD format')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+
+        result = archive_paid_loans(today, after_days=options['days'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {result.agreements} agreements and {result.payments} payments.'
+        ))
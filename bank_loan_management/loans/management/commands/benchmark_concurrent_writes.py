@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import zip_longest
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from loans.management.commands.benchmark_endpoints import percentile
+from loans.models import LoanAgreement, LoanApplication, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Post payments and loan approvals from concurrent threads against the current database '
+        'and report throughput, latency and failed requests. Run it once per DB_PROFILE to compare '
+        'database profiles. The writes are committed, so use a disposable dataset from '
+        'generate_loan_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help='Username prefix used by generate_loan_data.')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50, help='Requests per thread.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', nargs='+', default=[], metavar='FILE',
+                            help='Compare the results with those saved by earlier runs, e.g. of other profiles.')
+
+    # The test client sends Host: testserver, which the test runner normally allows.
+    # Throttling is off so the benchmark measures the endpoints themselves.
+    @override_settings(ALLOWED_HOSTS=['testserver'], THROTTLE_ENABLED=False)
+    def handle(self, *args, **options):
+        threads, per_thread = options['threads'], options['requests']
+        if threads < 1 or per_thread < 1:
+            raise CommandError('--threads and --requests must be at least 1')
+        prefix = options['prefix']
+
+        # Each request works on its own loan or application, so failures come
+        # from the database rather than from business rules.
+        wanted = threads * per_thread
+        loans = list(
+            LoanAgreement.objects
+            .filter(agreement_id__borrower__username__startswith=f'{prefix}_borrower_', fully_paid=False)
+            .select_related('agreement_id__borrower')
+            .order_by('agreement_id')[:wanted]
+        )
+        pending = list(
+            LoanApplication.objects
+            .filter(borrower__username__startswith=f'{prefix}_borrower_', approved=False)
+            .order_by('application_id')[:wanted]
+        )
+        lender = User.objects.filter(username__startswith=f'{prefix}_lender_').order_by('id').first()
+        employee = User.objects.filter(username=f'{prefix}_employee').first()
+        if lender is None or employee is None or not loans or not pending:
+            raise CommandError(f"No '{prefix}' dataset with open loans and pending applications; run generate_loan_data first.")
+
+        deadline = (now().date() + timedelta(days=365)).isoformat()
+        payments = [
+            ('payment', loan.agreement_id.borrower, reverse('loan-payments'),
+             {'loan': loan.agreement_id_id, 'payment_amount': str(loan.min_payment)})
+            for loan in loans
+        ]
+        approvals = [
+            ('approval', employee, reverse('loan-approves'), {
+                'agreement_id': application.application_id,
+                'lender': lender.id,
+                'interest_rate': '0.05',
+                'repayment_deadline': deadline,
+                'min_payment': str(application.loan_amount / 20),
+                'max_payment': str(application.loan_amount / 2),
+            })
+            for application in pending
+        ]
+        # Alternate the two kinds so both run concurrently with each other
+        work = [item for pair in zip_longest(payments, approvals) for item in pair if item is not None][:wanted]
+
+        results = {'payment': [], 'approval': []}
+        statuses = {'payment': Counter(), 'approval': Counter()}
+        lock = threading.Lock()
+
+        def run(items):
+            client = APIClient(raise_request_exception=False)
+            try:
+                for kind, user, url, data in items:
+                    client.force_authenticate(user=user)
+                    start = time.perf_counter()
+                    response = client.post(url, data, format='json')
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        results[kind].append(elapsed)
+                        statuses[kind][response.status_code] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=run, args=(work[index::threads],)) for index in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        wall = time.perf_counter() - start
+
+        report = {
+            'meta': {
+                'created': now().isoformat(),
+                'profile': getattr(settings, 'DB_PROFILE', connection.vendor),
+                'database': connection.vendor,
+                'threads': threads,
+                'requests': len(work),
+                'seconds': wall,
+                'throughput_rps': len(work) / wall if wall else 0,
+            },
+            'operations': {},
+        }
+        self.stdout.write(
+            f"{report['meta']['profile']}: {len(work)} writes from {threads} threads in {wall:.2f} s "
+            f"({report['meta']['throughput_rps']:.1f} req/s)"
+        )
+        for kind, timings in results.items():
+            if not timings:
+                continue
+            failed = sum(count for code, count in statuses[kind].items() if code >= 500)
+            report['operations'][kind] = {
+                'requests': len(timings),
+                'p50_ms': percentile(timings, 0.50) * 1000,
+                'p95_ms': percentile(timings, 0.95) * 1000,
+                'failed': failed,
+                'status': {str(code): count for code, count in sorted(statuses[kind].items())},
+            }
+            result = report['operations'][kind]
+            self.stdout.write(
+                f"  {kind:10} {result['requests']:6} requests  p50 {result['p50_ms']:9.2f} ms  "
+                f"p95 {result['p95_ms']:9.2f} ms  failed {failed}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    def compare(self, report, paths):
+        reports = [report]
+        for path in paths:
+            with open(path) as f:
+                reports.append(json.load(f))
+
+        self.stdout.write(f"\n{'profile':16} {'req/s':>8} {'vs this':>8} {'payment p95':>12} {'approval p95':>13} {'failed':>7}")
+        for other in reports:
+            operations = other['operations']
+            ratio = other['meta']['throughput_rps'] / report['meta']['throughput_rps'] if report['meta']['throughput_rps'] else 0
+            self.stdout.write(
+                f"{other['meta']['profile']:16} {other['meta']['throughput_rps']:8.1f} {ratio:8.2f} "
+                f"{operations.get('payment', {}).get('p95_ms', 0):9.2f} ms {operations.get('approval', {}).get('p95_ms', 0):10.2f} ms "
+                f"{sum(operation['failed'] for operation in operations.values()):7}"
+            )
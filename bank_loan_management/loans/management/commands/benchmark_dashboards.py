@@ -0,0 +1,315 @@
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from loans.management.commands.benchmark_endpoints import percentile
+from loans.management.commands.generate_loan_data import BENCH_PASSWORD
+from loans.models import User
+
+ROLES = {'customer': User.UserRole.BORROWER, 'provider': User.UserRole.LENDER, 'employee': User.UserRole.STAFF}
+DEFAULT_MIX = 'customer=6,provider=3,employee=1'
+
+
+class HTTPClient:
+    """
+    A connection to the server under test, reopened after errors, and for
+    every request unless `keep_alive` is set.
+    """
+
+    def __init__(self, base_url, timeout, keep_alive=False):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise CommandError(f"Invalid --url '{base_url}'")
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port, self.prefix = parts.hostname, parts.port, parts.path.rstrip('/')
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.connection = None
+
+    def request(self, method, path, token=None, data=None):
+        """Return the status (0 if the request failed) and the decoded JSON body, or None."""
+        headers = {'Accept': 'application/json'}
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+        if token is not None:
+            headers['Authorization'] = f'Bearer {token}'
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        try:
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            if not self.keep_alive or response.getheader('Connection', '').lower() == 'close':
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, None
+        try:
+            return response.status, json.loads(content) if content else None
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Session:
+    """
+    The calls one dashboard visit makes, in the order the React pages make them.
+
+    Every method is a session for one role; `call` records each request and
+    returns its status and body.
+    """
+
+    def __init__(self, call, rng, write_share):
+        self.call = call
+        self.random = rng
+        self.write_share = write_share
+
+    def writes(self):
+        return self.random.random() < self.write_share
+
+    def customer(self):
+        # CustomerDashboard loads requests and loans, then payments, and may submit either form
+        status, data = self.call('GET', '/api/loan-requests/')
+        self.call('GET', '/api/loan-payments/')
+        loans = [loan for loan in (data or {}).get('loans', []) if not loan['fully_paid']] if status == 200 else []
+        if self.writes():
+            self.call('POST', '/api/loan-requests/', {
+                'loan_amount': self.random.randrange(500, 20000),
+                'terms_conditions': 'load test',
+            })
+        if loans and self.writes():
+            loan = self.random.choice(loans)
+            # As a string, so the server's Decimal() gets exactly min_payment and not its float
+            self.call('POST', '/api/loan-payments/', {'loan': loan['agreement_id'], 'payment_amount': str(loan['min_payment'])})
+
+    def provider(self):
+        # ProviderDashboard loads funds and loans and may add funds
+        self.call('GET', '/api/funds/')
+        if self.writes():
+            self.call('POST', '/api/funds/', {'total_funds': str(self.random.randrange(1000, 50000))})
+
+    def employee(self):
+        # EmployeeDashboard loads the pending requests and may approve one
+        status, data = self.call('GET', '/api/loan-approves/')
+        pending = (data or {}).get('requests', []) if status == 200 else []
+        if pending and self.writes():
+            request = self.random.choice(pending)
+            amount = Decimal(request['loan_amount'])
+            # Without a lender the server matches one
+            self.call('POST', '/api/loan-approves/', {
+                'agreement_id': request['application_id'],
+                'interest_rate': 0.05,
+                'repayment_deadline': (now().date() + timedelta(days=365)).isoformat(),
+                'min_payment': float(amount / 20),
+                'max_payment': float(amount / 2),
+            })
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a running server with concurrent user sessions modelled on the dashboards of '
+        'the React app, logging in as the users of a generate_loan_data dataset. Reports '
+        'throughput, latency percentiles and error rates per endpoint. Sessions write, so use a '
+        'disposable dataset, and turn throttling off on the server (THROTTLE_ENABLED=false) unless '
+        'it is part of the test.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help='Base URL of the server under test.')
+        parser.add_argument('--prefix', default='bench', help='Username prefix used by generate_loan_data.')
+        parser.add_argument('--password', default=BENCH_PASSWORD)
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent sessions.')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run.')
+        parser.add_argument('--sessions', type=int, help='Stop after this many sessions instead.')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Relative weights of the customer, provider and employee sessions.')
+        parser.add_argument('--write-share', type=float, default=0.2,
+                            help='Chance that a session submits each of its forms.')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Mean seconds a user waits between requests, exponentially distributed.')
+        parser.add_argument('--users', type=int, default=200, help='Users of each role to log in as.')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a request fails.')
+        # runserver writes headers and body separately without TCP_NODELAY, so on a
+        # kept-alive connection every response waits out the client's delayed ACK
+        parser.add_argument('--keep-alive', action='store_true',
+                            help='Reuse connections, as browsers do. Leave off against runserver, which '
+                                 'then adds about 40 ms to every response.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+
+    def parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            role, _, weight = part.partition('=')
+            if role.strip() not in ROLES:
+                raise CommandError(f"Unknown role '{role}' in --mix; use {', '.join(ROLES)}")
+            try:
+                mix[role.strip()] = float(weight)
+            except ValueError:
+                raise CommandError(f"Invalid weight in --mix '{part}'")
+        if not any(weight > 0 for weight in mix.values()) or any(weight < 0 for weight in mix.values()):
+            raise CommandError('--mix needs a positive weight')
+        return {role: weight for role, weight in mix.items() if weight > 0}
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        if options['sessions'] is not None and options['sessions'] < 1:
+            raise CommandError('--sessions must be at least 1')
+        mix = self.parse_mix(options['mix'])
+        prefix = options['prefix']
+        users = {
+            role: list(
+                User.objects.filter(username__startswith=f'{prefix}_', role=ROLES[role], deleted_at__isnull=True)
+                .order_by('id').values_list('username', flat=True)[:options['users']]
+            )
+            for role in mix
+        }
+        missing = [role for role, names in users.items() if not names]
+        if missing:
+            raise CommandError(f"No '{prefix}' {' or '.join(missing)} users; run generate_loan_data first.")
+
+        self.url = options['url']
+        self.password = options['password']
+        self.timeout = options['timeout']
+        self.think_time = options['think_time']
+        self.tokens = {}
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+        stop_at = time.perf_counter() + options['duration']
+        remaining = [options['sessions']]
+        roles, weights = list(mix), list(mix.values())
+
+        def next_session():
+            with self.lock:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return False
+                    remaining[0] -= 1
+            return time.perf_counter() < stop_at
+
+        def work(seed):
+            rng = random.Random(seed)
+            client = HTTPClient(self.url, self.timeout, options['keep_alive'])
+            try:
+                while next_session():
+                    role = rng.choices(roles, weights)[0]
+                    username = rng.choice(users[role])
+                    token = self.token(client, username)
+                    if token is None:
+                        continue
+                    session = Session(lambda method, path, data=None: self.call(client, rng, token, method, path, data),
+                                      rng, options['write_share'])
+                    getattr(session, role)()
+            finally:
+                client.close()
+
+        workers = [
+            threading.Thread(target=work, args=(options['seed'] * 1000 + index,))
+            for index in range(options['workers'])
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        wall = time.perf_counter() - start
+
+        report = self.report(wall, options)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+    def record(self, endpoint, elapsed, status):
+        with self.lock:
+            self.timings[endpoint].append(elapsed)
+            self.statuses[endpoint][status] += 1
+
+    def token(self, client, username):
+        # Like the app, every user logs in once and keeps their access token
+        token = self.tokens.get(username)
+        if token is None:
+            start = time.perf_counter()
+            status, data = client.request('POST', '/api/token/', data={'username': username, 'password': self.password})
+            self.record('POST /api/token/', time.perf_counter() - start, status)
+            if status != 200 or not data:
+                return None
+            token = self.tokens[username] = data['access']
+        return token
+
+    def call(self, client, rng, token, method, path, data=None):
+        # Think times come from the worker's seeded generator too, so --seed reproduces them
+        if self.think_time:
+            time.sleep(rng.expovariate(1 / self.think_time))
+        start = time.perf_counter()
+        status, body = client.request(method, path, token, data)
+        self.record(f'{method} {path}', time.perf_counter() - start, status)
+        return status, body
+
+    def report(self, wall, options):
+        total = sum(len(timings) for timings in self.timings.values())
+        report = {
+            'meta': {
+                'created': now().isoformat(),
+                'url': self.url,
+                'workers': options['workers'],
+                'mix': options['mix'],
+                'requests': total,
+                'seconds': wall,
+                'throughput_rps': total / wall if wall else 0,
+            },
+            'endpoints': {},
+        }
+        self.stdout.write(
+            f"{total} requests from {options['workers']} workers in {wall:.2f} s "
+            f"({report['meta']['throughput_rps']:.1f} req/s)"
+        )
+        self.stdout.write(
+            f"  {'endpoint':28} {'requests':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'max ms':>9} {'4xx':>6} {'5xx':>6} {'failed':>6}"
+        )
+        for endpoint, timings in sorted(self.timings.items()):
+            statuses = self.statuses[endpoint]
+            client_errors = sum(count for code, count in statuses.items() if 400 <= code < 500)
+            server_errors = sum(count for code, count in statuses.items() if code >= 500)
+            # Connection errors and timeouts
+            failed = statuses[0]
+            result = report['endpoints'][endpoint] = {
+                'requests': len(timings),
+                'throughput_rps': len(timings) / wall if wall else 0,
+                'p50_ms': percentile(timings, 0.50) * 1000,
+                'p95_ms': percentile(timings, 0.95) * 1000,
+                'p99_ms': percentile(timings, 0.99) * 1000,
+                'max_ms': max(timings) * 1000,
+                'client_errors': client_errors,
+                'server_errors': server_errors,
+                'failed': failed,
+                'error_rate': (server_errors + failed) / len(timings),
+                'status': {str(code): count for code, count in sorted(statuses.items())},
+            }
+            self.stdout.write(
+                f"  {endpoint:28} {result['requests']:8} {result['throughput_rps']:8.1f} {result['p50_ms']:9.2f} "
+                f"{result['p95_ms']:9.2f} {result['p99_ms']:9.2f} {result['max_ms']:9.2f} "
+                f"{client_errors:6} {server_errors:6} {failed:6}"
+            )
+        return report
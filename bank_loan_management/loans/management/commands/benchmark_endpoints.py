@@ -0,0 +1,256 @@
+import json
+import platform
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from loans import urls
+from loans.models import LoanAgreement, LoanApplication, User
+from loans.management.commands.generate_loan_data import BENCH_PASSWORD
+
+METRICS_TOKEN = 'benchmark'
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every route in loans/urls.py through the test client against the current '
+        'database (see generate_loan_data). Reports p50/p95 latency, SQL query count and peak '
+        'Python memory per endpoint. Writes are rolled back after each request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='bench', help='Username prefix used by generate_loan_data.')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', help='Write the results as a JSON baseline to this file.')
+        parser.add_argument('--compare', help='Compare the results against a JSON baseline.')
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help='Flag endpoints whose p95 latency grew by more than this factor.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    # The test client sends Host: testserver, which the test runner normally allows.
+    # Throttling is off so the benchmark measures the endpoints themselves.
+    @override_settings(ALLOWED_HOSTS=['testserver'], THROTTLE_ENABLED=False, METRICS_TOKEN=METRICS_TOKEN)
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        self.fixtures = self.load_fixtures(options['prefix'])
+
+        scenarios = self.scenarios()
+        routes = {pattern.name for pattern in urls.urlpatterns}
+        missing = routes - {scenario[1] for scenario in scenarios.values()}
+        if missing:
+            raise CommandError(f"No benchmark scenario for routes: {', '.join(sorted(missing))}")
+
+        results = {}
+        for name, scenario in scenarios.items():
+            results[name] = self.measure(*scenario, iterations=options['iterations'])
+            self.stdout.write(
+                f"{name:32} p50 {results[name]['p50_ms']:9.2f} ms  p95 {results[name]['p95_ms']:9.2f} ms  "
+                f"queries {results[name]['queries']:4}  peak {results[name]['peak_kb']:9.1f} KiB  "
+                f"status {results[name]['status']}"
+            )
+
+        report = {
+            'meta': {
+                'created': now().isoformat(),
+                'iterations': options['iterations'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'rows': {
+                    'applications': LoanApplication.objects.count(),
+                    'agreements': LoanAgreement.objects.count(),
+                },
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Saved baseline to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = self.compare(baseline['endpoints'], results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} endpoint(s) regressed: {', '.join(regressions)}")
+
+    def load_fixtures(self, prefix):
+        try:
+            lender = User.objects.filter(username__startswith=f'{prefix}_lender_').order_by('id')[0]
+            employee = User.objects.get(username=f'{prefix}_employee')
+        except (IndexError, User.DoesNotExist):
+            raise CommandError(f"No '{prefix}' dataset found; run generate_loan_data first.")
+
+        loan = (
+            LoanAgreement.objects
+            .filter(agreement_id__borrower__username__startswith=f'{prefix}_borrower_', fully_paid=False)
+            .select_related('agreement_id__borrower')
+            .order_by('agreement_id')
+            .first()
+        )
+        pending = (
+            LoanApplication.objects
+            .filter(borrower__username__startswith=f'{prefix}_borrower_', approved=False)
+            .order_by('application_id')
+            .first()
+        )
+        if loan is None or pending is None:
+            raise CommandError('The dataset needs at least one open agreement and one pending application.')
+        return {
+            'lender': lender,
+            'employee': employee,
+            'borrower': loan.agreement_id.borrower,
+            'loan': loan,
+            'pending': pending,
+        }
+
+    def scenarios(self):
+        f = self.fixtures
+        deadline = (now() + timedelta(days=365)).strftime('%Y-%m-%d')
+        approval = {
+            'agreement_id': f['pending'].application_id,
+            'lender': f['lender'].id,
+            'interest_rate': '0.05',
+            'repayment_deadline': deadline,
+            'min_payment': str(f['pending'].loan_amount / 20),
+            'max_payment': str(f['pending'].loan_amount / 2),
+        }
+        matched_approval = {key: value for key, value in approval.items() if key != 'lender'}
+        payment = {'loan': f['loan'].agreement_id_id, 'payment_amount': str(f['loan'].min_payment)}
+
+        def delete_user(client):
+            user = User.objects.create(username='benchmark_delete_me', role=User.UserRole.BORROWER)
+            return {'id': user.id}
+
+        def bulk_delete_users(client):
+            users = User.objects.bulk_create(
+                User(username=f'benchmark_bulk_delete_{n}', role=User.UserRole.BORROWER) for n in range(10)
+            )
+            return {'ids': [user.id for user in users]}
+
+        def delete_request(client):
+            request = LoanApplication.objects.create(
+                borrower=f['borrower'], loan_amount=1000, terms_conditions='benchmark'
+            )
+            return {'loanRequestId': request.application_id}
+
+        # name: (method, url name, user or None, request data or a callable returning it[, url kwargs])
+        return {
+            'token POST': ('post', 'token_obtain_pair', None,
+                           {'username': f['borrower'].username, 'password': BENCH_PASSWORD}),
+            'funds GET (lender)': ('get', 'funds', f['lender'], None),
+            'funds POST': ('post', 'funds', f['lender'], {'total_funds': '100.00'}),
+            'portfolio GET': ('get', 'portfolio', f['lender'], None),
+            'users GET': ('get', 'users', f['employee'], None),
+            'users DELETE': ('delete', 'users', f['employee'], delete_user),
+            'users search GET': ('get', 'users', f['employee'], {'search': 'bench', 'role': User.UserRole.BORROWER}),
+            'users bulk DELETE': ('delete', 'users-bulk', f['employee'], bulk_delete_users),
+            'loan-requests GET (borrower)': ('get', 'loan-requests', f['borrower'], None),
+            'loan-requests GET (employee)': ('get', 'loan-requests', f['employee'], None),
+            'loan-requests POST': ('post', 'loan-requests', f['borrower'],
+                                   {'loan_amount': '1000', 'terms_conditions': 'benchmark'}),
+            'loan-requests DELETE': ('delete', 'loan-requests', f['borrower'], delete_request),
+            'loan-approves GET': ('get', 'loan-approves', f['employee'], None),
+            'loan-approves POST': ('post', 'loan-approves', f['employee'], approval),
+            'loan-approves bulk POST': ('post', 'loan-approves-bulk', f['employee'],
+                                        {'mode': 'per_item', 'approvals': [approval]}),
+            'loan-approves POST (matched)': ('post', 'loan-approves', f['employee'], matched_approval),
+            'loan-approves match GET': ('get', 'loan-approves-match', f['employee'], None),
+            'loan-payments GET': ('get', 'loan-payments', f['borrower'], None),
+            'loan-payments POST': ('post', 'loan-payments', f['borrower'], payment),
+            'loan-payments bulk POST': ('post', 'loan-payments-bulk', f['borrower'], [payment] * 10),
+            'loan-schedule GET': ('get', 'loan-schedule', f['borrower'], None, {'agreement_id': f['loan'].agreement_id_id}),
+            'loan-history GET': ('get', 'loan-history', f['borrower'], None, {'agreement_id': f['loan'].agreement_id_id}),
+            'loans-archive GET (lender)': ('get', 'loans-archive', f['lender'], None),
+            'portfolio-schedule GET': ('get', 'portfolio-schedule', f['lender'], None),
+            'loans-export GET (lender)': ('get', 'loans-export', f['lender'], None),
+            'loan-payments-export GET': ('get', 'loan-payments-export', f['employee'], {'type': 'ndjson'}),
+            'loan-payments-export GET (gzip)': ('get', 'loan-payments-export', f['employee'], {'compress': 'gzip'}),
+            'metrics GET': ('get', 'metrics', None, None),
+        }
+
+    def request(self, client, method, url, data):
+        """Run one request inside a transaction that is always rolled back."""
+        try:
+            with transaction.atomic():
+                if callable(data):
+                    data = data(client)
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(url, data, format='json')
+                    if response.streaming:
+                        for _ in response.streaming_content:
+                            pass
+                    elapsed = time.perf_counter() - start
+                raise Rollback((response, elapsed, len(context.captured_queries)))
+        except Rollback as result:
+            return result.args[0]
+
+    def measure(self, method, url_name, user, data, url_kwargs=None, *, iterations):
+        url = reverse(url_name, kwargs=url_kwargs)
+        client = APIClient(raise_request_exception=False)
+        if user is not None:
+            client.force_authenticate(user=user)
+        elif url_name == 'metrics':
+            # Scraped like Prometheus does, with the token handle() sets
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {METRICS_TOKEN}')
+
+        self.request(client, method, url, data)  # warm up caches and connections
+        timings = []
+        statuses = set()
+        for _ in range(iterations):
+            response, elapsed, queries = self.request(client, method, url, data)
+            timings.append(elapsed)
+            statuses.add(response.status_code)
+
+        # Memory is traced in a separate run because tracemalloc slows every allocation down
+        tracemalloc.start()
+        try:
+            self.request(client, method, url, data)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'queries': queries,
+            'peak_kb': peak / 1024,
+            'status': sorted(statuses),
+        }
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        self.stdout.write(f"\n{'endpoint':32} {'p95 ratio':>10} {'queries':>12}")
+        for name, result in results.items():
+            old = baseline.get(name)
+            if old is None:
+                self.stdout.write(f'{name:32} {"new":>10}')
+                continue
+            ratio = result['p95_ms'] / old['p95_ms'] if old['p95_ms'] else float('inf')
+            regressed = ratio > threshold or result['queries'] > old['queries']
+            line = f"{name:32} {ratio:10.2f} {old['queries']:5} -> {result['queries']:<4}"
+            if regressed:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + ' REGRESSION'))
+            else:
+                self.stdout.write(line)
+        return regressions
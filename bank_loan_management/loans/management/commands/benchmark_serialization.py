@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from loans import rendering, serializers
+from loans.models import LoanAgreement, LoanApplication, LoanPayment, User
+
+# name: (serializer class, fast encoder, queryset)
+CASES = {
+    'loans': (serializers.LoanSerializer, serializers.LOAN_ENCODER, LoanAgreement.objects.order_by('agreement_id')),
+    'loan requests': (serializers.LoanRequestSerializer, serializers.LOAN_REQUEST_ENCODER,
+                      LoanApplication.objects.order_by('application_id')),
+    'payments': (serializers.PaymentSerializer, serializers.PAYMENT_ENCODER, LoanPayment.objects.order_by('payment_id')),
+    'users': (serializers.BankUserSerializer, serializers.BANK_USER_ENCODER, User.objects.order_by('id')),
+}
+
+
+def best_of(repeat, func):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the list serializers against the fast .values_list() encoders used by the GET '
+        'endpoints on the current database (see generate_loan_data), including the query, and '
+        'check that both produce the same bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50000, help='Rows per case.')
+        parser.add_argument('--repeat', type=int, default=3, help='Report the best of this many runs.')
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1 or options['repeat'] < 1:
+            raise CommandError('--limit and --repeat must be at least 1')
+        renderer = JSONRenderer()
+
+        for name, (serializer_class, encoder, queryset) in CASES.items():
+            queryset = queryset[:options['limit']]
+            slow, expected = best_of(
+                options['repeat'], lambda: renderer.render(serializer_class(queryset.all(), many=True).data)
+            )
+            fast, actual = best_of(options['repeat'], lambda: rendering.render(encoder.encode_queryset(queryset.all())))
+            if actual != expected:
+                raise CommandError(f'The fast encoder output for {name} differs from {serializer_class.__name__}')
+
+            rows = queryset.count()
+            speedup = slow / fast if fast else float('inf')
+            self.stdout.write(
+                f'{name:14} {rows:7} rows  serializer {slow * 1000:9.2f} ms  '
+                f'fast path {fast * 1000:9.2f} ms  {speedup:6.1f}x'
+            )
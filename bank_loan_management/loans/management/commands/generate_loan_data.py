@@ -0,0 +1,127 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from loans.models import FundingAccount, LoanAgreement, LoanApplication, LoanPayment, User
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+BENCH_PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset of users, funding accounts, loan applications, '
+        'agreements and payments for benchmarking.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='10k',
+                            help="Number of loan applications: 10k, 100k, 1m or a plain integer.")
+        parser.add_argument('--prefix', default='bench', help='Username prefix of the generated users.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        size = options['size'].lower()
+        try:
+            applications = SIZES[size] if size in SIZES else int(size)
+        except ValueError:
+            raise CommandError(f"Invalid size '{options['size']}'")
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('This database backend does not return ids from bulk inserts.')
+
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Users with prefix '{prefix}_' already exist; pick another --prefix.")
+
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        self.today = now().date()
+
+        lenders, borrowers = self.create_users(prefix, applications)
+        counts = {'users': len(lenders) + len(borrowers) + 1, 'applications': 0, 'agreements': 0, 'payments': 0}
+        for start in range(0, applications, self.batch_size):
+            chunk = min(self.batch_size, applications - start)
+            with transaction.atomic():
+                self.create_loans(chunk, lenders, borrowers, counts)
+            self.stdout.write(f"  {counts['applications']}/{applications} applications", ending='\r')
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {users} users, {applications} applications, {agreements} agreements '
+            'and {payments} payments.'.format(**counts)
+        ))
+
+    def create_users(self, prefix, applications):
+        # Hashing once keeps generation fast; every generated user shares BENCH_PASSWORD
+        password = make_password(BENCH_PASSWORD)
+        lender_count = max(1, applications // 100)
+        borrower_count = max(1, applications // 5)
+
+        User.objects.create(username=f'{prefix}_employee', password=password, role=User.UserRole.STAFF)
+        lenders = self.create_role(prefix, 'lender', User.UserRole.LENDER, lender_count, password)
+        borrowers = self.create_role(prefix, 'borrower', User.UserRole.BORROWER, borrower_count, password)
+        for start in range(0, len(lenders), self.batch_size):
+            FundingAccount.objects.bulk_create([
+                FundingAccount(lender_id=pk, total_funds=Decimal('10000000.00'))
+                for pk in lenders[start:start + self.batch_size]
+            ])
+        return lenders, borrowers
+
+    def create_role(self, prefix, name, role, count, password):
+        pks = []
+        for start in range(0, count, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{prefix}_{name}_{i}', password=password, role=role)
+                    for i in range(start, min(count, start + self.batch_size))
+                ])
+            pks += [user.pk for user in users]
+        return pks
+
+    def create_loans(self, count, lenders, borrowers, counts):
+        rand = self.random
+        applications = LoanApplication.objects.bulk_create([
+            LoanApplication(
+                borrower_id=rand.choice(borrowers),
+                loan_amount=Decimal(rand.randrange(1000, 50000)),
+                terms_conditions='Synthetic benchmark loan',
+                approved=rand.random() < 0.7,
+            )
+            for _ in range(count)
+        ], batch_size=self.batch_size)
+
+        agreements = []
+        payments = []
+        for application in applications:
+            if not application.approved:
+                continue
+            interest_rate = Decimal(rand.randrange(1, 30)) / 100
+            agreement = LoanAgreement(
+                agreement_id=application,
+                lender_id=rand.choice(lenders),
+                repayment_deadline=self.today + timedelta(days=rand.randrange(-365, 1095)),
+                payment_due_date=self.today + timedelta(days=rand.randrange(-60, 60)),
+                interest_rate=interest_rate,
+                min_payment=(application.loan_amount / 20).quantize(Decimal('0.01')),
+                max_payment=(application.loan_amount / 2).quantize(Decimal('0.01')),
+            )
+            total_due = application.loan_amount * (1 + interest_rate)
+            for _ in range(rand.randrange(0, 6)):
+                amount = agreement.min_payment
+                if agreement.total_paid + amount > total_due:
+                    break
+                agreement.total_paid += amount
+                payments.append(LoanPayment(loan=agreement, payment_amount=amount))
+            agreement.fully_paid = agreement.total_paid >= total_due
+            agreements.append(agreement)
+
+        LoanAgreement.objects.bulk_create(agreements, batch_size=self.batch_size)
+        LoanPayment.objects.bulk_create(payments, batch_size=self.batch_size)
+        counts['applications'] += len(applications)
+        counts['agreements'] += len(agreements)
+        counts['payments'] += len(payments)
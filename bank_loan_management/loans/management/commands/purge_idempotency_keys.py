@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from loans.idempotency import IDEMPOTENCY_TTL, purge_expired
+
+
+class Command(BaseCommand):
+    help = f'Delete stored Idempotency-Key responses older than {IDEMPOTENCY_TTL}.'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
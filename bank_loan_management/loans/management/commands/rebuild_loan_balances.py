@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from loans.balances import rebuild_balances
+from loans.models import LoanAgreement
+
+
+class Command(BaseCommand):
+    help = 'Recompute total_paid and fully_paid on every LoanAgreement from its payment history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loan', type=int, action='append', dest='loans',
+                            help='Only rebuild this agreement id (may be repeated).')
+
+    def handle(self, *args, **options):
+        agreements = LoanAgreement.objects.all()
+        if options['loans']:
+            agreements = agreements.filter(agreement_id__in=options['loans'])
+        updated = rebuild_balances(agreements)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt balances for {updated} loan agreements.'))
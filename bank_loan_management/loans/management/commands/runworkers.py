@@ -0,0 +1,77 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from loans.jobs import Worker, get_queues
+
+
+def _work(queues, poll_interval, burst):
+    # Stop taking jobs on Ctrl-C or SIGTERM, but finish the ones in progress
+    worker = Worker(queues, poll_interval=poll_interval)
+    previous = {number: signal.signal(number, lambda *args: worker.stop()) for number in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        worker.run(burst=burst)
+    finally:
+        for number, handler in previous.items():
+            signal.signal(number, handler)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background jobs from the job table. Every queue gets a pool of threads as large as '
+        'its concurrency limit in JOB_QUEUES; --processes runs several such workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', default=[], metavar='NAME[=THREADS]',
+                            help='Work this queue, optionally with its own limit. Repeatable; defaults to JOB_QUEUES.')
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when no job is due.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queues are empty.')
+
+    def parse_queues(self, values):
+        configured = get_queues()
+        if not values:
+            return dict(configured)
+        queues = {}
+        for value in values:
+            name, _, threads = value.partition('=')
+            try:
+                queues[name] = int(threads) if threads else configured.get(name, 1)
+            except ValueError:
+                raise CommandError(f"Invalid --queue '{value}'")
+            if queues[name] < 1:
+                raise CommandError(f"Queue '{name}' needs at least one thread")
+        return queues
+
+    def handle(self, *args, **options):
+        queues = self.parse_queues(options['queue'])
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        self.stdout.write(
+            f"Working {', '.join(f'{name} ({threads})' for name, threads in queues.items())} "
+            f"in {options['processes']} process(es)"
+        )
+
+        if options['processes'] == 1:
+            _work(queues, options['poll_interval'], options['burst'])
+            return
+
+        # Forked workers must not share the parent's connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_work, args=(queues, options['poll_interval'], options['burst']))
+            for _ in range(options['processes'])
+        ]
+        for process in workers:
+            process.start()
+        # Ctrl-C reaches the whole process group and SIGTERM is passed on; either
+        # way the parent waits for the workers to finish their jobs.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda *args: [process.terminate() for process in workers])
+        for process in workers:
+            process.join()
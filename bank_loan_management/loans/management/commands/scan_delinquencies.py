@@ -0,0 +1,33 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from loans.delinquency import scan
+
+
+class Command(BaseCommand):
+    help = (
+        'Flag open loan agreements that are past their due date or deadline, or behind on '
+        'min_payment, and clear the flag on agreements that have caught up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Scan chunks in this many worker processes (0 scans in-process).')
+        parser.add_argument('--date', help='Scan as of this date (YYYY-MM-DD) instead of today.')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else now().date()
+        except ValueError:
+            raise CommandError('--date must be in YYYY-MM-DD format')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        result = scan(today, chunk_size=options['chunk_size'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {result.scanned} agreements as of {today}: {result.overdue} overdue, '
+            f'{result.behind} behind on payments, {result.flagged} newly flagged, {result.cleared} cleared.'
+        ))
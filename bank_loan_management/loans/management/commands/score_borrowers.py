@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.credit import SCORE_CHUNK_SIZE, score_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the credit score of every borrower from their applications, loans and payments. '
+        'Scores are also refreshed by background jobs as loans and payments change.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SCORE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        start = time.perf_counter()
+        result = score_all(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Scored {result.borrowers} borrowers in {elapsed:.1f}s.'))
@@ -0,0 +1,135 @@
+"""
+Lender matching for loan approvals.
+
+LenderIndex keeps the funding accounts of all lenders in memory in a
+SortedList of (total_funds, lender_id), so the lender for a loan is found
+with a binary search and a lender's balance is updated in O(log n). The
+policy is best fit: the lender with the least funds that still cover the
+loan, leaving the large balances for large loans.
+
+The index is only a guide. Funds are always taken with the conditional UPDATE
+in funds.debit() or under the row locks of bulk.approve_loans(), so a stale
+entry can make an approval pick another lender but never overdraw one.
+Writes in this process mark the lenders they touched as stale once they
+commit, and those are re-read in one query on the next lookup. The whole
+index is reloaded every INDEX_MAX_AGE seconds to pick up writes from other
+processes.
+"""
+import threading
+import time
+
+from django.db import transaction
+from sortedcontainers import SortedList
+
+from .models import FundingAccount
+
+INDEX_MAX_AGE = 60
+# Past this many stale lenders a full reload is cheaper than an IN query
+MAX_STALE_REFRESH = 500
+
+
+def _best_fit(entries, amount, exclude=()):
+    position = entries.bisect_left((amount,))
+    while position < len(entries):
+        lender_id = entries[position][1]
+        if lender_id not in exclude:
+            return position
+        position += 1
+    return None
+
+
+class LenderIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = SortedList()
+        self._funds = {}
+        self._stale = set()
+        self._loaded_at = None
+
+    def reset(self):
+        """Forget everything; the next lookup reloads the index."""
+        with self._lock:
+            self._loaded_at = None
+
+    def mark_stale(self, *lender_ids):
+        with self._lock:
+            self._stale.update(lender_ids)
+
+    def invalidate(self, *lender_ids):
+        """Mark these lenders stale once the current transaction commits."""
+        transaction.on_commit(lambda: self.mark_stale(*lender_ids))
+
+    def _accounts(self):
+        return FundingAccount.objects.filter(lender__role=1, lender__deleted_at__isnull=True).values_list('lender_id', 'total_funds')
+
+    def _refresh(self):
+        # Called with the lock held
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > INDEX_MAX_AGE or len(self._stale) > MAX_STALE_REFRESH:
+            self._funds = dict(self._accounts())
+            self._entries = SortedList((funds, lender_id) for lender_id, funds in self._funds.items())
+            self._stale.clear()
+            self._loaded_at = time.monotonic()
+            return
+        if not self._stale:
+            return
+
+        stale, self._stale = self._stale, set()
+        current = dict(self._accounts().filter(lender_id__in=stale))
+        for lender_id in stale:
+            self._set(lender_id, current.get(lender_id))
+
+    def _set(self, lender_id, funds):
+        # Called with the lock held; None removes the lender
+        old = self._funds.pop(lender_id, None)
+        if old is not None:
+            self._entries.remove((old, lender_id))
+        if funds is not None:
+            self._funds[lender_id] = funds
+            self._entries.add((funds, lender_id))
+
+    def propose(self, amount, exclude=()):
+        """Return the best-fit lender for a loan of `amount`, or None if no lender can fund it."""
+        with self._lock:
+            self._refresh()
+            position = _best_fit(self._entries, amount, exclude)
+            return None if position is None else self._entries[position][1]
+
+    def plan(self, amounts, reserved=None):
+        """
+        Match a queue of loans in one pass.
+
+        Each loan takes the best fit against the balances left after the
+        earlier loans in `amounts` and after `reserved`, a {lender_id: amount}
+        of funds the caller is spending otherwise in the same batch, so the
+        plan never spends a lender's funds twice. Returns the lender id, or
+        None, for every amount in order.
+        """
+        lenders = []
+        with self._lock:
+            self._refresh()
+            # The running balances are applied to the index itself and undone
+            # afterwards, instead of planning on a copy of every entry
+            before = {}
+
+            def spend(lender_id, amount):
+                funds = self._funds[lender_id]
+                before.setdefault(lender_id, funds)
+                self._set(lender_id, funds - amount)
+
+            try:
+                for lender_id, amount in (reserved or {}).items():
+                    if lender_id in self._funds:
+                        spend(lender_id, amount)
+                for amount in amounts:
+                    position = _best_fit(self._entries, amount)
+                    lender_id = None if position is None else self._entries[position][1]
+                    if lender_id is not None:
+                        spend(lender_id, amount)
+                    lenders.append(lender_id)
+            finally:
+                for lender_id, funds in before.items():
+                    self._set(lender_id, funds)
+        return lenders
+
+
+index = LenderIndex()
@@ -0,0 +1,122 @@
+"""
+Request metrics in the Prometheus text exposition format.
+
+The histograms live in the memory of each process and are labelled with the
+view name from the URLconf and the HTTP method. With several worker processes
+every process exposes its own numbers, so scrape them individually.
+"""
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+BYTES = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=('view', 'method')):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._lock = threading.Lock()
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+
+    def observe(self, label_values, value):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][position] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((values, list(counts), total) for values, (counts, total) in self._series.items())
+        for values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=('view', 'method', 'status')):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labels, labels)} {value}' for labels, value in values)
+        return lines
+
+
+REQUEST_DURATION = Histogram('loans_request_duration_seconds', 'Wall time spent handling requests.', SECONDS)
+SQL_QUERIES = Histogram('loans_request_sql_queries', 'SQL queries issued per request.', QUERIES)
+SQL_DURATION = Histogram('loans_request_sql_duration_seconds', 'Time spent in SQL per request.', SECONDS)
+RESPONSE_SIZE = Histogram('loans_response_size_bytes', 'Size of response bodies.', BYTES)
+RESPONSES = Counter('loans_responses_total', 'Responses by status code.')
+
+REGISTRY = (REQUEST_DURATION, SQL_QUERIES, SQL_DURATION, RESPONSE_SIZE, RESPONSES)
+
+
+def observe(view, method, status, duration, queries, sql_duration, size):
+    labels = (view, method)
+    REQUEST_DURATION.observe(labels, duration)
+    SQL_QUERIES.observe(labels, queries)
+    SQL_DURATION.observe(labels, sql_duration)
+    RESPONSE_SIZE.observe(labels, size)
+    RESPONSES.inc((view, method, str(status)))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for metric in REGISTRY:
+        metric.clear()
@@ -0,0 +1,128 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, routing
+
+logger = logging.getLogger('loans.slow_requests')
+
+# Clients can send any method, so others share one label value
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting the queries of one request and the
+    time spent in them. With `capture` it also keeps the SQL statements.
+    """
+
+    def __init__(self, capture=False):
+        self.capture = capture
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if self.capture:
+                self.statements.append((elapsed, sql, params))
+
+    def install(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def remove(self):
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+class RequestProfilingMiddleware:
+    """
+    Record wall time, SQL query count, SQL time and response size of every
+    request in the metrics histograms, labelled with the view name and the
+    method, or 'other' for methods outside METHODS.
+
+    Setting SLOW_REQUEST_THRESHOLD_MS turns on a log (loans.slow_requests)
+    of every slower request together with the SQL it issued. The statements
+    are only kept while it is on.
+
+    Streaming responses are measured when the last chunk has been sent, so
+    the queries made while streaming are counted too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+        recorder = QueryRecorder(capture=threshold is not None)
+        start = time.perf_counter()
+        recorder.install()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            recorder.remove()
+            raise
+
+        if response.streaming:
+            content = response.streaming_content
+            response.streaming_content = self._stream(request, response, content, recorder, start, threshold)
+        else:
+            recorder.remove()
+            self._finish(request, response, recorder, start, threshold, len(response.content))
+        return response
+
+    def _stream(self, request, response, content, recorder, start, threshold):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            recorder.remove()
+            self._finish(request, response, recorder, start, threshold, size)
+
+    def _finish(self, request, response, recorder, start, threshold, size):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+        method = request.method if request.method in METHODS else 'other'
+        metrics.observe(view, method, response.status_code, duration, recorder.count, recorder.duration, size)
+
+        if threshold is not None and duration * 1000 >= threshold:
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s',
+                request.method, request.get_full_path(), view, duration * 1000,
+                recorder.count, recorder.duration * 1000,
+                '\n'.join(f'  [{elapsed * 1000:.1f} ms] {sql} {params!r}' for elapsed, sql, params in recorder.statements),
+            )
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin a user who wrote to the database during the request to the primary,
+    so their next reads do not miss the write on a lagging replica.
+
+    DRF puts the user it authenticated on the Django request, which is what
+    makes it visible here.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing.start_request()
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if routing.wrote() and routing.replicas() and user is not None and user.is_authenticated:
+            routing.pin(user.id)
+        return response
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+
+
+def backfill_total_paid(apps, schema_editor):
+    LoanAgreement = apps.get_model('loans', 'LoanAgreement')
+    LoanPayment = apps.get_model('loans', 'LoanPayment')
+    paid = (
+        LoanPayment.objects
+        .filter(loan=OuterRef('pk'))
+        .order_by()
+        .values('loan')
+        .annotate(total=Sum('payment_amount'))
+        .values('total')
+    )
+    LoanAgreement.objects.filter(pk__in=LoanPayment.objects.values('loan')).update(total_paid=Subquery(paid))
+    LoanAgreement.objects.filter(
+        total_paid__gte=F('agreement_id__loan_amount') * (1 + F('interest_rate'))
+    ).update(fully_paid=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanagreement',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AlterField(
+            model_name='loanagreement',
+            name='lender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='loanapplication',
+            name='borrower',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='loanpayment',
+            name='loan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='loans.loanagreement'),
+        ),
+        migrations.RunPython(backfill_total_paid, migrations.RunPython.noop),
+    ]
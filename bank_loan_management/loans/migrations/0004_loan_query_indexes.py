@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_loanagreement_total_paid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loanagreement',
+            name='lender',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='loanpayment',
+            name='loan',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='loans.loanagreement'),
+        ),
+        migrations.AddIndex(
+            model_name='loanagreement',
+            index=models.Index(fields=['lender', 'agreement_id'], name='loanagr_lender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanagreement',
+            index=models.Index(condition=models.Q(('fully_paid', False)), fields=['repayment_deadline'], name='loanagr_open_deadline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(condition=models.Q(('approved', False)), fields=['application_id'], name='loanapp_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanapplication',
+            index=models.Index(condition=models.Q(('approved', False)), fields=['borrower', 'application_id'], name='loanapp_borrower_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanpayment',
+            index=models.Index(fields=['loan', 'payment_date'], name='loanpay_loan_date_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_loan_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanagreement',
+            name='delinquent',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='loanagreement',
+            name='delinquent_since',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
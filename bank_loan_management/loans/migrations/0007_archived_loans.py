@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0006_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoanAgreement',
+            fields=[
+                ('agreement_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('application_date', models.DateField()),
+                ('loan_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('terms_conditions', models.TextField(max_length=1000)),
+                ('approval_date', models.DateField()),
+                ('repayment_deadline', models.DateField()),
+                ('interest_rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('payment_due_date', models.DateField(null=True)),
+                ('min_payment', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('max_payment', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('delinquent', models.BooleanField(default=False)),
+                ('delinquent_since', models.DateField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('borrower', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_borrowed_loans', to=settings.AUTH_USER_MODEL)),
+                ('lender', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_lent_loans', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedLoanPayment',
+            fields=[
+                ('payment_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('payment_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('payment_date', models.DateField()),
+                ('loan', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='loans.archivedloanagreement')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedloanagreement',
+            index=models.Index(fields=['borrower', 'agreement_id'], name='archagr_borrower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedloanagreement',
+            index=models.Index(fields=['lender', 'agreement_id'], name='archagr_lender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedloanpayment',
+            index=models.Index(fields=['loan', 'payment_date'], name='archpay_loan_date_idx'),
+        ),
+    ]
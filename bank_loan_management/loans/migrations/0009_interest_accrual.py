@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0008_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanagreement',
+            name='accrued_interest',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='loanagreement',
+            name='accrued_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InterestAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accrual_date', models.DateField()),
+                ('accrued_interest', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('loan', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='loans.loanagreement')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('loan', 'accrual_date'), name='accrual_loan_date_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0010_user_directory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditScore',
+            fields=[
+                ('borrower', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_score', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('score', models.PositiveSmallIntegerField()),
+                ('applications', models.PositiveIntegerField(default=0)),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('paid_loans', models.PositiveIntegerField(default=0)),
+                ('open_loans', models.PositiveIntegerField(default=0)),
+                ('delinquent_loans', models.PositiveIntegerField(default=0)),
+                ('payments', models.PositiveIntegerField(default=0)),
+                ('late_payments', models.PositiveIntegerField(default=0)),
+                ('exposure', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -17,6 +17,8 @@ class User(AbstractUser, PermissionsMixin):
     date_joined = models.DateTimeField(default=timezone.now)
     role = models.IntegerField(choices=UserRole.choices, default=UserRole.LENDER)
     username = models.CharField(max_length=50, unique=True)
+    # Set when the user is deleted; the row itself goes once their data is purged
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -38,6 +40,12 @@ class User(AbstractUser, PermissionsMixin):
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['role']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # The directory filtered by role, paged by id
+            models.Index(fields=['role', 'id'], name='user_role_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -49,12 +57,21 @@ class LoanApplication(models.Model):
     terms_conditions = models.TextField(max_length=1000)
     approved = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Pending requests are always filtered with approved=False, which SQLite
+            # renders as NOT approved, so partial indexes serve them better than a
+            # composite on the boolean column.
+            models.Index(fields=['application_id'], condition=models.Q(approved=False), name='loanapp_pending_idx'),
+            models.Index(fields=['borrower', 'application_id'], condition=models.Q(approved=False), name='loanapp_borrower_pending_idx'),
+        ]
+
     def __str__(self):
         return f"LoanApplication {self.application_id} by {self.borrower}"
 
 class LoanAgreement(models.Model):
     agreement_id = models.OneToOneField(LoanApplication, on_delete=models.CASCADE, primary_key=True)
-    lender = models.ForeignKey(User, on_delete=models.CASCADE)
+    lender = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # Covered by loanagr_lender_idx
     approval_date = models.DateField(auto_now_add=True)
     repayment_deadline = models.DateField()
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
@@ -62,22 +79,169 @@ class LoanAgreement(models.Model):
     fully_paid = models.BooleanField(default=False)
     min_payment = models.DecimalField(max_digits=12, decimal_places=2)
     max_payment = models.DecimalField(max_digits=12, decimal_places=2)
+    total_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    delinquent = models.BooleanField(default=False)
+    delinquent_since = models.DateField(null=True, blank=True)
+    accrued_interest = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    accrued_through = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lender', 'agreement_id'], name='loanagr_lender_idx'),
+            models.Index(fields=['repayment_deadline'], condition=models.Q(fully_paid=False), name='loanagr_open_deadline_idx'),
+        ]
+
+    @property
+    def total_due(self):
+        return self.agreement_id.loan_amount * (1 + self.interest_rate)
+
+    @property
+    def outstanding_balance(self):
+        return self.total_due - self.total_paid
 
     def __str__(self):
         return f"LoanAgreement {self.agreement_id}"
 
 class LoanPayment(models.Model):
     payment_id = models.AutoField(primary_key=True)
-    loan = models.ForeignKey(LoanAgreement, on_delete=models.CASCADE)
+    loan = models.ForeignKey(LoanAgreement, on_delete=models.CASCADE, db_index=False)  # Covered by loanpay_loan_date_idx
     payment_amount = models.DecimalField(max_digits=12, decimal_places=2)
     payment_date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'payment_date'], name='loanpay_loan_date_idx'),
+        ]
+
     def __str__(self):
         return f"Payment {self.payment_id} for Loan {self.loan.agreement_id}"
 
+class InterestAccrual(models.Model):
+    """Interest accrued on a loan as of one day, written by loans.accrual."""
+    loan = models.ForeignKey(LoanAgreement, on_delete=models.CASCADE, db_index=False)  # Covered by the unique constraint
+    accrual_date = models.DateField()
+    accrued_interest = models.DecimalField(max_digits=15, decimal_places=2)  # Since approval
+    interest = models.DecimalField(max_digits=15, decimal_places=2)  # Since the previous snapshot
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'accrual_date'], name='accrual_loan_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"InterestAccrual of Loan {self.loan_id} on {self.accrual_date}"
+
 class FundingAccount(models.Model):
     lender = models.OneToOneField(User, related_name='funding_account', on_delete=models.CASCADE, primary_key=True)
     total_funds = models.DecimalField(max_digits=15, decimal_places=2, default=0.00)
 
     def __str__(self):
         return f"FundingAccount for {self.lender.username}"
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)  # Covered by the unique constraint
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"IdempotencyKey {self.key} of {self.user_id}"
+
+class ArchivedLoanAgreement(models.Model):
+    """
+    A fully paid agreement together with its application, moved out of the
+    live tables by loans.archive. Keeps the ids of the originals.
+    """
+    agreement_id = models.IntegerField(primary_key=True)
+    borrower = models.ForeignKey(User, related_name='archived_borrowed_loans', on_delete=models.CASCADE, db_index=False)  # Covered by archagr_borrower_idx
+    lender = models.ForeignKey(User, related_name='archived_lent_loans', on_delete=models.CASCADE, db_index=False)  # Covered by archagr_lender_idx
+    application_date = models.DateField()
+    loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    terms_conditions = models.TextField(max_length=1000)
+    approval_date = models.DateField()
+    repayment_deadline = models.DateField()
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    payment_due_date = models.DateField(null=True)
+    min_payment = models.DecimalField(max_digits=12, decimal_places=2)
+    max_payment = models.DecimalField(max_digits=12, decimal_places=2)
+    total_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    delinquent = models.BooleanField(default=False)
+    delinquent_since = models.DateField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['borrower', 'agreement_id'], name='archagr_borrower_idx'),
+            models.Index(fields=['lender', 'agreement_id'], name='archagr_lender_idx'),
+        ]
+
+    def __str__(self):
+        return f"ArchivedLoanAgreement {self.agreement_id}"
+
+class ArchivedLoanPayment(models.Model):
+    payment_id = models.IntegerField(primary_key=True)
+    loan = models.ForeignKey(ArchivedLoanAgreement, related_name='payments', on_delete=models.CASCADE, db_index=False)  # Covered by archpay_loan_date_idx
+    payment_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    payment_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'payment_date'], name='archpay_loan_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"ArchivedPayment {self.payment_id} for Loan {self.loan_id}"
+
+class Job(models.Model):
+    """A background task waiting for, or being run by, a worker of loans.jobs."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    queue = models.CharField(max_length=50)
+    task = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Workers claim the due jobs of one queue in run_at order
+            models.Index(fields=['queue', 'run_at'], condition=models.Q(status='pending'), name='job_pending_idx'),
+            models.Index(fields=['locked_at'], condition=models.Q(status='running'), name='job_running_idx'),
+            models.Index(fields=['locked_by'], condition=models.Q(status='running'), name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.task} ({self.status})"
+
+class CreditScore(models.Model):
+    """The features and credit score of a borrower, written by loans.credit."""
+    borrower = models.OneToOneField(User, related_name='credit_score', on_delete=models.CASCADE, primary_key=True)
+    score = models.PositiveSmallIntegerField()
+    applications = models.PositiveIntegerField(default=0)
+    loans = models.PositiveIntegerField(default=0)
+    paid_loans = models.PositiveIntegerField(default=0)
+    open_loans = models.PositiveIntegerField(default=0)
+    delinquent_loans = models.PositiveIntegerField(default=0)
+    payments = models.PositiveIntegerField(default=0)
+    late_payments = models.PositiveIntegerField(default=0)
+    exposure = models.DecimalField(max_digits=15, decimal_places=2, default=0)  # Still owed on open loans
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"CreditScore {self.score} of {self.borrower_id}"
@@ -0,0 +1,40 @@
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def get_page_size(request):
+    # Falls back to the default on anything that is not a positive integer
+    try:
+        page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    if page_size <= 0:
+        return DEFAULT_PAGE_SIZE
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def get_cursor(request, name):
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def keyset_page(queryset, key, cursor, page_size):
+    """
+    Return one page of `queryset` ordered by `key` and the cursor of the next page.
+
+    Pages are selected with `key > cursor` instead of OFFSET, so the cost of a page
+    stays the same no matter how deep into the table it is. The queryset may also
+    be a .values_list() whose first column is `key`.
+    """
+    if cursor is not None:
+        queryset = queryset.filter(**{f'{key}__gt': cursor})
+    rows = list(queryset.order_by(key)[:page_size + 1])
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = last[0] if isinstance(last, tuple) else last.pk
+    return rows, next_cursor
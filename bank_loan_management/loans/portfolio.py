@@ -0,0 +1,121 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.utils.timezone import now
+
+from .models import ArchivedLoanAgreement, FundingAccount, LoanAgreement
+
+CACHE_TIMEOUT = 300
+GENERATION_KEY = 'loans:portfolio:generation'
+
+# (name, first day, last day) relative to today, for open loans by repayment deadline
+MATURITY_BUCKETS = (
+    ('overdue', None, -1),
+    ('due_0_30_days', 0, 30),
+    ('due_31_90_days', 31, 90),
+    ('due_91_365_days', 91, 365),
+    ('due_after_365_days', 366, None),
+)
+
+MONEY = DecimalField(max_digits=17, decimal_places=2)
+
+
+def _cache_key(lender_id):
+    generation = cache.get_or_set(GENERATION_KEY, 0, None)
+    return f'loans:portfolio:{generation}:{lender_id}:{now().date().isoformat()}'
+
+
+def invalidate(*lender_ids):
+    """
+    Drop the cached summaries of these lenders once the current transaction
+    commits, so a concurrent reader cannot cache the pre-commit state again.
+    """
+    transaction.on_commit(lambda: cache.delete_many([_cache_key(lender_id) for lender_id in lender_ids]))
+
+
+def _bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def invalidate_all():
+    """Drop every cached summary, for writes that cannot tell which lenders they touched."""
+    transaction.on_commit(_bump_generation)
+
+
+def _money(value):
+    return (value or Decimal('0')).quantize(Decimal('0.01'))
+
+
+def compute_summary(lender_id):
+    """
+    Summarise a lender's portfolio with one aggregate query over its agreements,
+    one over its archived agreements and one lookup of its funding account.
+    Archived loans are fully paid, so they only add to the lifetime totals.
+    """
+    today = now().date()
+    is_open = Q(fully_paid=False)
+    principal = F('agreement_id__loan_amount')
+    # Under the flat interest model each payment repays principal and interest
+    # in the ratio 1 : interest_rate.
+    repaid_principal = ExpressionWrapper(F('total_paid') / (1 + F('interest_rate')), output_field=MONEY)
+
+    buckets = {}
+    for name, first, last in MATURITY_BUCKETS:
+        condition = is_open
+        if first is not None:
+            condition &= Q(repayment_deadline__gte=today + timedelta(days=first))
+        if last is not None:
+            condition &= Q(repayment_deadline__lte=today + timedelta(days=last))
+        buckets[name] = Count('agreement_id', filter=condition)
+
+    totals = LoanAgreement.objects.filter(lender_id=lender_id).aggregate(
+        loans=Count('agreement_id'),
+        open_loans=Count('agreement_id', filter=is_open),
+        principal_lent=Sum(principal, output_field=MONEY),
+        outstanding_principal=Sum(
+            ExpressionWrapper(principal - repaid_principal, output_field=MONEY), filter=is_open
+        ),
+        expected_interest=Sum(ExpressionWrapper(principal * F('interest_rate'), output_field=MONEY)),
+        amount_repaid=Sum('total_paid'),
+        accrued_interest=Sum('accrued_interest', filter=is_open),
+        **buckets,
+    )
+    archived = ArchivedLoanAgreement.objects.filter(lender_id=lender_id).aggregate(
+        loans=Count('agreement_id'),
+        principal_lent=Sum('loan_amount'),
+        expected_interest=Sum(ExpressionWrapper(F('loan_amount') * F('interest_rate'), output_field=MONEY)),
+        amount_repaid=Sum('total_paid'),
+    )
+    available_funds = (
+        FundingAccount.objects.filter(lender_id=lender_id).values_list('total_funds', flat=True).first()
+    )
+
+    return {
+        'lender': lender_id,
+        'available_funds': _money(available_funds),
+        'loans': totals['loans'] + archived['loans'],
+        'open_loans': totals['open_loans'],
+        'principal_lent': _money(totals['principal_lent']) + _money(archived['principal_lent']),
+        'outstanding_principal': _money(totals['outstanding_principal']),
+        'expected_interest': _money(totals['expected_interest']) + _money(archived['expected_interest']),
+        'amount_repaid': _money(totals['amount_repaid']) + _money(archived['amount_repaid']),
+        'accrued_interest': _money(totals['accrued_interest']),
+        'overdue_loans': totals['overdue'],
+        'maturity_distribution': {name: totals[name] for name, _, _ in MATURITY_BUCKETS},
+    }
+
+
+def get_summary(lender_id):
+    """Return the lender's summary from the cache, computing it on a miss."""
+    key = _cache_key(lender_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_summary(lender_id)
+        cache.set(key, summary, CACHE_TIMEOUT)
+    return summary
@@ -0,0 +1,170 @@
+"""
+Fast JSON encoding for the list endpoints.
+
+A RowEncoder is built once per serializer class. It looks at the serializer's
+fields a single time and picks a converter that turns each database value
+straight into JSON text, so listing rows only needs a .values_list() query and
+one string format per row instead of a model instance and a pass through the
+DRF field machinery.
+
+The text is byte-identical to what JSONRenderer produces from the
+serializer's .data. The converters mirror the fields' to_representation(),
+and keys, separators and escaping follow the JSONRenderer settings.
+Serializers with fields that have no converter are rejected when the encoder
+is built rather than encoded differently.
+"""
+import json
+from decimal import Decimal, getcontext
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from rest_framework import ISO_8601, fields, relations
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+ITEM_SEPARATOR, KEY_SEPARATOR = SHORT_SEPARATORS if JSONRenderer.compact else LONG_SEPARATORS
+_encode_string = encode_basestring_ascii if JSONRenderer.ensure_ascii else encode_basestring
+
+
+class RawJSON(str):
+    """Text that is already encoded JSON and is embedded by dumps() as is."""
+
+
+def _dumps_plain(value):
+    return json.dumps(
+        value, cls=JSONRenderer.encoder_class, ensure_ascii=JSONRenderer.ensure_ascii,
+        allow_nan=not JSONRenderer.strict, separators=(ITEM_SEPARATOR, KEY_SEPARATOR),
+    )
+
+
+def dumps(value):
+    """Encode `value` like JSONRenderer, embedding any RawJSON in it unchanged."""
+    if isinstance(value, RawJSON):
+        return value
+    if isinstance(value, dict):
+        return '{' + ITEM_SEPARATOR.join(
+            _encode_string(str(key)) + KEY_SEPARATOR + dumps(item) for key, item in value.items()
+        ) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ITEM_SEPARATOR.join(dumps(item) for item in value) + ']'
+    return _dumps_plain(value)
+
+
+def render(value):
+    """Return the bytes JSONRenderer would render for `value`, see dumps()."""
+    # JSONRenderer escapes these two so the output is also valid JavaScript
+    return dumps(value).replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def _decimal_converter(field):
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+        return None
+    if field.localize or field.normalize_output:
+        return None
+    if field.decimal_places is None:
+        return lambda value: f'"{Decimal(value):f}"'
+
+    quantum = Decimal('.1') ** field.decimal_places
+    context = getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+    return lambda value: f'"{value.quantize(quantum, rounding=rounding, context=context):f}"'
+
+
+def _converter(field):
+    """Return a function encoding a database value as `field` would, or None."""
+    if isinstance(field, fields.BooleanField):
+        return lambda value: 'true' if value else 'false'
+    if isinstance(field, fields.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: _dumps_plain(choices.get(str(value), value))
+    if isinstance(field, fields.IntegerField):
+        return lambda value: str(int(value))
+    if isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+        return str
+    if isinstance(field, fields.FloatField):
+        return lambda value: float.__repr__(float(value))
+    if isinstance(field, fields.DecimalField):
+        return _decimal_converter(field)
+    if isinstance(field, fields.DateField):
+        if getattr(field, 'format', api_settings.DATE_FORMAT).lower() != ISO_8601:
+            return None
+        return lambda value: f'"{value.isoformat()}"'
+    if isinstance(field, fields.CharField):
+        return lambda value: _encode_string(str(value))
+    return None
+
+
+def _nullable(convert):
+    return lambda value: 'null' if value is None else convert(value)
+
+
+class RowEncoder:
+    """
+    Encodes rows of `serializer_class.Meta.model` as that serializer would.
+
+    `columns` are the arguments for .values_list() and the rows passed to
+    encode() must be tuples in that order.
+    """
+
+    def __init__(self, serializer_class):
+        serializer_fields = [field for field in serializer_class().fields.values() if not field.write_only]
+        converters = []
+        for field in serializer_fields:
+            convert = _converter(field)
+            if convert is None or field.source == '*' or '.' in field.source:
+                raise TypeError(f'{serializer_class.__name__}.{field.field_name} has no fast encoder')
+            converters.append(_nullable(convert) if field.allow_null else convert)
+
+        self.columns = tuple(field.source for field in serializer_fields)
+        self.field_names = tuple(field.field_name for field in serializer_fields)
+        self.converters = tuple(converters)
+        self.template = '{' + ITEM_SEPARATOR.join(
+            (_encode_string(field.field_name) + KEY_SEPARATOR).replace('%', '%%') + '%s'
+            for field in serializer_fields
+        ) + '}'
+
+    def encode(self, row):
+        return self.template % tuple([convert(value) for convert, value in zip(self.converters, row)])
+
+    def encode_rows(self, rows):
+        return RawJSON('[' + ITEM_SEPARATOR.join(map(self.encode, rows)) + ']')
+
+    def encode_queryset(self, queryset):
+        return self.encode_rows(queryset.values_list(*self.columns))
+
+
+class EncodedResponse(Response):
+    """
+    A Response whose JSON body has been rendered up front with render().
+
+    JSON requests get the text as is. Anything else, such as the browsable
+    API or an indented JSON request, and any access to .data, works from the
+    parsed text.
+    """
+
+    def __init__(self, data, **kwargs):
+        self.encoded = render(data)
+        self._data = None
+        super().__init__(**kwargs)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.encoded)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        renderer = getattr(self, 'accepted_renderer', None)
+        context = getattr(self, 'renderer_context', None)
+        if type(renderer) is not JSONRenderer or renderer.get_indent(self.accepted_media_type, context or {}) is not None:
+            return super().rendered_content
+        self['Content-Type'] = self.content_type or renderer.media_type
+        return self.encoded
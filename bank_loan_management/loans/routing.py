@@ -0,0 +1,88 @@
+"""
+Read-replica routing.
+
+Views decorated with @replica_reads run their queries against one of the
+DATABASE_REPLICAS aliases; everything else, including every write, uses the
+primary. Reads inside a transaction on the primary stay on the primary.
+
+Replicas lag behind the primary, so a user who has just written is pinned to
+the primary for REPLICA_STICKY_SECONDS and sees their own writes. Writes are
+noticed by the router and the pin is set by ReplicaPinningMiddleware once the
+request is done. Pins live in Django's default cache, which therefore has to
+be shared by every worker process (CACHE_URL): with a per-process cache, a
+write handled by one process does not pin the reads another one serves. The
+loans.E002 check refuses replicas without a shared cache.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PINNED_KEY = 'loans:replica-pin:{}'
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin(user_id):
+    """Send reads of this user to the primary for the next REPLICA_STICKY_SECONDS."""
+    cache.set(PINNED_KEY.format(user_id), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return cache.get(PINNED_KEY.format(user_id), False)
+
+
+def start_request():
+    _state.wrote = False
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def replica_reads(view_method):
+    """Run a read-only handler against a replica unless the user is pinned to the primary."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        aliases = replicas()
+        if not aliases or is_pinned(request.user.id):
+            return view_method(self, request, *args, **kwargs)
+        previous = getattr(_state, 'replica', None)
+        _state.replica = random.choice(aliases)
+        try:
+            return view_method(self, request, *args, **kwargs)
+        finally:
+            _state.replica = previous
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = getattr(_state, 'replica', None)
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
@@ -1,3 +1,5 @@
+import time
+
 from rest_framework.serializers import (
     ModelSerializer,
     IntegerField,
@@ -5,12 +7,14 @@ from rest_framework.serializers import (
     FloatField,
     BooleanField,
     CharField,
+    DecimalField,
     RelatedField
 )
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model  # Import the correct user model
 
 from .models import *
+from . import rendering
 
 # Get the user model
 User = get_user_model()
@@ -23,6 +27,8 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         if hasattr(user, 'role'):  # Check if the user model has 'role'
             token['role'] = user.role
         token['is_admin'] = user.is_superuser
+        # Copied into every access token refreshed from this one, see revoke_user()
+        token['auth_time'] = time.time()
         return token
 
 class FundSerializer(ModelSerializer):
@@ -68,7 +74,59 @@ class LoanRequestSerializer(ModelSerializer):
             'approved'
         )
 
+class PendingRequestSerializer(LoanRequestSerializer):
+    # Annotated by credit.with_scores(); None until the borrower has been scored
+    credit_score = IntegerField(read_only=True, allow_null=True)
+    borrower_loans = IntegerField(read_only=True, allow_null=True)
+    borrower_late_payments = IntegerField(read_only=True, allow_null=True)
+    borrower_exposure = DecimalField(max_digits=15, decimal_places=2, read_only=True, allow_null=True)
+
+    class Meta(LoanRequestSerializer.Meta):
+        fields = LoanRequestSerializer.Meta.fields + (
+            'credit_score',
+            'borrower_loans',
+            'borrower_late_payments',
+            'borrower_exposure',
+        )
+
 class PaymentSerializer(ModelSerializer):
     class Meta:
         model = LoanPayment
         fields = '__all__'
+
+class ArchivedLoanSerializer(ModelSerializer):
+    interest_rate = FloatField()
+    min_payment = FloatField()
+    max_payment = FloatField()
+
+    class Meta:
+        model = ArchivedLoanAgreement
+        fields = (
+            'agreement_id',
+            'borrower',
+            'lender',
+            'application_date',
+            'loan_amount',
+            'approval_date',
+            'repayment_deadline',
+            'interest_rate',
+            'min_payment',
+            'max_payment',
+            'total_paid',
+        )
+
+class ArchivedPaymentSerializer(ModelSerializer):
+    class Meta:
+        model = ArchivedLoanPayment
+        fields = '__all__'
+
+
+# Encoders for the list endpoints. They produce the same JSON as the serializers
+# above from .values_list() rows, without building model instances.
+LOAN_ENCODER = rendering.RowEncoder(LoanSerializer)
+LOAN_REQUEST_ENCODER = rendering.RowEncoder(LoanRequestSerializer)
+PENDING_REQUEST_ENCODER = rendering.RowEncoder(PendingRequestSerializer)
+PAYMENT_ENCODER = rendering.RowEncoder(PaymentSerializer)
+BANK_USER_ENCODER = rendering.RowEncoder(BankUserSerializer)
+ARCHIVED_LOAN_ENCODER = rendering.RowEncoder(ArchivedLoanSerializer)
+ARCHIVED_PAYMENT_ENCODER = rendering.RowEncoder(ArchivedPaymentSerializer)
@@ -0,0 +1,53 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import matching, portfolio
+from .authentication import revoke_user
+from .models import FundingAccount, LoanAgreement, LoanPayment, User
+
+# Queryset update(), bulk_create() and bulk_update() do not send these signals;
+# the code paths using them invalidate the portfolio cache themselves.
+
+
+@receiver([post_save, post_delete], sender=LoanPayment)
+def payment_changed(sender, instance, **kwargs):
+    if LoanPayment.loan.is_cached(instance):
+        lender_id = instance.loan.lender_id
+    else:
+        lender_id = LoanAgreement.objects.filter(pk=instance.loan_id).values_list('lender_id', flat=True).first()
+    if lender_id is not None:
+        portfolio.invalidate(lender_id)
+
+
+@receiver([post_save, post_delete], sender=LoanAgreement)
+def agreement_changed(sender, instance, **kwargs):
+    portfolio.invalidate(instance.lender_id)
+
+
+@receiver([post_save, post_delete], sender=FundingAccount)
+def funding_account_changed(sender, instance, **kwargs):
+    portfolio.invalidate(instance.lender_id)
+    matching.index.invalidate(instance.lender_id)
+
+
+# Stateless authentication trusts the claims of a token until it expires, so
+# tokens of deleted or deactivated users, and tokens carrying a role the user
+# no longer has, have to be rejected explicitly.
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    revoke_user(instance.pk)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred role is not loaded for every instance
+    instance._saved_role = instance.__dict__.get('role')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    role = instance.__dict__.get('role')
+    role_changed = None not in (role, instance._saved_role) and role != instance._saved_role
+    if not created and (not instance.is_active or role_changed):
+        revoke_user(instance.pk)
+    instance._saved_role = role
@@ -1,15 +1,111 @@
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
+from django.test import LiveServerTestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from unittest import mock, skipUnless
+import csv
+import re
+import sqlite3
+import json
+import os
+import tempfile
+from django.db import connection, connections, transaction
+import threading
+import time
 from django.contrib.auth import get_user_model
-from .models import FundingAccount, LoanApplication, LoanAgreement, LoanPayment
+from .authentication import is_revoked
+from .models import ArchivedLoanAgreement, CreditScore, FundingAccount, IdempotencyKey, InterestAccrual, Job, LoanApplication, LoanAgreement, LoanPayment
+from . import accrual, amortization, archive, checks, credit, delinquency, directory, funds, idempotency, jobs, matching, metrics, rendering, routing, serializers, throttling
 from decimal import Decimal
-from datetime import datetime, timedelta
-from django.utils.timezone import make_aware
+from datetime import date, datetime, timedelta
+from django.utils.timezone import make_aware, now
 from django.db.models import Sum
+from django.core.management import CommandError, call_command
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
 
 User = get_user_model()
 
+# SQLite's in-memory test database reports lock contention instead of waiting,
+# so the threaded tests retry 500s like a client would, but only this often
+MAX_LOCK_RETRIES = 50
+
+
+def retry_locked(send):
+    """Call send() again while it returns a 500, at most MAX_LOCK_RETRIES times, and return the last response."""
+    response = send()
+    for attempt in range(1, MAX_LOCK_RETRIES + 1):
+        if response.status_code != 500:
+            break
+        # Back off a little more each time so a busy writer can finish
+        time.sleep(0.001 * attempt)
+        response = send()
+    return response
+
+
+def make_loan(lender, borrower, amount=Decimal('1000.00'), deadline=None, payments=(), approval_date=None, **fields):
+    """
+    Create an approved application of `borrower` funded by `lender`, and make
+    `payments` on it. The agreement is at 10% with payments of 100.00 to
+    600.00 due in 180 days unless `fields` say otherwise. The payments do not
+    update total_paid; pass it along if a test needs it.
+    """
+    application = LoanApplication.objects.create(
+        borrower=borrower, loan_amount=Decimal(amount), terms_conditions='6 months', approved=True
+    )
+    loan = LoanAgreement.objects.create(
+        agreement_id=application,
+        lender=lender,
+        repayment_deadline=deadline or date.today() + timedelta(days=180),
+        **{'interest_rate': Decimal('0.10'), 'min_payment': Decimal('100.00'), 'max_payment': Decimal('600.00'), **fields},
+    )
+    for payment in payments:
+        LoanPayment.objects.create(loan=loan, payment_amount=Decimal(payment))
+    if approval_date is not None:
+        # approval_date is set on insert, whatever the model is given
+        LoanAgreement.objects.filter(pk=loan.pk).update(approval_date=approval_date)
+        loan.approval_date = approval_date
+    return loan
+
+# Tasks for JobQueueTests; workers import them by name
+job_calls = []
+job_concurrency = {'running': 0, 'peak': 0}
+job_lock = threading.Lock()
+
+
+@jobs.task(queue='test')
+def record_job(value):
+    job_calls.append(value)
+
+
+@jobs.task(queue='test', max_attempts=2)
+def failing_job():
+    raise RuntimeError('boom')
+
+
+@jobs.task(queue='test')
+def slow_job(value):
+    with job_lock:
+        job_concurrency['running'] += 1
+        job_concurrency['peak'] = max(job_concurrency['peak'], job_concurrency['running'])
+    time.sleep(0.02)
+    with job_lock:
+        job_concurrency['running'] -= 1
+        job_calls.append(value)
+
+# Throttling budgets would carry over from test to test; ThrottlingTests turns it back on
+throttling_off = override_settings(THROTTLE_ENABLED=False)
+
+
+def setUpModule():
+    throttling_off.enable()
+
+
+def tearDownModule():
+    throttling_off.disable()
+
 class LoanManagementTests(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -160,3 +256,1908 @@ class LoanManagementTests(APITestCase):
 
 
   
+
+class LoanRequestPaginationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='page_lender', role=1)
+        self.borrower = User.objects.create_user(username='page_borrower', role=2)
+        self.other_borrower = User.objects.create_user(username='page_other', role=2)
+        self.employee = User.objects.create_user(username='page_employee', role=3)
+
+        self.own_requests = [
+            LoanApplication.objects.create(borrower=self.borrower, loan_amount=1000, terms_conditions='6 months')
+            for _ in range(5)
+        ]
+        LoanApplication.objects.create(borrower=self.other_borrower, loan_amount=1000, terms_conditions='6 months')
+        approved = LoanApplication.objects.create(
+            borrower=self.borrower, loan_amount=1000, terms_conditions='6 months', approved=True
+        )
+        LoanAgreement.objects.create(
+            agreement_id=approved,
+            lender=self.lender,
+            repayment_deadline=make_aware(datetime.now() + timedelta(days=180)).date(),
+            interest_rate=0.05,
+            min_payment=Decimal('100.00'),
+            max_payment=Decimal('500.00')
+        )
+
+    def test_borrower_only_sees_own_pending_requests(self):
+        self.client.force_authenticate(user=self.borrower)
+        response = self.client.get(reverse('loan-requests'), {'page_size': 50})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [r['application_id'] for r in response.data['loanRequests']],
+            [r.application_id for r in self.own_requests]
+        )
+        self.assertEqual(len(response.data['loans']), 1)
+        self.assertIsNone(response.data['nextRequestsCursor'])
+
+    def test_cursor_walks_all_pages(self):
+        self.client.force_authenticate(user=self.borrower)
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 2}
+            if cursor is not None:
+                params['requests_cursor'] = cursor
+            response = self.client.get(reverse('loan-requests'), params)
+            self.assertLessEqual(len(response.data['loanRequests']), 2)
+            seen += [r['application_id'] for r in response.data['loanRequests']]
+            cursor = response.data['nextRequestsCursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [r.application_id for r in self.own_requests])
+
+    def test_employee_sees_all_requests(self):
+        self.client.force_authenticate(user=self.employee)
+        response = self.client.get(reverse('loan-requests'))
+        self.assertEqual(len(response.data['loanRequests']), LoanApplication.objects.count())
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(user=self.borrower)
+        response = self.client.get(reverse('loan-requests'), {'requests_cursor': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class LoanBalanceTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='balance_lender', role=1)
+        self.borrower = User.objects.create_user(username='balance_borrower', role=2)
+        application = LoanApplication.objects.create(
+            borrower=self.borrower, loan_amount=1000, terms_conditions='6 months', approved=True
+        )
+        self.loan = LoanAgreement.objects.create(
+            agreement_id=application,
+            lender=self.lender,
+            repayment_deadline=make_aware(datetime.now() + timedelta(days=180)).date(),
+            interest_rate=Decimal('0.10'),
+            min_payment=Decimal('100.00'),
+            max_payment=Decimal('600.00')
+        )
+        self.client.force_authenticate(user=self.borrower)
+
+    def pay(self, amount):
+        return self.client.post(reverse('loan-payments'), {
+            'payment_amount': amount,
+            'loan': self.loan.agreement_id_id
+        })
+
+    def test_payments_update_running_balance(self):
+        self.assertEqual(self.pay('500.00').status_code, status.HTTP_200_OK)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.total_paid, Decimal('500.00'))
+        self.assertEqual(self.loan.outstanding_balance, Decimal('600.00'))
+        self.assertFalse(self.loan.fully_paid)
+
+    def test_final_payment_marks_loan_fully_paid(self):
+        self.pay('500.00')
+        self.assertEqual(self.pay('600.00').status_code, status.HTTP_200_OK)
+        self.loan.refresh_from_db()
+        self.assertTrue(self.loan.fully_paid)
+        self.assertEqual(self.pay('100.00').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_command_recomputes_from_history(self):
+        LoanPayment.objects.create(loan=self.loan, payment_amount=Decimal('600.00'))
+        LoanPayment.objects.create(loan=self.loan, payment_amount=Decimal('500.00'))
+        call_command('rebuild_loan_balances', stdout=StringIO())
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.total_paid, Decimal('1100.00'))
+        self.assertTrue(self.loan.fully_paid)
+
+class BulkPaymentTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='bulk_lender', role=1)
+        self.borrower = User.objects.create_user(username='bulk_borrower', role=2)
+        self.other_borrower = User.objects.create_user(username='bulk_other', role=2)
+        self.employee = User.objects.create_user(username='bulk_employee', role=3)
+        self.loans = [make_loan(self.lender, self.borrower) for _ in range(3)]
+        self.other_loan = make_loan(self.lender, self.other_borrower)
+
+    def test_json_batch_report(self):
+        self.client.force_authenticate(user=self.borrower)
+        loan_id = self.loans[0].agreement_id_id
+        payments = [
+            {'loan': loan_id, 'payment_amount': '600.00'},
+            {'loan': loan_id, 'payment_amount': '500.00'},
+            {'loan': loan_id, 'payment_amount': '100.00'},
+            {'loan': self.other_loan.agreement_id_id, 'payment_amount': '100.00'},
+            {'loan': 99999, 'payment_amount': '100.00'},
+            {'loan': loan_id, 'payment_amount': '50.00'},
+            {'loan': loan_id},
+        ]
+        response = self.client.post(reverse('loan-payments-bulk'), payments, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(
+            [entry.get('error') for entry in response.data['results']],
+            [None, None, 'Payment exceeds the due amount', 'Unauthorized loan access', 'Loan not found',
+             'Payment must be within the allowed range', 'Invalid data format or missing data']
+        )
+        self.loans[0].refresh_from_db()
+        self.assertEqual(self.loans[0].total_paid, Decimal('1100.00'))
+        self.assertTrue(self.loans[0].fully_paid)
+        self.assertEqual(LoanPayment.objects.filter(loan=self.loans[0]).count(), 2)
+
+    def test_csv_upload(self):
+        self.client.force_authenticate(user=self.borrower)
+        rows = ['loan,payment_amount'] + [f'{loan.agreement_id_id},200.00' for loan in self.loans + [self.other_loan]]
+        upload = SimpleUploadedFile('payments.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        response = self.client.post(reverse('loan-payments-bulk'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], 3)
+        self.assertEqual(response.data['results'][-1]['error'], 'Unauthorized loan access')
+        self.assertEqual(LoanPayment.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        self.client.force_authenticate(user=self.borrower)
+        payments = [{'loan': loan.agreement_id_id, 'payment_amount': '100.00'} for loan in self.loans] * 3
+        # Savepoint, loans, payments and totals; the score refresh is queued after the commit
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('loan-payments-bulk'), payments, format='json')
+        self.assertEqual(response.data['accepted'], 9)
+
+    def test_only_borrowers_can_post(self):
+        # Like the single payment endpoint, employees cannot pay other people's loans
+        for user in (self.lender, self.employee):
+            self.client.force_authenticate(user=user)
+            response = self.client.post(reverse('loan-payments-bulk'), [{'loan': self.loans[0].pk, 'payment_amount': '100.00'}], format='json')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(LoanPayment.objects.exists())
+
+class BulkApprovalTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='approve_lender', role=1)
+        self.poor_lender = User.objects.create_user(username='approve_poor', role=1)
+        self.borrower = User.objects.create_user(username='approve_borrower', role=2)
+        self.employee = User.objects.create_user(username='approve_employee', role=3)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('2500.00'))
+        FundingAccount.objects.create(lender=self.poor_lender, total_funds=Decimal('100.00'))
+        self.requests = [
+            LoanApplication.objects.create(borrower=self.borrower, loan_amount=1000, terms_conditions='6 months')
+            for _ in range(3)
+        ]
+        self.deadline = (datetime.now() + timedelta(days=180)).strftime('%Y-%m-%d')
+        self.client.force_authenticate(user=self.employee)
+
+    def approval(self, loan_request, lender):
+        return {
+            'agreement_id': loan_request.application_id,
+            'lender': lender.id,
+            'interest_rate': '0.05',
+            'repayment_deadline': self.deadline,
+            'min_payment': '100.00',
+            'max_payment': '500.00',
+        }
+
+    def test_per_item_approves_until_funds_run_out(self):
+        items = [self.approval(r, self.lender) for r in self.requests]
+        response = self.client.post(reverse('loan-approves-bulk'), {'mode': 'per_item', 'approvals': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['approved'], 2)
+        self.assertEqual(response.data['results'][2]['error'], 'Insufficient budget')
+        self.assertEqual(LoanAgreement.objects.count(), 2)
+        self.assertEqual(FundingAccount.objects.get(lender=self.lender).total_funds, Decimal('500.00'))
+        self.assertEqual(LoanApplication.objects.filter(approved=True).count(), 2)
+
+    def test_all_or_nothing_writes_nothing_on_failure(self):
+        items = [self.approval(self.requests[0], self.lender), self.approval(self.requests[1], self.poor_lender)]
+        response = self.client.post(reverse('loan-approves-bulk'), {'approvals': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([entry['status'] for entry in response.data['results']], ['skipped', 'rejected'])
+        self.assertEqual(LoanAgreement.objects.count(), 0)
+        self.assertEqual(FundingAccount.objects.get(lender=self.lender).total_funds, Decimal('2500.00'))
+
+    def test_duplicate_application_in_batch(self):
+        items = [self.approval(self.requests[0], self.lender)] * 2
+        response = self.client.post(reverse('loan-approves-bulk'), {'mode': 'per_item', 'approvals': items}, format='json')
+        self.assertEqual(response.data['results'][1]['error'], 'Request was already approved')
+        self.assertEqual(LoanAgreement.objects.count(), 1)
+
+    def test_only_employees(self):
+        self.client.force_authenticate(user=self.borrower)
+        response = self.client.post(reverse('loan-approves-bulk'), {'approvals': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class ConcurrentFundingTests(TransactionTestCase):
+    """
+    Hammer the funding and approval views from many threads at once and check
+    that no deposit is lost and no lender is overdrawn.
+    """
+    threads = 8
+
+    def setUp(self):
+        self.lender = User.objects.create_user(username='stress_lender', role=1)
+        self.employee = User.objects.create_user(username='stress_employee', role=3)
+        self.borrower = User.objects.create_user(username='stress_borrower', role=2)
+        self.deadline = (datetime.now() + timedelta(days=180)).strftime('%Y-%m-%d')
+
+    def run_concurrently(self, user, calls):
+        results = []
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def worker(batch):
+            # Errors are returned as 500s instead of raised: the test client collects
+            # raised exceptions through a global signal, so they would leak across threads
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(user=user)
+            barrier.wait()
+            try:
+                for method, url, data in batch:
+                    response = retry_locked(lambda: getattr(client, method)(url, data, format='json'))
+                    with lock:
+                        results.append(response.status_code)
+                        if response.status_code == 500:
+                            errors.append(response.content)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(calls[i::self.threads],)) for i in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [], f'Still failing after {MAX_LOCK_RETRIES} retries')
+        return results
+
+    def test_concurrent_deposits_are_not_lost(self):
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('0.00'))
+        calls = [('post', reverse('funds'), {'total_funds': '10.00'})] * (self.threads * 10)
+        results = self.run_concurrently(self.lender, calls)
+        self.assertEqual(results.count(200), len(calls))
+        self.assertEqual(FundingAccount.objects.get(lender=self.lender).total_funds, Decimal('10.00') * len(calls))
+
+    def test_concurrent_approvals_never_overdraw(self):
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('10000.00'))
+        requests = [
+            LoanApplication.objects.create(borrower=self.borrower, loan_amount=1000, terms_conditions='6 months')
+            for _ in range(self.threads * 4)
+        ]
+        calls = [('post', reverse('loan-approves'), {
+            'agreement_id': r.application_id,
+            'lender': self.lender.id,
+            'interest_rate': '0.05',
+            'repayment_deadline': self.deadline,
+            'min_payment': '100.00',
+            'max_payment': '500.00',
+        }) for r in requests]
+        # Every request is submitted twice to also race duplicate approvals
+        results = self.run_concurrently(self.employee, calls * 2)
+
+        self.assertEqual(results.count(201), 10)
+        self.assertEqual(LoanAgreement.objects.count(), 10)
+        self.assertEqual(LoanApplication.objects.filter(approved=True).count(), 10)
+        self.assertEqual(FundingAccount.objects.get(lender=self.lender).total_funds, Decimal('0.00'))
+
+class ConcurrentWriteBenchmarkTests(TransactionTestCase):
+    def test_benchmark_reports_both_operations(self):
+        call_command('generate_loan_data', size='200', batch_size=100, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'writes.json')
+            out = StringIO()
+            # One thread, as the in-memory test database reports contention as
+            # 500s, which would hide real server errors
+            call_command('benchmark_concurrent_writes', threads=1, requests=10, output=output, stdout=out)
+            call_command('benchmark_concurrent_writes', threads=1, requests=2, compare=[output], stdout=out)
+            with open(output) as f:
+                report = json.load(f)
+
+        self.assertEqual(report['meta']['requests'], 10)
+        self.assertEqual(set(report['operations']), {'payment', 'approval'})
+        for name, operation in report['operations'].items():
+            self.assertEqual(set(operation['status']) - {'200', '201'}, set(), name)
+            self.assertEqual(operation['failed'], 0, name)
+        self.assertIn('req/s', out.getvalue())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(APITestCase):
+    """
+    Run each view's queries through EXPLAIN QUERY PLAN and fail on any full
+    table scan, so a dropped or unusable index shows up as a test failure.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='plan_lender', role=1)
+        self.borrower = User.objects.create_user(username='plan_borrower', role=2)
+        self.employee = User.objects.create_user(username='plan_employee', role=3)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('10000.00'))
+        application = LoanApplication.objects.create(
+            borrower=self.borrower, loan_amount=1000, terms_conditions='6 months', approved=True
+        )
+        LoanApplication.objects.create(borrower=self.borrower, loan_amount=1000, terms_conditions='6 months')
+        self.loan = LoanAgreement.objects.create(
+            agreement_id=application,
+            lender=self.lender,
+            repayment_deadline=make_aware(datetime.now() + timedelta(days=180)).date(),
+            interest_rate=Decimal('0.05'),
+            min_payment=Decimal('100.00'),
+            max_payment=Decimal('500.00')
+        )
+        LoanPayment.objects.create(loan=self.loan, payment_amount=Decimal('100.00'))
+
+    def query_plans(self, statements):
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plans += [row[-1] for row in cursor.fetchall()]
+        return plans
+
+    def assertUsesIndexes(self, plans):
+        self.assertTrue(plans)
+        table_scans = [detail for detail in plans if re.fullmatch(r'SCAN \S+', detail)]
+        self.assertEqual(table_scans, [], plans)
+
+    def assertViewUsesIndexes(self, user, url_name):
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        selects = [(query['sql'], None) for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertUsesIndexes(self.query_plans(selects))
+
+    def test_borrower_loan_requests(self):
+        self.assertViewUsesIndexes(self.borrower, 'loan-requests')
+
+    def test_borrower_payments(self):
+        self.assertViewUsesIndexes(self.borrower, 'loan-payments')
+
+    def test_lender_funds(self):
+        self.assertViewUsesIndexes(self.lender, 'funds')
+
+    def test_pending_approvals(self):
+        self.assertViewUsesIndexes(self.employee, 'loan-approves')
+
+    def test_open_loans_by_deadline(self):
+        queryset = LoanAgreement.objects.filter(fully_paid=False, repayment_deadline__lt=datetime.now().date())
+        self.assertUsesIndexes(self.query_plans([queryset.query.sql_with_params()]))
+
+    def test_loan_payment_history(self):
+        queryset = LoanPayment.objects.filter(loan=self.loan).order_by('payment_date')
+        self.assertUsesIndexes(self.query_plans([queryset.query.sql_with_params()]))
+
+class BenchmarkCommandTests(APITestCase):
+    def test_generate_and_benchmark(self):
+        call_command('generate_loan_data', size='300', batch_size=100, stdout=StringIO())
+        self.assertEqual(LoanApplication.objects.count(), 300)
+        self.assertEqual(
+            LoanAgreement.objects.count(), LoanApplication.objects.filter(approved=True).count()
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            out = StringIO()
+            call_command('benchmark_endpoints', iterations=2, output=baseline, stdout=out)
+            with open(baseline) as f:
+                report = json.load(f)
+            call_command('benchmark_endpoints', iterations=2, compare=baseline, threshold=1000, stdout=out)
+
+        # Writes are rolled back, so the dataset is unchanged
+        self.assertEqual(LoanApplication.objects.count(), 300)
+        self.assertEqual(report['meta']['rows']['applications'], 300)
+        for name, result in report['endpoints'].items():
+            self.assertTrue(all(code < 500 for code in result['status']), name)
+            self.assertGreaterEqual(result['p95_ms'], result['p50_ms'])
+
+class AmortizationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='schedule_lender', role=1)
+        self.borrower = User.objects.create_user(username='schedule_borrower', role=2)
+        self.other_borrower = User.objects.create_user(username='schedule_other', role=2)
+        self.loans = [
+            make_loan(
+                self.lender, self.borrower, Decimal(amount), date.today() + timedelta(days=days),
+                interest_rate=Decimal(rate), min_payment=Decimal(low), max_payment=Decimal(high),
+            )
+            for amount, rate, days, low, high in [
+                ('1000.00', '0.10', 180, '100.00', '600.00'),
+                ('5000.00', '0.05', 365, '100.00', '1000.00'),
+                ('900.00', '0.20', 30, '50.00', '200.00'),
+            ]
+        ]
+
+    def test_schedules_add_up(self):
+        schedules = list(amortization.build_schedules(LoanAgreement.objects.all(), chunk_size=2))
+        self.assertEqual([s['agreement_id'] for s in schedules], [loan.pk for loan in self.loans])
+        for loan, schedule in zip(self.loans, schedules):
+            loan.refresh_from_db()
+            installments = schedule['installments']
+            self.assertEqual(sum(Decimal(i['payment']) for i in installments), loan.total_due)
+            self.assertEqual(sum(Decimal(i['principal']) for i in installments), loan.agreement_id.loan_amount)
+            self.assertEqual(installments[-1]['remaining_principal'], '0.00')
+            for installment in installments[:-1]:
+                self.assertTrue(loan.min_payment <= Decimal(installment['payment']) <= loan.max_payment)
+            due_dates = [i['due_date'] for i in installments]
+            self.assertEqual(due_dates, sorted(due_dates))
+
+    def test_max_payment_stretches_schedule(self):
+        # 900 * 1.2 = 1080 due within a month, but at most 200 per installment
+        schedule = amortization.build_schedule(self.loans[2].pk)
+        self.assertEqual([i['payment'] for i in schedule['installments']], ['200.00'] * 5 + ['80.00'])
+
+    def test_long_schedule_does_not_widen_chunk(self):
+        # 1000 * 1.1 at most 1.00 per installment is 1100 installments
+        long_loan = make_loan(
+            self.lender, self.borrower, deadline=date.today() + timedelta(days=30),
+            min_payment=Decimal('1.00'), max_payment=Decimal('1.00'),
+        )
+        widths = []
+        compute = amortization.compute_schedules
+
+        def recording(**arrays):
+            result = compute(**arrays)
+            widths.append((len(arrays['principal']), result['payment'].shape[1]))
+            return result
+
+        with mock.patch.object(amortization, 'compute_schedules', side_effect=recording):
+            schedules = list(amortization.build_schedules(LoanAgreement.objects.all()))
+        self.assertEqual([s['agreement_id'] for s in schedules], [loan.pk for loan in self.loans] + [long_loan.pk])
+        self.assertEqual(len(schedules[-1]['installments']), 1100)
+        self.assertIn((1, 1100), widths)
+        self.assertTrue(all(width < 1100 for rows, width in widths if rows > 1))
+        self.assertEqual(schedules[:3], [amortization.build_schedule(loan.pk) for loan in self.loans])
+
+    def test_schedule_endpoint_access(self):
+        url = reverse('loan-schedule', kwargs={'agreement_id': self.loans[0].pk})
+        self.client.force_authenticate(user=self.borrower)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['agreement_id'], self.loans[0].pk)
+
+        self.client.force_authenticate(user=self.other_borrower)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        missing = reverse('loan-schedule', kwargs={'agreement_id': 99999})
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_portfolio_export(self):
+        self.client.force_authenticate(user=self.lender)
+        response = self.client.get(reverse('portfolio-schedule'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['lender'], self.lender.id)
+        self.assertEqual([loan['agreement_id'] for loan in data['loans']], [loan.pk for loan in self.loans])
+        self.assertEqual(data['loans'][2], json.loads(rendering.render(amortization.build_schedule(self.loans[2].pk))))
+
+        self.client.force_authenticate(user=self.borrower)
+        self.assertEqual(self.client.get(reverse('portfolio-schedule')).status_code, status.HTTP_403_FORBIDDEN)
+
+class PortfolioSummaryTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='portfolio_lender', role=1)
+        self.borrower = User.objects.create_user(username='portfolio_borrower', role=2)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('5000.00'))
+        today = datetime.now().date()
+        self.open_loan = make_loan(self.lender, self.borrower, Decimal('1000.00'), today + timedelta(days=60))
+        self.overdue_loan = make_loan(self.lender, self.borrower, Decimal('2000.00'), today - timedelta(days=5))
+        LoanPayment.objects.create(loan=self.open_loan, payment_amount=Decimal('550.00'))
+        self.open_loan.total_paid = Decimal('550.00')
+        self.open_loan.save()
+        self.client.force_authenticate(user=self.lender)
+
+    def test_summary_figures(self):
+        response = self.client.get(reverse('portfolio'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['available_funds'], Decimal('5000.00'))
+        self.assertEqual(response.data['loans'], 2)
+        # 550 paid on 1000 at 10% repays 500 of principal
+        self.assertEqual(response.data['outstanding_principal'], Decimal('2500.00'))
+        self.assertEqual(response.data['expected_interest'], Decimal('300.00'))
+        self.assertEqual(response.data['amount_repaid'], Decimal('550.00'))
+        self.assertEqual(response.data['overdue_loans'], 1)
+        self.assertEqual(response.data['maturity_distribution']['due_31_90_days'], 1)
+
+    def test_cached_until_a_write(self):
+        self.client.get(reverse('portfolio'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('portfolio'))
+
+        # Invalidation waits for the commit, which TestCase only simulates
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('funds'), {'total_funds': '1000.00'})
+        response = self.client.get(reverse('portfolio'))
+        self.assertEqual(response.data['available_funds'], Decimal('6000.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LoanPayment.objects.create(loan=self.overdue_loan, payment_amount=Decimal('100.00'))
+            LoanAgreement.objects.filter(pk=self.overdue_loan.pk).update(total_paid=Decimal('100.00'))
+        response = self.client.get(reverse('portfolio'))
+        self.assertEqual(response.data['amount_repaid'], Decimal('650.00'))
+
+    def test_borrower_forbidden(self):
+        self.client.force_authenticate(user=self.borrower)
+        self.assertEqual(self.client.get(reverse('portfolio')).status_code, status.HTTP_403_FORBIDDEN)
+
+class DelinquencyScanTests(APITestCase):
+    def setUp(self):
+        self.lender = User.objects.create_user(username='scan_lender', role=1)
+        self.borrower = User.objects.create_user(username='scan_borrower', role=2)
+        self.today = datetime.now().date()
+
+    def test_scan_flags_and_clears(self):
+        overdue = make_loan(self.lender, self.borrower, deadline=self.today - timedelta(days=1))
+        current = make_loan(self.lender, self.borrower, deadline=self.today + timedelta(days=90))
+        paid_off = make_loan(self.lender, self.borrower, deadline=self.today - timedelta(days=1), fully_paid=True, delinquent=True)
+
+        # Two months after approval 200 is expected: nothing, 250 and 150 have been paid
+        LoanAgreement.objects.filter(pk=current.pk).update(approval_date=self.today - timedelta(days=62))
+        caught_up = make_loan(self.lender, self.borrower, deadline=self.today + timedelta(days=90), payments=['250.00'], delinquent=True)
+        behind = make_loan(self.lender, self.borrower, deadline=self.today + timedelta(days=90), payments=['150.00'])
+        LoanAgreement.objects.filter(pk__in=[caught_up.pk, behind.pk]).update(
+            approval_date=self.today - timedelta(days=62)
+        )
+
+        out = StringIO()
+        call_command('scan_delinquencies', chunk_size=2, stdout=out)
+        self.assertIn('Scanned 5 agreements', out.getvalue())
+
+        flags = dict(LoanAgreement.objects.values_list('pk', 'delinquent'))
+        self.assertEqual(flags, {
+            overdue.pk: True, current.pk: True, paid_off.pk: False, caught_up.pk: False, behind.pk: True,
+        })
+        self.assertEqual(LoanAgreement.objects.get(pk=overdue.pk).delinquent_since, self.today)
+
+    def test_scan_is_idempotent(self):
+        make_loan(self.lender, self.borrower, deadline=self.today - timedelta(days=1))
+        first = delinquency.scan(self.today, chunk_size=10)
+        second = delinquency.scan(self.today, chunk_size=10)
+        self.assertEqual((first.flagged, second.flagged), (1, 0))
+
+
+class StatelessAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='stateless_lender', role=1)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('100.00'))
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def user_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format='json')
+        table = User._meta.db_table
+        return response, [q['sql'] for q in context.captured_queries if f'FROM "{table}"' in q['sql']]
+
+    def test_request_does_not_load_user(self):
+        self.authenticate(serializers.MyTokenObtainPairSerializer.get_token(self.lender).access_token)
+        response, queries = self.user_queries('get', reverse('portfolio'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['lender'], self.lender.id)
+        self.assertEqual(queries, [])
+
+        # The user built from the token works as a foreign key value on writes
+        response, queries = self.user_queries('post', reverse('funds'), {'total_funds': '50.00'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(FundingAccount.objects.get(lender=self.lender).total_funds, Decimal('150.00'))
+        self.assertEqual(queries, [])
+
+    def test_token_without_claims_falls_back_to_database(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        self.authenticate(AccessToken.for_user(self.lender))
+        response, queries = self.user_queries('get', reverse('portfolio'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+
+    def test_deleted_and_deactivated_users_are_rejected(self):
+        borrower = User.objects.create_user(username='stateless_borrower', role=2)
+        lender_token, borrower_token = (
+            serializers.MyTokenObtainPairSerializer.get_token(user).access_token
+            for user in (self.lender, borrower)
+        )
+
+        borrower.delete()
+        self.authenticate(borrower_token)
+        self.assertEqual(self.client.get(reverse('loan-requests')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.lender.is_active = False
+        self.lender.save()
+        self.authenticate(lender_token)
+        self.assertEqual(self.client.get(reverse('portfolio')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_role_change_rejects_tokens_from_before(self):
+        refresh = serializers.MyTokenObtainPairSerializer.get_token(self.lender)
+        self.authenticate(refresh.access_token)
+        self.assertEqual(self.client.get(reverse('portfolio')).status_code, status.HTTP_200_OK)
+
+        self.lender.role = 2
+        self.lender.save()
+        self.assertEqual(self.client.get(reverse('loan-requests')).status_code, status.HTTP_401_UNAUTHORIZED)
+        # A refreshed access token still carries the old role
+        self.authenticate(refresh.access_token)
+        self.assertEqual(self.client.get(reverse('loan-requests')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Logging in again gives a token with the new role
+        self.authenticate(serializers.MyTokenObtainPairSerializer.get_token(self.lender).access_token)
+        self.assertEqual(self.client.get(reverse('loan-requests')).status_code, status.HTTP_200_OK)
+
+    def test_saves_without_role_change_do_not_revoke(self):
+        self.lender.first_name = 'Lee'
+        self.lender.save()
+        User.objects.only('id').get(pk=self.lender.pk).save()
+        self.assertFalse(is_revoked(self.lender.id))
+
+    def test_deploy_check_requires_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['loans.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class FastSerializationTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='fast_lender', role=1)
+        self.borrower = User.objects.create_user(username='fast "borrower" é', role=2)
+        self.employee = User.objects.create_user(username='fast_employee', role=3)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('10000.00'))
+        for index, terms in enumerate(['6 months', 'quote " slash \\ 100%s   ü\n', '']):
+            application = LoanApplication.objects.create(
+                borrower=self.borrower, loan_amount=Decimal('1234.50') * (index + 1), terms_conditions=terms,
+                approved=index != 2,
+            )
+            if index == 2:
+                break
+            loan = LoanAgreement.objects.create(
+                agreement_id=application, lender=self.lender,
+                repayment_deadline=datetime.now().date() + timedelta(days=90),
+                interest_rate=Decimal('0.07'), min_payment=Decimal('10.10'), max_payment=Decimal('999.99'),
+            )
+            LoanPayment.objects.create(loan=loan, payment_amount=Decimal('12.30'))
+
+    def expected(self, data, media_type=None):
+        from rest_framework.renderers import JSONRenderer
+        return JSONRenderer().render(data, media_type)
+
+    def test_list_endpoints_are_byte_identical(self):
+        loans = LoanAgreement.objects.order_by('agreement_id')
+        requests = LoanApplication.objects.order_by('application_id')
+        cases = [
+            (self.lender, 'funds', {
+                'fund': serializers.FundSerializer(FundingAccount.objects.get()).data,
+                'loans': serializers.LoanSerializer(loans, many=True).data,
+            }),
+            (self.employee, 'users', {
+                'users': serializers.BankUserSerializer(User.objects.order_by('id'), many=True).data,
+                'nextCursor': None,
+            }),
+            (self.borrower, 'loan-requests', {
+                'loanRequests': serializers.LoanRequestSerializer(requests.filter(approved=False), many=True).data,
+                'loans': serializers.LoanSerializer(loans, many=True).data,
+                'nextRequestsCursor': None,
+                'nextLoansCursor': None,
+            }),
+            (self.employee, 'loan-approves', {
+                'requests': serializers.PendingRequestSerializer(credit.with_scores(requests.filter(approved=False)), many=True).data,
+                'nextCursor': None,
+            }),
+            (self.borrower, 'loan-payments', serializers.PaymentSerializer(LoanPayment.objects.all(), many=True).data),
+        ]
+        for user, url_name, data in cases:
+            self.client.force_authenticate(user=user)
+            response = self.client.get(reverse(url_name))
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url_name)
+            self.assertEqual(response.content, self.expected(data), url_name)
+            self.assertEqual(response['Content-Type'], 'application/json', url_name)
+
+    def test_paginated_and_indented_responses(self):
+        self.client.force_authenticate(user=self.employee)
+        response = self.client.get(reverse('loan-requests'), {'page_size': 1})
+        requests = LoanApplication.objects.order_by('application_id')
+        self.assertEqual(response.content, self.expected({
+            'loanRequests': serializers.LoanRequestSerializer(requests[:1], many=True).data,
+            'loans': serializers.LoanSerializer(LoanAgreement.objects.order_by('agreement_id')[:1], many=True).data,
+            'nextRequestsCursor': requests[0].pk,
+            'nextLoansCursor': requests[0].pk,
+        }))
+
+        media_type = 'application/json; indent=4'
+        response = self.client.get(reverse('loan-approves'), {'page_size': 1}, HTTP_ACCEPT=media_type)
+        pending = requests.filter(approved=False)
+        self.assertEqual(response.content, self.expected({
+            'requests': serializers.PendingRequestSerializer(credit.with_scores(pending[:1]), many=True).data,
+            'nextCursor': pending[0].pk if pending.count() > 1 else None,
+        }, media_type))
+
+    def test_encoders_reject_unsupported_fields(self):
+        from rest_framework.serializers import SerializerMethodField
+
+        class ScheduleSerializer(serializers.LoanSerializer):
+            schedule = SerializerMethodField()
+
+            class Meta(serializers.LoanSerializer.Meta):
+                fields = serializers.LoanSerializer.Meta.fields + ('schedule',)
+
+        with self.assertRaises(TypeError):
+            rendering.RowEncoder(ScheduleSerializer)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_serialization', limit=100, repeat=1, stdout=out)
+        self.assertIn('payments', out.getvalue())
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='export_lender', role=1)
+        self.other_lender = User.objects.create_user(username='export_other_lender', role=1)
+        self.borrower = User.objects.create_user(username='export_borrower', role=2)
+        self.employee = User.objects.create_user(username='export_employee', role=3)
+        self.today = datetime.now().date()
+        self.loans = [
+            make_loan(lender, self.borrower, interest_rate=Decimal('0.05'), min_payment=Decimal('10.00'), max_payment=Decimal('500.00'))
+            for lender in (self.lender, self.lender, self.other_lender)
+        ]
+        for days_ago, loan in [(40, self.loans[0]), (10, self.loans[0]), (5, self.loans[1]), (1, self.loans[2])]:
+            payment = LoanPayment.objects.create(loan=loan, payment_amount=Decimal('25.50'))
+            LoanPayment.objects.filter(pk=payment.pk).update(payment_date=self.today - timedelta(days=days_ago))
+
+    def export(self, user, url_name, **params):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_is_scoped_to_the_lender(self):
+        response, content = self.export(self.lender, 'loans-export')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="agreements.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(content.decode().splitlines()))
+        self.assertEqual(rows[0], list(serializers.LOAN_ENCODER.field_names))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [self.loans[0].pk, self.loans[1].pk])
+
+    def test_ndjson_lines_match_the_api_and_dates_filter(self):
+        since = (self.today - timedelta(days=20)).isoformat()
+        _, content = self.export(self.employee, 'loan-payments-export', type='ndjson', **{'from': since})
+        payments = LoanPayment.objects.filter(payment_date__gte=since).order_by('payment_id')
+        self.assertEqual(
+            [json.loads(line) for line in content.decode().splitlines()],
+            json.loads(json.dumps(serializers.PaymentSerializer(payments, many=True).data)),
+        )
+        self.assertEqual(len(payments), 3)
+
+        _, content = self.export(self.borrower, 'loan-payments-export', type='ndjson', to=since)
+        self.assertEqual(len(content.splitlines()), 1)
+
+    def test_gzip_export_streams_in_chunks(self):
+        from unittest import mock
+        import gzip
+
+        _, plain = self.export(self.employee, 'loan-payments-export')
+        with mock.patch('loans.exports.EXPORT_CHUNK_SIZE', 1):
+            response, content = self.export(self.employee, 'loan-payments-export', compress='gzip')
+            self.client.force_authenticate(user=self.employee)
+            chunks = list(self.client.get(reverse('loan-payments-export')).streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('filename="payments.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(content), plain)
+        self.assertEqual(len(chunks), LoanPayment.objects.count())
+
+    def test_invalid_parameters(self):
+        self.client.force_authenticate(user=self.lender)
+        for params in [{'type': 'xml'}, {'compress': 'zip'}, {'from': '2024-13-01'}]:
+            response = self.client.get(reverse('loans-export'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class LenderMatchingTests(APITestCase):
+    def setUp(self):
+        matching.index.reset()
+        self.client = APIClient()
+        self.employee = User.objects.create_user(username='match_employee', role=3)
+        self.borrower = User.objects.create_user(username='match_borrower', role=2)
+        self.small, self.medium, self.large = [
+            User.objects.create_user(username=f'match_lender_{funds}', role=1) for funds in (1000, 5000, 20000)
+        ]
+        for lender, amount in [(self.small, '1000'), (self.medium, '5000'), (self.large, '20000')]:
+            FundingAccount.objects.create(lender=lender, total_funds=Decimal(amount))
+        # Funding accounts of non-lenders are never matched
+        FundingAccount.objects.create(lender=self.employee, total_funds=Decimal('100000'))
+        self.client.force_authenticate(user=self.employee)
+        self.deadline = (datetime.now() + timedelta(days=180)).strftime('%Y-%m-%d')
+
+    def tearDown(self):
+        matching.index.reset()
+
+    def approval(self, amount, **extra):
+        application = LoanApplication.objects.create(
+            borrower=self.borrower, loan_amount=Decimal(amount), terms_conditions='6 months'
+        )
+        return {
+            'agreement_id': application.application_id, 'interest_rate': '0.05', 'repayment_deadline': self.deadline,
+            'min_payment': '10', 'max_payment': str(Decimal(amount) / 2), **extra,
+        }
+
+    def test_propose_picks_the_best_fit(self):
+        self.assertEqual(matching.index.propose(Decimal('3000')), self.medium.id)
+        self.assertEqual(matching.index.propose(Decimal('1000')), self.small.id)
+        self.assertEqual(matching.index.propose(Decimal('3000'), exclude={self.medium.id}), self.large.id)
+        self.assertIsNone(matching.index.propose(Decimal('50000')))
+
+    def test_plan_spends_running_balances(self):
+        self.assertEqual(
+            matching.index.plan([Decimal('4000'), Decimal('4000'), Decimal('900'), Decimal('16001')]),
+            [self.medium.id, self.large.id, self.small.id, None],
+        )
+
+    def test_index_follows_committed_writes(self):
+        self.assertEqual(matching.index.propose(Decimal('8000')), self.large.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            funds.credit(self.small.id, Decimal('10000'))
+        self.assertEqual(matching.index.propose(Decimal('8000')), self.small.id)
+
+    def test_approval_without_lender_is_matched(self):
+        response = self.client.post(reverse('loan-approves'), self.approval('3000'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LoanAgreement.objects.get().lender_id, self.medium.id)
+        self.assertEqual(FundingAccount.objects.get(lender=self.medium).total_funds, Decimal('2000'))
+
+        response = self.client.post(reverse('loan-approves'), self.approval('30000'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'No lender with enough funds')
+
+    def test_stale_entry_falls_back_to_next_lender(self):
+        matching.index.propose(Decimal('1'))
+        # Changed behind the index's back, as another process would
+        FundingAccount.objects.filter(lender=self.medium).update(total_funds=0)
+        response = self.client.post(reverse('loan-approves'), self.approval('3000'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LoanAgreement.objects.get().lender_id, self.large.id)
+        self.assertEqual(FundingAccount.objects.get(lender=self.large).total_funds, Decimal('17000'))
+
+    def test_lender_deleted_after_the_index_was_built_is_not_debited(self):
+        self.assertEqual(matching.index.propose(Decimal('3000')), self.medium.id)
+        # Soft-deleted by another process, whose invalidation has not reached this index
+        User.objects.filter(pk=self.medium.pk).update(deleted_at=now(), is_active=False)
+        self.assertFalse(funds.debit(self.medium.id, Decimal('3000')))
+
+        response = self.client.post(reverse('loan-approves'), self.approval('3000', lender=self.medium.id), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('loan-approves'), self.approval('3000'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(LoanAgreement.objects.get().lender_id, self.large.id)
+        self.assertEqual(FundingAccount.objects.get(lender=self.medium).total_funds, Decimal('5000'))
+
+    def test_bulk_approval_and_match_endpoint(self):
+        approvals = [self.approval('4000'), self.approval('4000'), self.approval('900', lender=self.large.id)]
+        response = self.client.get(reverse('loan-approves-match'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [match['lender'] for match in response.data['matches']], [self.medium.id, self.large.id, self.small.id]
+        )
+        self.assertEqual(response.data['matched'], 3)
+
+        response = self.client.post(
+            reverse('loan-approves-bulk'), {'mode': 'all_or_nothing', 'approvals': approvals}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(LoanAgreement.objects.order_by('agreement_id').values_list('lender_id', flat=True)),
+            [self.medium.id, self.large.id, self.large.id],
+        )
+
+    def test_plan_leaves_the_index_unchanged(self):
+        amounts = [Decimal('4000'), Decimal('900')]
+        self.assertEqual(matching.index.plan(amounts), [self.medium.id, self.small.id])
+        self.assertEqual(matching.index.plan(amounts), [self.medium.id, self.small.id])
+        self.assertEqual(matching.index.propose(Decimal('4500')), self.medium.id)
+
+    def test_plan_accounts_for_explicit_lenders_in_the_batch(self):
+        self.assertEqual(matching.index.plan([Decimal('2500')], reserved={self.medium.id: Decimal('3000')}), [self.large.id])
+
+        # Matched first in item order, the planned item must not take the funds of the explicit one
+        approvals = [self.approval('2500'), self.approval('3000', lender=self.medium.id)]
+        response = self.client.post(
+            reverse('loan-approves-bulk'), {'mode': 'all_or_nothing', 'approvals': approvals}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(LoanAgreement.objects.order_by('agreement_id').values_list('lender_id', flat=True)),
+            [self.large.id, self.medium.id],
+        )
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        idempotency.cache.clear()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='idem_lender', role=1)
+        self.borrower = User.objects.create_user(username='idem_borrower', role=2)
+        application = LoanApplication.objects.create(
+            borrower=self.borrower, loan_amount=Decimal('1000.00'), terms_conditions='6 months', approved=True
+        )
+        self.loan = LoanAgreement.objects.create(
+            agreement_id=application, lender=self.lender,
+            repayment_deadline=datetime.now().date() + timedelta(days=180),
+            interest_rate=Decimal('0.05'), min_payment=Decimal('10.00'), max_payment=Decimal('500.00'),
+        )
+
+    def tearDown(self):
+        idempotency.cache.clear()
+
+    def pay(self, key, amount='100.00'):
+        self.client.force_authenticate(user=self.borrower)
+        return self.client.post(
+            reverse('loan-payments'), {'loan': self.loan.pk, 'payment_amount': amount},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retried_payment_is_replayed(self):
+        first = self.pay('retry-1')
+        second = self.pay('retry-1')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual((second.status_code, second.content), (first.status_code, first.content))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(LoanPayment.objects.count(), 1)
+        self.assertEqual(LoanAgreement.objects.get().total_paid, Decimal('100.00'))
+
+        self.pay('retry-2')
+        self.assertEqual(LoanPayment.objects.count(), 2)
+
+    def test_replay_from_cache_skips_the_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(user=self.lender)
+            first = self.client.post(reverse('funds'), {'total_funds': '50.00'}, format='json', HTTP_IDEMPOTENCY_KEY='deposit')
+        with self.assertNumQueries(0):
+            second = self.client.post(reverse('funds'), {'total_funds': '50.00'}, format='json', HTTP_IDEMPOTENCY_KEY='deposit')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(FundingAccount.objects.get().total_funds, Decimal('50.00'))
+
+    def test_errors_and_key_reuse(self):
+        # Client errors are stored like any other response
+        self.assertEqual(self.pay('bad', amount='5000.00').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.pay('bad', amount='5000.00').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+        response = self.pay('bad', amount='100.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(LoanPayment.objects.count(), 0)
+        self.assertEqual(self.pay('x' * 256).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Keys are per user
+        self.client.force_authenticate(user=self.lender)
+        response = self.client.post(reverse('funds'), {'total_funds': '10.00'}, format='json', HTTP_IDEMPOTENCY_KEY='bad')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_expired_keys_are_reused_and_purged(self):
+        self.pay('old')
+        IdempotencyKey.objects.update(created_at=make_aware(datetime.now()) - timedelta(days=2))
+        self.assertEqual(self.pay('old').status_code, status.HTTP_200_OK)
+        self.assertEqual(LoanPayment.objects.count(), 2)
+
+        IdempotencyKey.objects.update(created_at=make_aware(datetime.now()) - timedelta(days=2))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1', out.getvalue())
+
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    threads = 6
+
+    def test_concurrent_duplicates_write_once(self):
+        idempotency.cache.clear()
+        lender = User.objects.create_user(username='idem_stress_lender', role=1)
+        statuses = []
+        bodies = set()
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def worker():
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(user=lender)
+            barrier.wait()
+            try:
+                response = retry_locked(lambda: client.post(
+                    reverse('funds'), {'total_funds': '25.00'}, format='json', HTTP_IDEMPOTENCY_KEY='same'
+                ))
+                with lock:
+                    statuses.append(response.status_code)
+                    bodies.add(response.content)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(statuses, [200] * self.threads, bodies)
+        self.assertEqual(len(bodies), 1)
+        self.assertEqual(FundingAccount.objects.get(lender=lender).total_funds, Decimal('25.00'))
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        idempotency.cache.clear()
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_RATES={'portfolio': {'lender': '3/min'}, 'token_obtain_pair': {'anon': '2/min'}})
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        throttling.local_store.clear()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='throttle_lender', role=1)
+        self.other_lender = User.objects.create_user(username='throttle_other_lender', role=1)
+
+    def tearDown(self):
+        throttling.local_store.clear()
+
+    def test_bucket_refills_over_time(self):
+        state, wait = None, 0
+        for _ in range(3):
+            state, wait = throttling.take(state, 3, 0.5, 100.0)
+            self.assertEqual(wait, 0)
+        state, wait = throttling.take(state, 3, 0.5, 100.0)
+        self.assertEqual(wait, 2.0)
+        state, wait = throttling.take(state, 3, 0.5, 102.0)
+        self.assertEqual(wait, 0)
+        # Refills never exceed the capacity
+        state, wait = throttling.take(state, 3, 0.5, 1000.0)
+        self.assertEqual(state[0], 2)
+
+    def test_budget_is_per_user_and_per_view(self):
+        self.client.force_authenticate(user=self.lender)
+        statuses = [self.client.get(reverse('portfolio')).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        response = self.client.get(reverse('portfolio'))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '20')
+
+        # Other views and other users have their own buckets
+        self.assertEqual(self.client.get(reverse('loan-requests')).status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(user=self.other_lender)
+        self.assertEqual(self.client.get(reverse('portfolio')).status_code, status.HTTP_200_OK)
+
+    def test_anonymous_requests_are_limited_by_ip(self):
+        url = reverse('token_obtain_pair')
+        data = {'username': 'nobody', 'password': 'wrong'}
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.1').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.1').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.1').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_forwarded_for_does_not_get_a_new_bucket(self):
+        url = reverse('token_obtain_pair')
+        data = {'username': 'nobody', 'password': 'wrong'}
+        statuses = [
+            self.client.post(url, data, REMOTE_ADDR='10.0.0.3', HTTP_X_FORWARDED_FOR=f'192.0.2.{number}').status_code
+            for number in range(3)
+        ]
+        self.assertEqual(statuses, [401, 401, 429])
+
+    @override_settings(REST_FRAMEWORK={'NUM_PROXIES': 1})
+    def test_forwarded_for_from_a_trusted_proxy(self):
+        url = reverse('token_obtain_pair')
+        data = {'username': 'nobody', 'password': 'wrong'}
+        # The proxy appends the address it saw, whatever the client sent before it
+        statuses = [
+            self.client.post(url, data, REMOTE_ADDR='10.0.0.4', HTTP_X_FORWARDED_FOR=f'192.0.2.{number}, 198.51.100.7').status_code
+            for number in range(3)
+        ]
+        self.assertEqual(statuses, [401, 401, 429])
+        response = self.client.post(url, data, REMOTE_ADDR='10.0.0.4', HTTP_X_FORWARDED_FOR='198.51.100.8')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(THROTTLE_BACKEND='cache')
+    def test_cache_backend(self):
+        cache.clear()
+        self.client.force_authenticate(user=self.lender)
+        statuses = [self.client.get(reverse('portfolio')).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        self.assertEqual(len(throttling.local_store._buckets), 0)
+        cache.clear()
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        metrics.clear()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='metrics_lender', role=1)
+        self.borrower = User.objects.create_user(username='metrics_borrower', role=2)
+        self.client.force_authenticate(user=self.lender)
+
+    def tearDown(self):
+        metrics.clear()
+
+    def scrape(self):
+        return self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret').content.decode()
+
+    def sample(self, body, name, **labels):
+        label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+        match = re.search(rf'^{re.escape(name)}{{{re.escape(label_text)}}} (\S+)$', body, re.M)
+        self.assertIsNotNone(match, f'{name}{{{label_text}}} not in metrics')
+        return float(match.group(1))
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.post(reverse('funds'), {'total_funds': '1000.00'})
+        response = self.client.get(reverse('portfolio'))
+        self.client.get(reverse('portfolio'))
+
+        body = self.scrape()
+        self.assertEqual(self.sample(body, 'loans_request_duration_seconds_count', view='portfolio', method='GET'), 2)
+        self.assertEqual(self.sample(body, 'loans_request_duration_seconds_count', view='funds', method='POST'), 1)
+        self.assertEqual(self.sample(body, 'loans_responses_total', view='portfolio', method='GET', status='200'), 2)
+        self.assertEqual(
+            self.sample(body, 'loans_response_size_bytes_sum', view='portfolio', method='GET'), 2 * len(response.content)
+        )
+        self.assertGreater(self.sample(body, 'loans_request_sql_queries_sum', view='funds', method='POST'), 0)
+        # Buckets are cumulative and end with +Inf
+        self.assertEqual(
+            self.sample(body, 'loans_request_duration_seconds_bucket', view='portfolio', method='GET', le='+Inf'), 2
+        )
+
+    def test_queries_made_while_streaming_are_counted(self):
+        response = self.client.get(reverse('loans-export'))
+        content = b''.join(response.streaming_content)
+        body = self.scrape()
+        self.assertEqual(self.sample(body, 'loans_response_size_bytes_sum', view='loans-export', method='GET'), len(content))
+        self.assertGreaterEqual(self.sample(body, 'loans_request_sql_queries_sum', view='loans-export', method='GET'), 1)
+
+    def test_unmatched_urls_share_one_label(self):
+        self.client.get('/api/no-such-page/')
+        body = self.scrape()
+        self.assertEqual(self.sample(body, 'loans_responses_total', view='<unmatched>', method='GET', status='404'), 1)
+
+    def test_label_values_are_escaped(self):
+        metrics.RESPONSES.inc(('a"b\\c\nd', 'GET', '200'))
+        self.assertIn('view="a\\"b\\\\c\\nd"', metrics.render())
+
+    def test_metrics_token(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unknown_methods_share_one_label(self):
+        for method in ('BREW', 'PROPFIND', 'X' * 100):
+            self.client.generic(method, reverse('portfolio'))
+        body = self.scrape()
+        self.assertEqual(self.sample(body, 'loans_request_duration_seconds_count', view='portfolio', method='other'), 3)
+        self.assertNotIn('BREW', body)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs('loans.slow_requests', level='WARNING') as logs:
+            self.client.get(reverse('loan-requests'))
+        self.assertIn('GET /api/loan-requests/ (loan-requests)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_slow_request_log_is_off_by_default(self):
+        with self.assertNoLogs('loans.slow_requests'):
+            self.client.get(reverse('portfolio'))
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The test database is the primary and a SQLite file is the replica.
+    replicate() copies the primary over, so anything written after it is
+    missing from the replica like it would be on a lagging one. The alias is
+    only added once the test runner has set up its databases, so the runner
+    does not create a test database for it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.replica_path = os.path.join(cls.directory.name, 'replica.sqlite3')
+        connections.settings['replica'] = connections.configure_settings({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path},
+        })['default']
+        cls.databases = {'default', 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        del cls.databases
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.settings_override = override_settings(DATABASE_REPLICAS=['replica'])
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='replica_lender', role=1)
+        self.other_lender = User.objects.create_user(username='replica_other_lender', role=1)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('100.00'))
+        FundingAccount.objects.create(lender=self.other_lender, total_funds=Decimal('100.00'))
+        self.replicate()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        cache.clear()
+
+    def replicate(self):
+        connections['replica'].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+
+    def funds_of(self, user):
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('funds'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return Decimal(response.data['fund']['total_funds'])
+
+    def test_reads_go_to_the_replica(self):
+        FundingAccount.objects.filter(lender=self.lender).update(total_funds=Decimal('999.00'))
+        self.assertEqual(self.funds_of(self.lender), Decimal('100.00'))
+        self.replicate()
+        self.assertEqual(self.funds_of(self.lender), Decimal('999.00'))
+
+    def test_writers_read_their_own_writes(self):
+        self.client.force_authenticate(user=self.lender)
+        response = self.client.post(reverse('funds'), {'total_funds': '50.00'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The write reached the primary only, and the writer reads from there
+        self.assertTrue(routing.is_pinned(self.lender.id))
+        self.assertEqual(self.funds_of(self.lender), Decimal('150.00'))
+
+        # Other users still read from the replica
+        FundingAccount.objects.filter(lender=self.other_lender).update(total_funds=Decimal('5.00'))
+        self.assertEqual(self.funds_of(self.other_lender), Decimal('100.00'))
+
+        # Once the window has passed the writer is back on the replica
+        cache.delete(routing.PINNED_KEY.format(self.lender.id))
+        self.assertEqual(self.funds_of(self.lender), Decimal('100.00'))
+
+    def test_reads_stay_on_the_primary_without_replicas(self):
+        FundingAccount.objects.filter(lender=self.lender).update(total_funds=Decimal('999.00'))
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.funds_of(self.lender), Decimal('999.00'))
+
+    def test_router_sends_writes_and_transactions_to_the_primary(self):
+        router = routing.ReplicaRouter()
+        self.assertEqual(router.db_for_write(FundingAccount), 'default')
+        self.assertEqual(router.db_for_read(FundingAccount), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'loans'))
+
+    def test_replicas_require_a_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_replica_pins(None)], ['loans.E002'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(checks.check_replica_pins(None), [])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(checks.check_replica_pins(None), [])
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.lender = User.objects.create_user(username='archive_lender', role=1)
+        self.borrower = User.objects.create_user(username='archive_borrower', role=2)
+        self.other_borrower = User.objects.create_user(username='archive_other_borrower', role=2)
+        self.employee = User.objects.create_user(username='archive_employee', role=3)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('0.00'))
+
+        self.paid, self.recently_paid, self.open = [
+            make_loan(self.lender, self.borrower, payments=['600.00', '500.00'], total_paid=Decimal('1100.00'), fully_paid=paid)
+            for paid in (True, True, False)
+        ]
+        self.today = make_aware(datetime.now()).date()
+        # Archive as of a year and a month from now, when only the recent payment is recent
+        self.as_of = self.today + timedelta(days=400)
+        LoanPayment.objects.filter(loan=self.recently_paid).update(payment_date=self.as_of)
+
+    def test_raw_delete_is_one_statement(self):
+        # Guards the private QuerySet._raw_delete() that raw_delete() wraps
+        payments = LoanPayment.objects.filter(loan=self.open)
+        with self.assertNumQueries(1):
+            self.assertEqual(archive.raw_delete(payments), 2)
+        self.assertFalse(payments.exists())
+        with self.assertNumQueries(1):
+            InterestAccrual.objects.filter(loan=self.open).delete()
+
+    def test_moves_paid_loans_with_their_history(self):
+        loan_id = self.paid.agreement_id_id
+        payment_ids = set(LoanPayment.objects.filter(loan=self.paid).values_list('payment_id', flat=True))
+        InterestAccrual.objects.create(loan=self.paid, accrual_date=self.today, accrued_interest=1, interest=1)
+
+        result = archive.archive_paid_loans(self.as_of)
+        self.assertEqual((result.agreements, result.payments), (1, 2))
+
+        self.assertFalse(LoanAgreement.objects.filter(pk=loan_id).exists())
+        self.assertFalse(LoanApplication.objects.filter(pk=loan_id).exists())
+        self.assertFalse(LoanPayment.objects.filter(loan_id=loan_id).exists())
+        self.assertFalse(InterestAccrual.objects.filter(loan_id=loan_id).exists())
+        archived = ArchivedLoanAgreement.objects.get(pk=loan_id)
+        self.assertEqual(archived.borrower_id, self.borrower.id)
+        self.assertEqual(archived.lender_id, self.lender.id)
+        self.assertEqual(archived.loan_amount, Decimal('1000.00'))
+        self.assertEqual(archived.total_paid, Decimal('1100.00'))
+        self.assertEqual(set(archived.payments.values_list('payment_id', flat=True)), payment_ids)
+
+        # Open loans and loans with recent payments stay live
+        self.assertEqual(
+            set(LoanAgreement.objects.values_list('pk', flat=True)),
+            {self.recently_paid.pk, self.open.pk},
+        )
+        self.assertEqual(LoanPayment.objects.count(), 4)
+
+        # Running again finds nothing left to move
+        result = archive.archive_paid_loans(self.as_of)
+        self.assertEqual((result.agreements, result.payments), (0, 0))
+
+    def test_command_archives_in_chunks(self):
+        LoanPayment.objects.filter(loan=self.recently_paid).update(payment_date=self.today)
+        out = StringIO()
+        call_command('archive_paid_loans', date=self.as_of.isoformat(), chunk_size=1, stdout=out)
+        self.assertIn('Archived 2 agreements and 4 payments.', out.getvalue())
+        self.assertEqual(ArchivedLoanAgreement.objects.count(), 2)
+
+    def test_history_reads_through_to_the_archive(self):
+        archive.archive_paid_loans(self.as_of)
+        self.client.force_authenticate(user=self.borrower)
+
+        response = self.client.get(reverse('loan-history', kwargs={'agreement_id': self.paid.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['archived'])
+        self.assertEqual(response.data['loan']['loan_amount'], '1000.00')
+        self.assertEqual([p['payment_amount'] for p in response.data['payments']], ['600.00', '500.00'])
+
+        response = self.client.get(reverse('loan-history', kwargs={'agreement_id': self.open.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['archived'])
+        self.assertEqual(len(response.data['payments']), 2)
+
+        self.client.force_authenticate(user=self.other_borrower)
+        response = self.client.get(reverse('loan-history', kwargs={'agreement_id': self.paid.pk}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('loan-history', kwargs={'agreement_id': 999999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archived_loans_list_is_scoped(self):
+        archive.archive_paid_loans(self.as_of)
+        self.client.force_authenticate(user=self.borrower)
+        response = self.client.get(reverse('loans-archive'))
+        self.assertEqual([loan['agreement_id'] for loan in response.data['loans']], [self.paid.pk])
+        self.assertIsNone(response.data['nextCursor'])
+
+        self.client.force_authenticate(user=self.other_borrower)
+        self.assertEqual(self.client.get(reverse('loans-archive')).data['loans'], [])
+        self.client.force_authenticate(user=self.employee)
+        self.assertEqual(len(self.client.get(reverse('loans-archive')).data['loans']), 1)
+
+    def test_live_views_skip_archived_loans(self):
+        archive.archive_paid_loans(self.as_of)
+        self.client.force_authenticate(user=self.lender)
+        response = self.client.get(reverse('funds'))
+        self.assertNotIn(self.paid.pk, [loan['agreement_id'] for loan in response.data['loans']])
+
+    def test_portfolio_totals_include_archived_loans(self):
+        self.client.force_authenticate(user=self.lender)
+        before = self.client.get(reverse('portfolio')).data
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_paid_loans(self.as_of)
+        after = self.client.get(reverse('portfolio')).data
+        for name in ('loans', 'open_loans', 'principal_lent', 'expected_interest', 'amount_repaid'):
+            self.assertEqual(after[name], before[name], name)
+
+
+class JobQueueTests(APITestCase):
+    def setUp(self):
+        job_calls.clear()
+        self.worker = jobs.Worker({'test': 2}, name='test-worker')
+
+    def test_jobs_run_and_are_removed(self):
+        jobs.enqueue(record_job, value='a')
+        jobs.enqueue(record_job, value='b')
+        self.assertEqual(self.worker.run_once(), 2)
+        self.assertEqual(job_calls, ['a', 'b'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_jobs_roll_back_with_the_transaction(self):
+        with transaction.atomic():
+            jobs.enqueue(record_job, value='a')
+            transaction.set_rollback(True)
+        self.assertEqual(self.worker.run_once(), 0)
+
+    def test_delayed_jobs_wait(self):
+        job = jobs.enqueue(record_job, delay=60, value='later')
+        self.assertEqual(self.worker.run_once(), 0)
+        Job.objects.filter(pk=job.pk).update(run_at=make_aware(datetime.now()) - timedelta(seconds=1))
+        self.assertEqual(self.worker.run_once(), 1)
+        self.assertEqual(job_calls, ['later'])
+
+    def test_failures_are_retried_with_backoff(self):
+        job = jobs.enqueue(failing_job)
+        self.assertEqual(self.worker.run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreater(job.run_at, make_aware(datetime.now()) + timedelta(seconds=jobs.backoff(1) - 1))
+        self.assertEqual(self.worker.run_once(), 0)
+
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        self.assertEqual(self.worker.run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.worker.run_once(), 0)
+        self.assertEqual([jobs.backoff(n) for n in (1, 2, 3, 20)], [5, 10, 20, jobs.BACKOFF_MAX])
+
+    def test_claims_do_not_overlap(self):
+        ids = {jobs.enqueue(record_job, value=value).pk for value in range(5)}
+        first = jobs.claim('test', 2, 'one')
+        second = jobs.claim('test', 2, 'two')
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({job.pk for job in first} & {job.pk for job in second})
+        self.assertEqual(jobs.claim('other', 10), [])
+
+        # Jobs of a worker that died are released after JOB_TIMEOUT
+        Job.objects.filter(pk=first[0].pk).update(locked_at=first[0].locked_at - jobs.JOB_TIMEOUT * 2)
+        self.assertEqual(jobs.release_stale(), 1)
+        unclaimed = ids - {job.pk for job in first + second}
+        self.assertEqual({job.pk for job in jobs.claim('test', 10, 'three')}, unclaimed | {first[0].pk})
+
+    def test_heartbeat_keeps_long_jobs_locked(self):
+        for value in range(2):
+            jobs.enqueue(record_job, value=value)
+        slow, dead = jobs.claim('test', 2, 'one')
+        Job.objects.update(locked_at=slow.locked_at - jobs.JOB_TIMEOUT * 2)
+        # Only the worker running `slow` is still alive
+        self.assertEqual(jobs.heartbeat([slow]), 1)
+        self.assertEqual(jobs.release_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=slow.pk).status, Job.RUNNING)
+        self.assertEqual(Job.objects.get(pk=dead.pk).status, Job.PENDING)
+
+    def test_enqueue_once_reuses_waiting_jobs(self):
+        waiting = jobs.enqueue_once(record_job, delay=60, value=1)
+        self.assertEqual(jobs.enqueue_once(record_job, delay=60, value=1), waiting)
+        self.assertNotEqual(jobs.enqueue_once(record_job, delay=60, value=2), waiting)
+        # A due job may be running already, without the writes of the caller
+        Job.objects.filter(pk=waiting.pk).update(run_at=waiting.created_at)
+        self.assertNotEqual(jobs.enqueue_once(record_job, delay=60, value=1), waiting)
+        self.assertEqual(Job.objects.count(), 3)
+
+    def test_payment_on_delinquent_loan_queues_a_rescan(self):
+        lender = User.objects.create_user(username='jobs_lender', role=1)
+        borrower = User.objects.create_user(username='jobs_borrower', role=2)
+        application = LoanApplication.objects.create(
+            borrower=borrower, loan_amount=1000, terms_conditions='6 months', approved=True
+        )
+        loan = LoanAgreement.objects.create(
+            agreement_id=application,
+            lender=lender,
+            repayment_deadline=make_aware(datetime.now() + timedelta(days=180)).date(),
+            interest_rate=Decimal('0.10'),
+            min_payment=Decimal('100.00'),
+            max_payment=Decimal('600.00'),
+            delinquent=True,
+            delinquent_since=make_aware(datetime.now()).date(),
+        )
+        self.client.force_authenticate(user=borrower)
+        response = self.client.post(reverse('loan-payments'), {'loan': loan.pk, 'payment_amount': '100.00'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        job = Job.objects.earliest('id')
+        self.assertEqual((job.queue, job.task, job.payload), ('recalculations', 'loans.delinquency.rescan', {'agreement_ids': [loan.pk]}))
+        self.assertEqual(jobs.Worker({'recalculations': 1}).run_once(), 1)
+        loan.refresh_from_db()
+        self.assertFalse(loan.delinquent)
+
+    def test_bulk_payments_on_delinquent_loans_queue_one_rescan(self):
+        lender = User.objects.create_user(username='jobs_lender', role=1)
+        borrower = User.objects.create_user(username='jobs_borrower', role=2)
+        today = date.today()
+        delinquent = [make_loan(lender, borrower, delinquent=True, delinquent_since=today) for _ in range(2)]
+        current = make_loan(lender, borrower)
+        self.client.force_authenticate(user=borrower)
+        payments = [{'loan': loan.pk, 'payment_amount': '100.00'} for loan in delinquent + [current]]
+        response = self.client.post(reverse('loan-payments-bulk'), payments, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        job = Job.objects.get(task='loans.delinquency.rescan')
+        self.assertEqual(job.payload, {'agreement_ids': [loan.pk for loan in delinquent]})
+        jobs.Worker({'recalculations': 1}).run_once()
+        self.assertFalse(LoanAgreement.objects.filter(delinquent=True).exists())
+
+
+class JobWorkerTests(TransactionTestCase):
+    def setUp(self):
+        job_calls.clear()
+        job_concurrency.update(running=0, peak=0)
+
+    def test_worker_pool_respects_the_queue_limit(self):
+        for value in range(12):
+            jobs.enqueue(slow_job, value=value)
+        out = StringIO()
+        # The shared in-memory test database fails concurrent writes instead of
+        # waiting for the lock, so the pool threads run the tasks without the
+        # bookkeeping writes of jobs.run().
+        with mock.patch.object(jobs, 'run', lambda job: slow_job(**job.payload)):
+            call_command('runworkers', queue=['test=3'], burst=True, poll_interval=0.01, stdout=out)
+        self.assertIn('Working test (3) in 1 process(es)', out.getvalue())
+        self.assertEqual(sorted(job_calls), list(range(12)))
+        self.assertLessEqual(job_concurrency['peak'], 3)
+        self.assertGreater(job_concurrency['peak'], 1)
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 12)
+
+
+class InterestAccrualTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.lender = User.objects.create_user(username='accrual_lender', role=1)
+        self.borrower = User.objects.create_user(username='accrual_borrower', role=2)
+        self.approved = date(2026, 1, 1)
+        # 1000 at 10% over 100 days accrues 1.00 a day
+        self.loan = make_loan(
+            self.lender, self.borrower, Decimal('1000.00'), date(2026, 4, 11), approval_date=self.approved,
+            interest_rate=Decimal('0.10'), min_payment=Decimal('10.00'), max_payment=Decimal('1000.00'),
+        )
+        self.short = make_loan(
+            self.lender, self.borrower, Decimal('300.00'), date(2026, 1, 11), approval_date=self.approved,
+            interest_rate=Decimal('0.05'), min_payment=Decimal('10.00'), max_payment=Decimal('300.00'),
+        )
+
+    def test_interest_accrues_daily_until_the_deadline(self):
+        result = accrual.accrue(date(2026, 1, 31))
+        self.assertEqual(result.agreements, 2)
+        self.assertEqual(result.interest, Decimal('45.00'))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.accrued_interest, Decimal('30.00'))
+        self.assertEqual(self.loan.accrued_through, date(2026, 1, 31))
+
+        accrual.accrue(date(2026, 2, 1))
+        snapshot = InterestAccrual.objects.get(loan=self.loan, accrual_date=date(2026, 2, 1))
+        self.assertEqual((snapshot.accrued_interest, snapshot.interest), (Decimal('31.00'), Decimal('1.00')))
+        # Past its deadline a loan has accrued exactly its flat interest
+        self.assertEqual(InterestAccrual.objects.get(loan=self.short, accrual_date=date(2026, 2, 1)).accrued_interest, Decimal('15.00'))
+
+    def test_reruns_and_interrupted_runs_accrue_once(self):
+        accrual.accrue(date(2026, 1, 11))
+        self.assertEqual(accrual.accrue(date(2026, 1, 11)).agreements, 0)
+
+        # A run that stopped after the first chunk picks up where it left off
+        original = accrual.accrue_chunk
+        calls = []
+
+        def stop_after_first(rows, as_of):
+            if calls:
+                raise RuntimeError('stopped')
+            calls.append(rows)
+            return original(rows, as_of)
+
+        with mock.patch.object(accrual, 'accrue_chunk', stop_after_first):
+            with self.assertRaises(RuntimeError):
+                accrual.accrue(date(2026, 1, 21), chunk_size=1)
+        result = accrual.accrue(date(2026, 1, 21), chunk_size=1)
+        self.assertEqual(result.agreements, 1)
+        self.assertEqual(InterestAccrual.objects.filter(accrual_date=date(2026, 1, 21)).count(), 2)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.accrued_interest, Decimal('20.00'))
+
+    def test_paid_and_future_loans_are_skipped(self):
+        LoanAgreement.objects.filter(pk=self.short.pk).update(fully_paid=True)
+        self.assertEqual(accrual.accrue(date(2025, 12, 31)).agreements, 0)
+        self.assertEqual(accrual.accrue(date(2026, 1, 2)).agreements, 1)
+
+    def test_command_and_portfolio(self):
+        out = StringIO()
+        call_command('accrue_interest', date='2026-01-31', chunk_size=1, stdout=out)
+        self.assertIn('Accrued 45.00 of interest on 2 agreements as of 2026-01-31', out.getvalue())
+
+        self.client.force_authenticate(user=self.lender)
+        self.assertEqual(self.client.get(reverse('portfolio')).data['accrued_interest'], Decimal('45.00'))
+
+    def test_accrual_invalidates_cached_portfolios(self):
+        self.client.force_authenticate(user=self.lender)
+        self.assertEqual(self.client.get(reverse('portfolio')).data['accrued_interest'], Decimal('0.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            accrual.accrue(date(2026, 1, 31))
+        self.assertEqual(self.client.get(reverse('portfolio')).data['accrued_interest'], Decimal('45.00'))
+
+
+class UserDirectoryTests(APITestCase):
+    def setUp(self):
+        self.employee = User.objects.create_user(username='employee', role=3)
+        self.alice = User.objects.create_user(username='alice', role=1)
+        self.alan = User.objects.create_user(username='alan', role=1)
+        self.albert = User.objects.create_user(username='albert', role=2)
+        self.bob = User.objects.create_user(username='bob', role=2)
+        self.client.force_authenticate(user=self.employee)
+
+    def usernames(self, response):
+        return [user['username'] for user in response.data['users']]
+
+    def purge(self):
+        worker = jobs.Worker({'default': 1}, name='test-worker')
+        runs = 0
+        while worker.run_once():
+            runs += 1
+        return runs
+
+    def test_search_by_prefix_and_role(self):
+        url = reverse('users')
+        self.assertEqual(self.usernames(self.client.get(url, {'search': 'al'})), ['alice', 'alan', 'albert'])
+        self.assertEqual(self.usernames(self.client.get(url, {'search': 'al', 'role': 1})), ['alice', 'alan'])
+        self.assertEqual(self.usernames(self.client.get(url, {'search': 'ali'})), ['alice'])
+        self.assertEqual(self.usernames(self.client.get(url, {'search': 'Al'})), [])
+        self.assertEqual(self.client.get(url, {'role': 9}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_directory_is_paged_by_keyset(self):
+        url = reverse('users')
+        first = self.client.get(url, {'page_size': 2})
+        self.assertEqual(self.usernames(first), ['employee', 'alice'])
+        second = self.client.get(url, {'page_size': 2, 'cursor': first.data['nextCursor']})
+        self.assertEqual(self.usernames(second), ['alan', 'albert'])
+        last = self.client.get(url, {'page_size': 2, 'cursor': second.data['nextCursor']})
+        self.assertEqual(self.usernames(last), ['bob'])
+        self.assertIsNone(last.data['nextCursor'])
+
+    def test_bulk_delete_hides_users_at_once_and_purges_later(self):
+        admin = User.objects.create_superuser(username='admin', password='x', role=3)
+        for _ in range(3):
+            make_loan(self.alice, self.bob, payments=['10.00'])
+        kept = make_loan(self.alan, self.albert, payments=['10.00'])
+
+        with mock.patch.object(directory, 'PURGE_CHUNK_SIZE', 2):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(reverse('users-bulk'), {'ids': [self.alice.id, self.bob.id, admin.id, 0]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data, {'deleted': [self.alice.id, self.bob.id], 'skipped': [0, admin.id]})
+
+            self.assertEqual(self.usernames(self.client.get(reverse('users'))), ['employee', 'alan', 'albert', 'admin'])
+            self.assertTrue(is_revoked(self.alice.id))
+            self.assertFalse(User.objects.get(pk=self.bob.pk).is_active)
+            self.assertEqual(LoanAgreement.objects.count(), 4)
+
+            # Two chunks of loans, two of applications and the users themselves
+            self.assertEqual(self.purge(), 5)
+        self.assertFalse(User.objects.filter(pk__in=[self.alice.pk, self.bob.pk]).exists())
+        self.assertEqual(list(LoanAgreement.objects.all()), [kept])
+        self.assertEqual(LoanPayment.objects.count(), 1)
+        self.assertEqual(LoanApplication.objects.count(), 1)
+        self.assertTrue(User.objects.filter(pk=admin.pk).exists())
+
+    def test_single_delete_is_soft_too(self):
+        make_loan(self.alice, self.bob, payments=['10.00'])
+        response = self.client.delete(reverse('users'), {'id': self.alice.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(reverse('users'), {'id': self.alice.id}, format='json').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.purge(), 2)
+        self.assertFalse(User.objects.filter(pk=self.alice.pk).exists())
+        self.assertFalse(LoanAgreement.objects.exists())
+
+    def test_deleted_users_cannot_be_approved_before_the_purge(self):
+        FundingAccount.objects.create(lender=self.alice, total_funds=Decimal('5000.00'))
+        FundingAccount.objects.create(lender=self.alan, total_funds=Decimal('5000.00'))
+        deleted_request = LoanApplication.objects.create(borrower=self.bob, loan_amount=1000, terms_conditions='6 months')
+        kept_request = LoanApplication.objects.create(borrower=self.albert, loan_amount=1000, terms_conditions='6 months')
+        directory.soft_delete([self.bob.id, self.alan.id])
+
+        def approval(loan_request, lender=None):
+            data = {
+                'agreement_id': loan_request.application_id,
+                'interest_rate': '0.05',
+                'repayment_deadline': (date.today() + timedelta(days=180)).isoformat(),
+                'min_payment': '100.00',
+                'max_payment': '500.00',
+            }
+            if lender is not None:
+                data['lender'] = lender.id
+            return data
+
+        pending = self.client.get(reverse('loan-approves')).data['requests']
+        self.assertEqual([request['application_id'] for request in pending], [kept_request.application_id])
+        matches = self.client.get(reverse('loan-approves-match')).data['matches']
+        self.assertEqual([match['agreement_id'] for match in matches], [kept_request.application_id])
+
+        response = self.client.post(reverse('loan-approves'), approval(deleted_request), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(reverse('loan-approves'), approval(kept_request, self.alan), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(
+            reverse('loan-approves-bulk'), {'mode': 'per_item', 'approvals': [approval(deleted_request, self.alice)]}, format='json',
+        )
+        self.assertEqual(response.data['results'][0]['error'], 'Data not found')
+        self.assertFalse(LoanAgreement.objects.exists())
+        self.assertEqual(FundingAccount.objects.get(lender=self.alan).total_funds, Decimal('5000.00'))
+
+    def test_bulk_delete_validation(self):
+        url = reverse('users-bulk')
+        self.assertEqual(self.client.delete(url, {'ids': []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.delete(url, {'ids': ['x']}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(user=self.alice)
+        self.assertEqual(self.client.delete(url, {'ids': [self.bob.id]}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CreditScoreTests(APITestCase):
+    def setUp(self):
+        self.employee = User.objects.create_user(username='credit_employee', role=3)
+        self.lender = User.objects.create_user(username='credit_lender', role=1)
+        self.borrower = User.objects.create_user(username='credit_borrower', role=2)
+        self.newcomer = User.objects.create_user(username='credit_newcomer', role=2)
+        self.today = date.today()
+
+    def make_history(self):
+        deadline = self.today + timedelta(days=90)
+        self.paid = make_loan(
+            self.lender, self.borrower, '100.00', deadline, payments=['110.00'], total_paid=Decimal('110.00'), fully_paid=True
+        )
+        self.late = make_loan(
+            self.lender, self.borrower, '1000.00', deadline, payments=['100.00'], total_paid=Decimal('100.00'), delinquent=True
+        )
+        # Paid today, after a deadline that has passed
+        LoanAgreement.objects.filter(pk=self.late.pk).update(repayment_deadline=self.today - timedelta(days=1))
+        LoanApplication.objects.create(borrower=self.borrower, loan_amount=Decimal('50.00'), terms_conditions='t')
+
+    def test_features_and_scores(self):
+        self.make_history()
+        self.assertEqual(credit.score_borrowers([self.borrower.id, self.newcomer.id, self.lender.id]), 2)
+
+        score = CreditScore.objects.get(borrower=self.borrower)
+        self.assertEqual(
+            (score.applications, score.loans, score.paid_loans, score.open_loans, score.delinquent_loans,
+             score.payments, score.late_payments, score.exposure),
+            (3, 2, 1, 1, 1, 2, 1, Decimal('1000.00')),
+        )
+        # Half the payments on time, one paid, one open and one delinquent loan
+        self.assertEqual(score.score, 550 + 25 - 20 - 100)
+        self.assertEqual(CreditScore.objects.get(borrower=self.newcomer).score, 550)
+        self.assertFalse(CreditScore.objects.filter(borrower=self.lender).exists())
+
+    def test_archived_history_still_counts(self):
+        self.make_history()
+        credit.score_borrowers([self.borrower.id])
+        before = CreditScore.objects.values(*credit.FEATURES, 'exposure', 'score').get(borrower=self.borrower)
+
+        archive.archive_paid_loans(self.today + timedelta(days=400), after_days=365)
+        self.assertFalse(LoanAgreement.objects.filter(pk=self.paid.pk).exists())
+        credit.score_borrowers([self.borrower.id])
+        self.assertEqual(CreditScore.objects.values(*credit.FEATURES, 'exposure', 'score').get(borrower=self.borrower), before)
+
+    def test_pending_requests_come_with_scores_in_one_query(self):
+        self.make_history()
+        LoanApplication.objects.create(borrower=self.newcomer, loan_amount=Decimal('70.00'), terms_conditions='t')
+        self.client.force_authenticate(user=self.employee)
+        response = self.client.get(reverse('loan-approves'))
+        self.assertEqual([request['credit_score'] for request in response.data['requests']], [None, None])
+
+        call_command('score_borrowers', chunk_size=1, stdout=StringIO())
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('loan-approves'))
+        self.assertEqual(len(context.captured_queries), 1)
+        pending = response.data['requests']
+        self.assertEqual([request['credit_score'] for request in pending], [455, 550])
+        self.assertEqual(pending[0]['borrower_exposure'], '1000.00')
+        self.assertEqual((pending[0]['borrower_loans'], pending[0]['borrower_late_payments']), (2, 1))
+        self.assertIsNone(response.data['nextCursor'])
+
+        first = self.client.get(reverse('loan-approves'), {'page_size': 1}).data
+        self.assertEqual([request['credit_score'] for request in first['requests']], [455])
+        last = self.client.get(reverse('loan-approves'), {'page_size': 1, 'cursor': first['nextCursor']}).data
+        self.assertEqual([request['credit_score'] for request in last['requests']], [550])
+        self.assertEqual(self.client.get(reverse('loan-approves'), {'cursor': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def run_refreshes(self):
+        # Refreshes wait out RESCORE_DELAY first
+        Job.objects.update(run_at=now())
+        return jobs.Worker({'recalculations': 1}).run_once()
+
+    def test_payments_and_approvals_queue_a_refresh(self):
+        loan = make_loan(self.lender, self.borrower)
+        credit.score_borrowers([self.borrower.id])
+        self.client.force_authenticate(user=self.borrower)
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('loan-payments'), {'loan': loan.pk, 'payment_amount': '100.00'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The payments in quick succession share one refresh
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.payload), ('loans.credit.refresh', {'borrower_ids': [self.borrower.id]}))
+        self.assertEqual(jobs.Worker({'recalculations': 1}).run_once(), 0)
+        self.assertEqual(self.run_refreshes(), 1)
+        self.assertEqual(CreditScore.objects.get(borrower=self.borrower).payments, 3)
+
+        application = LoanApplication.objects.create(borrower=self.newcomer, loan_amount=Decimal('70.00'), terms_conditions='t')
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('1000.00'))
+        self.client.force_authenticate(user=self.employee)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('loan-approves'), {
+                'agreement_id': application.pk, 'lender': self.lender.pk, 'interest_rate': '0.1',
+                'repayment_deadline': (self.today + timedelta(days=90)).isoformat(), 'min_payment': '10', 'max_payment': '70',
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.run_refreshes(), 1)
+        self.assertEqual(CreditScore.objects.get(borrower=self.newcomer).loans, 1)
+
+
+class DashboardLoadTests(LiveServerTestCase):
+    def setUp(self):
+        password = 'load-password'
+        self.borrower = User.objects.create_user(username='load_borrower_0', password=password, role=2)
+        self.lender = User.objects.create_user(username='load_lender_0', password=password, role=1)
+        User.objects.create_user(username='load_employee', password=password, role=3)
+        FundingAccount.objects.create(lender=self.lender, total_funds=Decimal('100000.00'))
+        application = LoanApplication.objects.create(
+            borrower=self.borrower, loan_amount=Decimal('1000.00'), terms_conditions='t', approved=True
+        )
+        LoanAgreement.objects.create(
+            agreement_id=application, lender=self.lender, repayment_deadline=date.today() + timedelta(days=90),
+            interest_rate=Decimal('0.10'), min_payment=Decimal('10.10'), max_payment=Decimal('500.00'),
+        )
+        LoanApplication.objects.create(borrower=self.borrower, loan_amount=Decimal('2000.00'), terms_conditions='t')
+
+    def test_sessions_replay_the_dashboards(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'load.json')
+            # One worker: the in-memory test database fails concurrent writes
+            call_command(
+                'benchmark_dashboards', url=self.live_server_url, prefix='load', password='load-password',
+                workers=1, sessions=30, duration=60, write_share=1, output=path, stdout=StringIO(),
+            )
+            with open(path) as f:
+                report = json.load(f)
+
+        endpoints = report['endpoints']
+        self.assertEqual(endpoints['POST /api/token/']['requests'], 3)
+        for endpoint in ('GET /api/loan-requests/', 'GET /api/loan-payments/', 'GET /api/funds/', 'GET /api/loan-approves/'):
+            self.assertEqual(endpoints[endpoint]['status'], {'200': endpoints[endpoint]['requests']}, endpoint)
+        self.assertEqual(report['meta']['requests'], sum(endpoint['requests'] for endpoint in endpoints.values()))
+        self.assertTrue(all(endpoint['server_errors'] == endpoint['failed'] == 0 for endpoint in endpoints.values()))
+        self.assertTrue(LoanPayment.objects.filter(payment_amount=Decimal('10.10')).exists())
+
+    def test_invalid_mix_is_rejected(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_dashboards', mix='customer=1,auditor=1', stdout=StringIO())
+
+    def test_think_times_follow_the_seed(self):
+        from collections import Counter, defaultdict
+        import random
+        from loans.management.commands import benchmark_dashboards
+
+        command = benchmark_dashboards.Command()
+        command.think_time, command.timings, command.statuses, command.lock = 0.5, defaultdict(list), defaultdict(Counter), threading.Lock()
+        client = mock.Mock(request=mock.Mock(return_value=(200, None)))
+        sleeps = []
+        for _ in range(2):
+            with mock.patch.object(benchmark_dashboards.time, 'sleep') as sleep:
+                rng = random.Random(7)
+                for _ in range(3):
+                    command.call(client, rng, 'token', 'GET', '/api/funds/')
+            sleeps.append([call.args[0] for call in sleep.call_args_list])
+        self.assertEqual(sleeps[0], sleeps[1])
@@ -0,0 +1,158 @@
+"""
+Token-bucket request throttling.
+
+Every view has its own budget per role, looked up in THROTTLE_RATES by the
+view's throttle_scope or, by default, its URL name in loans/urls.py, falling
+back to the 'default' scope. A rate of 'N/period' is a bucket of N tokens
+refilled at N per period: a client can burst N requests and then sustains the
+rate. Authenticated requests draw from a bucket per user, anonymous ones from
+a bucket per client IP. The IP is DRF's get_ident(), which only trusts
+X-Forwarded-For as far as the NUM_PROXIES setting says, so a client cannot
+get a fresh bucket by sending a new header.
+
+A request costs one dictionary or cache lookup and a little arithmetic.
+Throttled requests get a 429 whose Retry-After header says when the next
+token arrives.
+
+The bucket store is chosen with the THROTTLE_BACKEND setting: 'local' keeps
+buckets in this process, so the limits apply per process, 'cache' keeps them
+in Django's default cache so they are shared by every process when that
+cache is (see CACHE_URL), and anything else is the dotted path of a store
+class.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+ROLES = {1: 'lender', 2: 'borrower', 3: 'employee'}
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+DEFAULT_RATES = {
+    'default': {'anon': '30/min', 'lender': '300/min', 'borrower': '300/min', 'employee': '600/min'},
+    # Every attempt runs the deliberately slow password hash
+    'token_obtain_pair': {'anon': '10/min'},
+    # Dashboards poll these
+    'loan-requests': {'lender': '120/min', 'borrower': '120/min', 'employee': '300/min'},
+    'loan-payments-bulk': {'borrower': '10/min'},
+    'loan-approves-bulk': {'employee': '60/min'},
+    'loans-export': {'lender': '10/hour', 'borrower': '10/hour', 'employee': '60/hour'},
+    'loan-payments-export': {'lender': '10/hour', 'borrower': '10/hour', 'employee': '60/hour'},
+}
+
+
+def parse_rate(rate):
+    """Turn 'N/period' into (bucket capacity, tokens refilled per second)."""
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def get_rate(scope, role):
+    """Return the parsed rate for `role` on `scope`; THROTTLE_RATES entries override DEFAULT_RATES."""
+    overrides = getattr(settings, 'THROTTLE_RATES', {})
+    for rates, name in ((overrides, scope), (DEFAULT_RATES, scope), (overrides, 'default'), (DEFAULT_RATES, 'default')):
+        if role in rates.get(name, {}):
+            rate = rates[name][role]
+            return parse_rate(rate) if rate else None
+    return None
+
+
+def take(state, capacity, refill, now):
+    """
+    Refill the bucket `state` (tokens, timestamp) up to `now` and take one
+    token. Returns the new state and how many seconds to wait, 0 if a token
+    was taken.
+    """
+    tokens, stamp = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * refill)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill
+
+
+class LocalBucketStore:
+    """Buckets in a dict of this process, evicting the least recently used past max_buckets."""
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def consume(self, key, capacity, refill, now):
+        with self._lock:
+            state, wait = take(self._buckets.pop(key, None), capacity, refill, now)
+            self._buckets[key] = state
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Buckets in a Django cache, shared by all processes using it if the cache
+    itself is shared; the default LocMemCache is per process.
+
+    A bucket is read and written back with two cache calls. Django's cache
+    API has no compare-and-set for the (tokens, timestamp) pair, so this is
+    a known race: requests of one client that reach different processes at
+    the same moment may each take the same token. A client can exceed its
+    budget by at most the number of its requests in flight at once, which
+    is harmless for rate limiting; the local store is exact.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill, now):
+        state, wait = take(self.cache.get(key), capacity, refill, now)
+        # A bucket left alone this long is full again and need not be kept
+        self.cache.set(key, state, math.ceil(capacity / refill) + 1)
+        return wait
+
+    def clear(self):
+        pass
+
+
+local_store = LocalBucketStore()
+
+
+def get_store():
+    backend = getattr(settings, 'THROTTLE_BACKEND', 'local')
+    if backend == 'local':
+        return local_store
+    if backend == 'cache':
+        return CacheBucketStore()
+    return import_string(backend)()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+
+        user = request.user
+        role = ROLES.get(getattr(user, 'role', None), 'anon') if user and user.is_authenticated else 'anon'
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            scope = request.resolver_match.url_name if request.resolver_match else type(view).__name__
+        rate = get_rate(scope, role)
+        if rate is None:
+            return True
+
+        ident = f'user:{user.id}' if role != 'anon' else f'ip:{self.get_ident(request)}'
+        self.wait_seconds = get_store().consume(f'loans:throttle:{scope}:{role}:{ident}', *rate, time.time())
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
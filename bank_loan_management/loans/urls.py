@@ -7,9 +7,21 @@ from .views import MyTokenObtainPairView
 urlpatterns = [
     path('token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('funds/',views.Get_and_Post_Funds.as_view(),name='funds'),
-    path('users/', views.Get_and_Delete_Users.as_view()),
+    path('portfolio/',views.Lender_Portfolio.as_view(),name='portfolio'),
+    path('users/', views.Get_and_Delete_Users.as_view(),name='users'),
+    path('users/bulk/', views.Bulk_Delete_Users.as_view(),name='users-bulk'),
     path('loan-requests/', views.Request_Loans.as_view(),name='loan-requests'),
     path('loan-approves/', views.Get_and_approve_loans.as_view(),name='loan-approves'),
-    path('loan-payments/', views.Get_and_Post_Payments.as_view(),name='loan-payments')
+    path('loan-approves/bulk/', views.Bulk_approve_loans.as_view(),name='loan-approves-bulk'),
+    path('loan-approves/match/', views.Match_Lenders.as_view(),name='loan-approves-match'),
+    path('loan-payments/', views.Get_and_Post_Payments.as_view(),name='loan-payments'),
+    path('loan-payments/bulk/', views.Bulk_Post_Payments.as_view(),name='loan-payments-bulk'),
+    path('loans/<int:agreement_id>/schedule/', views.Loan_Schedule.as_view(),name='loan-schedule'),
+    path('loans/<int:agreement_id>/history/', views.Loan_History.as_view(),name='loan-history'),
+    path('loans/archive/', views.Archived_Loans.as_view(),name='loans-archive'),
+    path('loans/schedule/', views.Portfolio_Schedules.as_view(),name='portfolio-schedule'),
+    path('loans/export/', views.Export_Data.as_view(dataset='agreements'),name='loans-export'),
+    path('loan-payments/export/', views.Export_Data.as_view(dataset='payments'),name='loan-payments-export'),
+    path('metrics', views.Metrics.as_view(),name='metrics'),
 ]
 
@@ -1,23 +1,33 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum
+from django.db import transaction
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
 from django.utils.timezone import make_aware,now
-from datetime import datetime
+from datetime import date, datetime
+import csv
 from .models import *
-from . import serializers
+from .authentication import StatelessJWTAuthentication
+from .throttling import TokenBucketThrottle
+from . import serializers, pagination, balances, bulk, funds, amortization, portfolio, rendering, exports, matching, metrics, archive, jobs, delinquency, directory, credit
+from .idempotency import idempotent
+from .routing import replica_reads
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = serializers.MyTokenObtainPairSerializer
+    throttle_classes = [TokenBucketThrottle]
 
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 class Get_and_Post_Funds(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
+    @idempotent
     def post(self, request):
         user = request.user
 
@@ -31,15 +41,16 @@ class Get_and_Post_Funds(APIView):
             
             if loan_budget <= Decimal('0.0'):
                 return Response({'error': 'Fund amount must be positive.'}, status=400)
-        except (ValueError, TypeError, Decimal.InvalidOperation):
+        except (ValueError, TypeError, InvalidOperation):
             return Response({"error": "Invalid budget format"}, status=400)
 
-        fund, created = FundingAccount.objects.get_or_create(lender=user)
-        fund.total_funds += loan_budget
-        fund.save()
+        with transaction.atomic():
+            funds.credit(user.id, loan_budget)
+            fund = FundingAccount.objects.get(lender=user)
         serializer = serializers.FundSerializer(fund)
         return Response(serializer.data)
 
+    @replica_reads
     def get(self, request):
         user = request.user
 
@@ -49,25 +60,38 @@ class Get_and_Post_Funds(APIView):
             loans = LoanAgreement.objects.filter(lender_id=user)
             fund = FundingAccount.objects.get(lender=user)
             fund_serializer = serializers.FundSerializer(fund)
-            loan_serializer = serializers.LoanSerializer(loans, many=True)
-            return Response({'fund': fund_serializer.data, 'loans': loan_serializer.data}, status=200)
+            loans = serializers.LOAN_ENCODER.encode_queryset(loans)
+            return rendering.EncodedResponse({'fund': fund_serializer.data, 'loans': loans}, status=200)
         if user.role ==3:
-            loans = LoanAgreement.objects
+            loans = LoanAgreement.objects.all()
             fund = FundingAccount.objects.get()
             fund_serializer = serializers.FundSerializer(fund)
-            loan_serializer = serializers.LoanSerializer(loans, many=True)
-            return Response({'fund': fund_serializer.data, 'loans': loan_serializer.data}, status=200)
+            loans = serializers.LOAN_ENCODER.encode_queryset(loans)
+            return rendering.EncodedResponse({'fund': fund_serializer.data, 'loans': loans}, status=200)
 
 class Get_and_Delete_Users(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
+    @replica_reads
     def get(self, request):
         if request.user.role != 3:  # Assuming 3 is the role for Employees
             return Response({'error': 'Only employees can get all users'}, status=403)
-        users = User.objects.all()
-        serializer = serializers.BankUserSerializer(users, many=True)
-        return Response(serializer.data, status=200)
+
+        page_size = pagination.get_page_size(request)
+        try:
+            cursor = pagination.get_cursor(request, 'cursor')
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+        role = request.query_params.get('role')
+        if role not in (None, '') and role not in {str(value) for value in User.UserRole.values}:
+            return Response({'error': 'Invalid role'}, status=400)
+
+        encoder = serializers.BANK_USER_ENCODER
+        users = directory.search(request.query_params.get('search', ''), int(role) if role else None)
+        users, next_cursor = pagination.keyset_page(users.values_list(*encoder.columns), 'id', cursor, page_size)
+        return rendering.EncodedResponse({'users': encoder.encode_rows(users), 'nextCursor': next_cursor}, status=200)
 
     def delete(self, request):
         if request.user.role != 3:  # Assuming 3 is the role for Employees
@@ -78,31 +102,73 @@ class Get_and_Delete_Users(APIView):
             return Response({'error': 'User ID is required'}, status=400)
 
         try:
-            user = User.objects.get(id=user_id)
+            user = User.objects.get(id=user_id, deleted_at__isnull=True)
             if user.is_superuser:
                 return Response({'error': 'Cannot delete admin users'}, status=400)
-            user.delete()
+            directory.soft_delete([user.id])
             return Response({'message': 'User deleted successfully'}, status=200)
-        except User.DoesNotExist:
+        except (User.DoesNotExist, ValueError):
             return Response({'error': 'User not found'}, status=404)
+
+
+class Bulk_Delete_Users(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+
+    def delete(self, request):
+        if request.user.role != 3:
+            return Response({'error': 'Only employees can delete users'}, status=403)
+
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or not all(isinstance(user_id, int) for user_id in ids):
+            return Response({'error': 'ids must be a non-empty list of user IDs'}, status=400)
+        if len(ids) > directory.MAX_BULK_USERS:
+            return Response({'error': f'At most {directory.MAX_BULK_USERS} users per request'}, status=400)
+
+        deleted = directory.soft_delete(ids)
+        # Their loans and payments are purged by a background job
+        return Response({'deleted': deleted, 'skipped': sorted(set(ids) - set(deleted))}, status=202)
     
 
 class Request_Loans(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
+    @replica_reads
     def get(self, request):
 
         user = request.user
-        if request.user.role == 2:  
+        if request.user.role == 2:
             loan_requests = LoanApplication.objects.filter(borrower_id=user , approved=False)
             loans = LoanAgreement.objects.filter(agreement_id__borrower_id=user)
-        
-        loan_requests = LoanApplication.objects
-        loans = LoanAgreement.objects
-        loan_request_serializer = serializers.LoanRequestSerializer(loan_requests, many=True)
-        loan_serializer = serializers.LoanSerializer(loans, many=True)
-        return Response({'loanRequests': loan_request_serializer.data, 'loans': loan_serializer.data}, status=200)
+        else:
+            # Requests of soft-deleted borrowers wait for purge_users and can no longer be approved
+            loan_requests = LoanApplication.objects.filter(borrower__deleted_at__isnull=True)
+            loans = LoanAgreement.objects.all()
+
+        page_size = pagination.get_page_size(request)
+        try:
+            requests_cursor = pagination.get_cursor(request, 'requests_cursor')
+            loans_cursor = pagination.get_cursor(request, 'loans_cursor')
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+
+        loan_request_encoder = serializers.LOAN_REQUEST_ENCODER
+        loan_encoder = serializers.LOAN_ENCODER
+        loan_requests, next_requests_cursor = pagination.keyset_page(
+            loan_requests.values_list(*loan_request_encoder.columns), 'application_id', requests_cursor, page_size
+        )
+        loans, next_loans_cursor = pagination.keyset_page(
+            loans.values_list(*loan_encoder.columns), 'agreement_id', loans_cursor, page_size
+        )
+        return rendering.EncodedResponse({
+            'loanRequests': loan_request_encoder.encode_rows(loan_requests),
+            'loans': loan_encoder.encode_rows(loans),
+            'nextRequestsCursor': next_requests_cursor,
+            'nextLoansCursor': next_loans_cursor,
+        }, status=200)
 
     def post(self, request):
         if request.user.role != 2:  
@@ -117,7 +183,9 @@ class Request_Loans(APIView):
         except (KeyError, ValueError):
             return Response({'error': 'Invalid data'}, status=400)
 
-        loan_request = LoanApplication.objects.create(borrower=user, loan_amount=loan_amount, terms_conditions=terms_conditions)
+        with transaction.atomic():
+            loan_request = LoanApplication.objects.create(borrower=user, loan_amount=loan_amount, terms_conditions=terms_conditions)
+            credit.rescore(user.id)
         serializer = serializers.LoanRequestSerializer(loan_request)
         return Response(serializer.data, status=200)
 
@@ -136,15 +204,27 @@ class Request_Loans(APIView):
             return Response({'error': 'Loan request not found'}, status=404)
 
 class Get_and_approve_loans(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
+    @replica_reads
     def get(self, request):
         if request.user.role != 3:  # Assuming 3 is the role for Employees
             return Response({'error': 'Only employees can approve loans'}, status=403)
-        loan_requests = LoanApplication.objects.filter(approved=False)
-        serializer = serializers.LoanRequestSerializer(loan_requests, many=True)
-        return Response(serializer.data, status=200)
+        page_size = pagination.get_page_size(request)
+        try:
+            cursor = pagination.get_cursor(request, 'cursor')
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+
+        # The borrowers' scores come with the requests in the same query
+        encoder = serializers.PENDING_REQUEST_ENCODER
+        loan_requests = credit.with_scores(LoanApplication.objects.filter(approved=False, borrower__deleted_at__isnull=True))
+        loan_requests, next_cursor = pagination.keyset_page(
+            loan_requests.values_list(*encoder.columns), 'application_id', cursor, page_size
+        )
+        return rendering.EncodedResponse({'requests': encoder.encode_rows(loan_requests), 'nextCursor': next_cursor}, status=200)
 
     def post(self, request):
         if request.user.role != 3:  # Assuming 3 is the role for Employees
@@ -164,7 +244,7 @@ class Get_and_approve_loans(APIView):
             if repayment_deadline < now():
                 return Response({'error': 'Deadline cannot be in the past'}, status=400)
 
-            lender_id = data['lender']
+            lender_id = data.get('lender')  # Matched automatically when omitted
             min_payment = float(data['min_payment'])
             max_payment = float(data['max_payment'])
 
@@ -172,52 +252,84 @@ class Get_and_approve_loans(APIView):
             return Response({'error': 'Invalid data format or missing data'}, status=400)
 
         try:
-            loan_request = LoanApplication.objects.get(application_id=agreement_id)
-            lender = User.objects.get(id=lender_id, role=1)  # Assuming role 1 is for Lender
-            funding_account = FundingAccount.objects.get(lender=lender)
+            # Soft-deleted users are purged later; their requests are gone already
+            loan_request = LoanApplication.objects.get(application_id=agreement_id, borrower__deleted_at__isnull=True)
 
             if min_payment <= 0 or max_payment > loan_request.loan_amount:
                 return Response({'error': 'Invalid minimum or maximum payment'}, status=400)
             if max_payment <= min_payment or max_payment > loan_request.loan_amount:
                 return Response({'error': 'Invalid maximum payment'}, status=400)
-            if funding_account.total_funds < loan_request.loan_amount:
-                return Response({'error': 'Insufficient budget'}, status=400)
 
-        except (LoanApplication.DoesNotExist, User.DoesNotExist, FundingAccount.DoesNotExist):
+        except LoanApplication.DoesNotExist:
             return Response({'error': 'Data not found'}, status=404)
 
+        # Approve the loan request and debit the funding account in one transaction.
+        # Both updates are conditional, so concurrent approvals cannot approve the
+        # same request twice or overdraw the lender.
+        with transaction.atomic():
+            pending = LoanApplication.objects.filter(application_id=agreement_id, approved=False, borrower__deleted_at__isnull=True)
+            if not pending.update(approved=True):
+                return Response({'error': 'Request was already approved'}, status=400)
+            if lender_id is None:
+                lender_id = funds.debit_best_match(loan_request.loan_amount)
+                if lender_id is None:
+                    transaction.set_rollback(True)
+                    return Response({'error': 'No lender with enough funds'}, status=400)
+            elif not funds.debit(lender_id, loan_request.loan_amount):
+                # The debit checks the lender too; this read only picks the message
+                found = FundingAccount.objects.filter(lender_id=lender_id, lender__role=1, lender__deleted_at__isnull=True).exists()
+                transaction.set_rollback(True)
+                if not found:
+                    return Response({'error': 'Data not found'}, status=404)
+                return Response({'error': 'Insufficient budget'}, status=400)
 
+            # Create the Loan Agreement
+            loan_agreement = LoanAgreement.objects.create(
+                agreement_id=loan_request,
+                lender_id=lender_id,
+                repayment_deadline=repayment_deadline.date(),
+                interest_rate=interest_rate,
+                min_payment=min_payment,
+                max_payment=max_payment
+            )
+            credit.rescore(loan_request.borrower_id)
 
-        # Approve the loan request and update the funding account
-        loan_request.approved = True
-        loan_request.save()
-        funding_account.total_funds -= loan_request.loan_amount
-        funding_account.save()
+        serializer = serializers.LoanSerializer(loan_agreement)
+        return Response(serializer.data, status=201)
+class Match_Lenders(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
-        # Create the Loan Agreement
-        loan_agreement = LoanAgreement.objects.create(
-            agreement_id=loan_request,
-            lender=lender,
-            repayment_deadline=repayment_deadline.date(),
-            interest_rate=interest_rate,
-            min_payment=min_payment,
-            max_payment=max_payment
+    def get(self, request):
+        if request.user.role != 3:  # Assuming 3 is the role for Employees
+            return Response({'error': 'Only employees can approve loans'}, status=403)
+        pending = list(
+            LoanApplication.objects.filter(approved=False, borrower__deleted_at__isnull=True)
+            .order_by('application_id').values_list('application_id', 'loan_amount')
         )
+        lenders = matching.index.plan(loan_amount for _, loan_amount in pending)
+        matches = [
+            {'agreement_id': application_id, 'loan_amount': f'{loan_amount:f}', 'lender': lender_id}
+            for (application_id, loan_amount), lender_id in zip(pending, lenders)
+        ]
+        unmatched = sum(1 for lender_id in lenders if lender_id is None)
+        return Response({'matched': len(matches) - unmatched, 'unmatched': unmatched, 'matches': matches}, status=200)
 
-        serializer = serializers.LoanSerializer(loan_agreement)
-        return Response(serializer.data, status=201)
 class Get_and_Post_Payments(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
+    @replica_reads
     def get(self, request):
         
         user = request.user
         loans = LoanAgreement.objects.filter(agreement_id__borrower_id=user)
         payments = LoanPayment.objects.filter(loan__in=loans)
-        serializer = serializers.PaymentSerializer(payments, many=True)
-        return Response(serializer.data, status=200)
+        return rendering.EncodedResponse(serializers.PAYMENT_ENCODER.encode_queryset(payments), status=200)
 
+    @idempotent
     def post(self, request):
         user = request.user
         data = request.data
@@ -230,28 +342,221 @@ class Get_and_Post_Payments(APIView):
         except (KeyError, ValueError):
             return Response({'error': 'Invalid data format or missing data'}, status=400)
 
+        with transaction.atomic():
+            try:
+                loan = LoanAgreement.objects.select_for_update(of=('self',)).select_related('agreement_id').get(agreement_id_id=loan_id)
+                if loan.agreement_id.borrower_id != user.id:
+                    return Response({'error': 'Unauthorized loan access'}, status=403)
+            except LoanAgreement.DoesNotExist:
+                return Response({'error': 'Loan not found'}, status=404)
+
+            if not (loan.min_payment <= payment_amount <= loan.max_payment):
+                return Response({'error': 'Payment must be within the allowed range'}, status=400)
+
+            if loan.total_paid + payment_amount > loan.total_due:
+                return Response({'error': 'Payment exceeds the due amount'}, status=400)
+
+            payment = LoanPayment.objects.create(loan=loan, payment_amount=payment_amount)
+            balances.record_payment(loan, payment_amount)
+            if loan.delinquent:
+                # The payment may have caught the loan up; no need to wait for the nightly scan
+                jobs.enqueue(delinquency.rescan, agreement_ids=[loan.pk])
+            credit.rescore(user.id)
+
+        serializer = serializers.PaymentSerializer(payment)
+        return Response(serializer.data, status=200)
+
+class Bulk_Post_Payments(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+
+    def post(self, request):
+        # As with single payments, only the borrower may pay a loan
+        if request.user.role != 2:
+            return Response({'error': 'Only customers can post payments'}, status=403)
+
         try:
-            loan = LoanAgreement.objects.get(agreement_id_id=loan_id)
-            if loan.agreement_id.borrower != user:
-                return Response({'error': 'Unauthorized loan access'}, status=403)
-        except LoanAgreement.DoesNotExist:
+            rows = bulk.read_payment_rows(request)
+        except (ValueError, UnicodeDecodeError, csv.Error):
+            return Response({'error': 'Invalid data format or missing data'}, status=400)
+        if not rows:
+            return Response({'error': 'No payments supplied'}, status=400)
+        if len(rows) > bulk.MAX_BULK_ROWS:
+            return Response({'error': f'At most {bulk.MAX_BULK_ROWS} payments per request'}, status=400)
+
+        report = bulk.ingest_payments(rows, request.user)
+        accepted = sum(1 for entry in report if entry['status'] == 'accepted')
+        return Response({'accepted': accepted, 'rejected': len(report) - accepted, 'results': report}, status=200)
+
+class Bulk_approve_loans(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+
+    def post(self, request):
+        if request.user.role != 3:  # Assuming 3 is the role for Employees
+            return Response({'error': 'Only employees can approve loans'}, status=403)
+
+        items = request.data.get('approvals') if isinstance(request.data, dict) else None
+        mode = request.data.get('mode', 'all_or_nothing') if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Invalid data format or missing data'}, status=400)
+        if mode not in ('all_or_nothing', 'per_item'):
+            return Response({'error': "Mode must be 'all_or_nothing' or 'per_item'"}, status=400)
+        if len(items) > bulk.MAX_BULK_ROWS:
+            return Response({'error': f'At most {bulk.MAX_BULK_ROWS} approvals per request'}, status=400)
+
+        report, applied = bulk.approve_loans(items, all_or_nothing=(mode == 'all_or_nothing'))
+        approved = sum(1 for entry in report if entry['status'] == 'approved')
+        rejected = sum(1 for entry in report if entry['status'] == 'rejected')
+        body = {'approved': approved, 'rejected': rejected, 'results': report}
+        if mode == 'all_or_nothing' and rejected:
+            return Response(body, status=400)
+        return Response(body, status=201 if applied else 200)
+
+class Loan_Schedule(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+
+    def get(self, request, agreement_id):
+        user = request.user
+        loan = LoanAgreement.objects.filter(agreement_id=agreement_id).values('lender_id', 'agreement_id__borrower_id').first()
+        if loan is None:
             return Response({'error': 'Loan not found'}, status=404)
+        if user.role != 3 and user.id not in (loan['lender_id'], loan['agreement_id__borrower_id']):
+            return Response({'error': 'Unauthorized loan access'}, status=403)
+        return Response(amortization.build_schedule(agreement_id), status=200)
 
-    
+class Portfolio_Schedules(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+
+    def get(self, request):
+        user = request.user
+        if user.role == 1:
+            lender_id = user.id
+        elif user.role == 3:
+            lender_id = request.query_params.get('lender')
+            if not lender_id:
+                return Response({'error': 'Lender ID is required'}, status=400)
+        else:
+            return Response({'error': 'You are not authorized to view this information.'}, status=403)
+
+        try:
+            loans = LoanAgreement.objects.filter(lender_id=int(lender_id))
+        except ValueError:
+            return Response({'error': 'Invalid lender ID'}, status=400)
+        # Streamed like the exports, so a large portfolio is never held in memory
+        return StreamingHttpResponse(
+            amortization.stream_schedules(loans, lender=int(lender_id)), content_type='application/json'
+        )
+
+class Lender_Portfolio(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
-        if not (loan.min_payment <= payment_amount <= loan.max_payment):
-            return Response({'error': 'Payment must be within the allowed range'}, status=400)
+    def get(self, request):
+        user = request.user
+        if user.role == 1:
+            lender_id = user.id
+        elif user.role == 3:
+            try:
+                lender_id = int(request.query_params['lender'])
+            except KeyError:
+                return Response({'error': 'Lender ID is required'}, status=400)
+            except ValueError:
+                return Response({'error': 'Invalid lender ID'}, status=400)
+        else:
+            return Response({'error': 'You are not authorized to view this information.'}, status=403)
+
+        return Response(portfolio.get_summary(lender_id), status=200)
 
-        total_payments = LoanPayment.objects.filter(loan=loan).aggregate(Sum('payment_amount'))['payment_amount__sum'] or 0
-        total_due = loan.agreement_id.loan_amount * (1 + loan.interest_rate)
-        new_total = (total_payments) + (payment_amount)
+class Archived_Loans(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
 
-        if new_total > total_due:
-            return Response({'error': 'Payment exceeds the due amount'}, status=400)
-        elif new_total == total_due:
+    def get(self, request):
+        page_size = pagination.get_page_size(request)
+        try:
+            cursor = pagination.get_cursor(request, 'cursor')
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
 
-            loan.save()
+        encoder = serializers.ARCHIVED_LOAN_ENCODER
+        loans, next_cursor = pagination.keyset_page(
+            archive.agreements_for(request.user).values_list(*encoder.columns), 'agreement_id', cursor, page_size
+        )
+        return rendering.EncodedResponse({'loans': encoder.encode_rows(loans), 'nextCursor': next_cursor}, status=200)
 
-        payment = LoanPayment.objects.create(loan=loan, payment_amount=payment_amount)
-        serializer = serializers.PaymentSerializer(payment)
-        return Response(serializer.data, status=200)
+class Loan_History(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+
+    def get(self, request, agreement_id):
+        user = request.user
+        history = archive.history(agreement_id)
+        if history is None:
+            return Response({'error': 'Loan not found'}, status=404)
+        if user.role != 3 and user.id not in (history.lender_id, history.borrower_id):
+            return Response({'error': 'Unauthorized loan access'}, status=403)
+
+        if history.archived:
+            loan = serializers.ArchivedLoanSerializer(history.agreement).data
+            payments = serializers.ARCHIVED_PAYMENT_ENCODER.encode_queryset(history.payments)
+        else:
+            loan = serializers.LoanSerializer(history.agreement).data
+            payments = serializers.PAYMENT_ENCODER.encode_queryset(history.payments)
+        return rendering.EncodedResponse({'archived': history.archived, 'loan': loan, 'payments': payments}, status=200)
+
+class Export_Data(APIView):
+    authentication_classes = [StatelessJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    dataset = None
+
+    def get(self, request):
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in exports.FORMATS:
+            return Response({'error': f"Export type must be one of: {', '.join(exports.FORMATS)}"}, status=400)
+        compress = request.query_params.get('compress')
+        if compress not in (None, 'gzip'):
+            return Response({'error': 'Only gzip compression is supported'}, status=400)
+        try:
+            start = request.query_params.get('from')
+            end = request.query_params.get('to')
+            start = date.fromisoformat(start) if start else None
+            end = date.fromisoformat(end) if end else None
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
+
+        encoder, rows = exports.export_rows(self.dataset, request.user, start, end)
+        filename = f'{self.dataset}.{file_format}'
+        content_type = exports.FORMATS[file_format]
+        if compress:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(
+            exports.stream(encoder, rows, file_format, compress=bool(compress)), content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class Metrics(APIView):
+    # Scraped by Prometheus, which sends METRICS_TOKEN as a bearer token; without one nobody may read them
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = [TokenBucketThrottle]
+
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if not token:
+            return Response({'error': 'Metrics are disabled; set METRICS_TOKEN'}, status=403)
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response({'error': 'Invalid metrics token'}, status=401)
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)